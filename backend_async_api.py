@@ -0,0 +1,405 @@
+"""
+ASGI serving mode for the Manna AI backend.
+
+Same routes and JSON contracts as backend_real_api.py, but the LLM-bound routes
+await the Gemini client instead of holding a worker thread, so one process can
+keep hundreds of generations in flight. Run it with:
+
+    gunicorn backend_async_api:app -k uvicorn.workers.UvicornWorker
+
+The sync Flask app (gunicorn backend_real_api:app) stays available as the fallback.
+"""
+import os
+import asyncio
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette import responses
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import backend_real_api as api
+import batch_jobs
+import fridge_scan
+import meal_plan
+from inventory_matcher import recipes_from_payload
+from inventory_store import InventoryConflict, InvalidVersion
+from json_stream import IncrementalJSONParser, sse_event, recipe_sse_events, cached_recipe_sse
+import telemetry
+from telemetry import TraceMiddleware
+from traffic_recorder import RecorderMiddleware
+import http_payload
+from http_payload import PayloadMiddleware
+
+class JSONResponse(responses.JSONResponse):
+    """Same compact JSON as the Flask app, through http_payload (orjson when installed)."""
+
+    def render(self, content):
+        return http_payload.dumps(content)
+
+async def traced_generate(prompt, lane, **kwargs):
+    """Async twin of api.traced_generate."""
+    telemetry.record_prompt(prompt)
+    with telemetry.span('model'):
+        response = await api.LLM.generate_async(prompt, lane=lane, **kwargs)
+    telemetry.record_usage(response)
+    return response
+
+async def validated_recipe(data, recipe, prompt):
+    """Async twin of api.validated_recipe: local repair first, one targeted re-call if that can't fix it."""
+    validator = api.recipe_validator(data)
+    with telemetry.span('validate'):
+        check = validator.check(recipe)
+    if not check.ok:
+        try:
+            response = await traced_generate(validator.fix_prompt(check) or prompt, 'interactive')
+            with telemetry.span('validate'):
+                check = validator.recheck(check, api.parse_recipe(response.text))
+        except Exception as e:
+            print(f"Recipe Re-call Error (keeping the local repair): {e}")
+    api.VALIDATION.record(check)
+    return check
+
+# --- 1. ROUTES ---
+async def home(request):
+    return PlainTextResponse("Manna AI Server is Online!")
+
+async def ready(request):
+    return JSONResponse({**api.STARTUP, "pid": os.getpid()}, status_code=200 if api.STARTUP["ready"] else 503)
+
+async def cache_stats(request):
+    return JSONResponse({**api.RESPONSE_CACHE.stats(), "reuse": api.RECIPE_REUSE.stats()})
+
+async def scheduler_stats(request):
+    return JSONResponse({**api.LLM.stats(), "providers": api.provider_stats()})
+
+async def validation_stats(request):
+    return JSONResponse(api.VALIDATION.stats())
+
+async def metrics(request):
+    return Response(telemetry.METRICS.render(), headers={'Content-Type': telemetry.CONTENT_TYPE})
+
+async def generate_recipes(request):
+    try:
+        data = await asyncio.to_thread(api.with_stored_inventory, await request.json())
+        cache_key = api.recipe_cache_key(data)
+        cached = await asyncio.to_thread(api.lookup_recipe, data, cache_key)
+        if cached is not None:
+            return JSONResponse(cached)
+
+        with telemetry.span('prompt_build'):
+            prompt = api.build_recipe_prompt(data)
+        response = await traced_generate(prompt, 'interactive')
+        with telemetry.span('parse'):
+            recipe = api.parse_recipe(response.text)
+        check = await validated_recipe(data, recipe, prompt)
+
+        if check.ok:
+            await asyncio.to_thread(api.remember_recipe, data, cache_key, check.value)
+        return JSONResponse(check.value)
+
+    except Exception as e:
+        print(f"Error in Recipe Generation: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def stream_recipes(request):
+    """SSE variant of /api/recipes; same events as the Flask app."""
+    data = await asyncio.to_thread(api.with_stored_inventory, await request.json())
+    cache_key = api.recipe_cache_key(data)
+    cached = await asyncio.to_thread(api.lookup_recipe, data, cache_key)
+    with telemetry.span('prompt_build'):
+        prompt = api.build_recipe_prompt(data) if cached is None else None
+    trace = telemetry.current_trace()
+
+    async def generate():
+        if cached is not None:
+            for event in cached_recipe_sse(cached):
+                yield event
+            return
+        try:
+            parser = IncrementalJSONParser()
+            telemetry.record_prompt(prompt, trace)
+            chunk = None
+            with telemetry.span('model'):
+                response = await api.LLM.generate_async(prompt, lane='interactive', stream=True)
+                async for chunk in response:
+                    for event in recipe_sse_events(parser.feed(chunk.text)):
+                        yield event
+            telemetry.record_usage(chunk, trace)
+
+            check = await asyncio.to_thread(api.validated_recipe, data, parser.finish())
+            if check.ok and parser.done:
+                await asyncio.to_thread(api.remember_recipe, data, cache_key, check.value)
+            yield sse_event("done", check.value)
+        except Exception as e:
+            print(f"Error in Recipe Stream: {e}")
+            yield sse_event("error", {"error": str(e)})
+
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+async def generate_plan_windows(jobs):
+    responses = await asyncio.gather(*(api.LLM.generate_async(job[2], lane='background') for job in jobs))
+    for job, response in zip(jobs, responses):
+        telemetry.record_prompt(job[2])
+        telemetry.record_usage(response)
+    return [response.text for response in responses]
+
+def query_day(request):
+    """?day= the way Flask's request.args.get('day', type=int) reads it: a non-number is ignored."""
+    try:
+        return int(request.query_params['day'])
+    except (KeyError, ValueError):
+        return None
+
+async def generate_plan(request):
+    try:
+        day = query_day(request)
+        data = await asyncio.to_thread(api.with_stored_inventory, await request.json())
+        plan_id = api.plan_cache_key(data)
+        plan = await asyncio.to_thread(api.RESPONSE_CACHE.get, plan_id)
+
+        if plan is None:
+            with telemetry.span('prompt_build'):
+                jobs = await asyncio.to_thread(api.build_plan_prompts, data)
+            with telemetry.span('model'):
+                texts = await generate_plan_windows(jobs)
+            with telemetry.span('parse'):
+                windows = await asyncio.to_thread(api.parse_plan_windows, jobs, texts)
+            retry = api.windows_to_retry(jobs, windows)
+            if retry:
+                retry_jobs = [jobs[pos] for pos in retry]
+                with telemetry.span('model'):
+                    texts = await generate_plan_windows(retry_jobs)
+                with telemetry.span('parse'):
+                    for pos, days in zip(retry, await asyncio.to_thread(api.parse_plan_windows, retry_jobs, texts)):
+                        windows[pos] = days
+            plan = api.assemble_plan(plan_id, data, jobs, windows)
+            await asyncio.to_thread(api.RESPONSE_CACHE.set, plan_id, plan, ttl=api.PLAN_CACHE_TTL)
+
+        result = meal_plan.page(plan, day)
+        if result is None:
+            return JSONResponse({"error": "Day not in plan"}, status_code=404)
+        return JSONResponse(result)
+
+    except meal_plan.IncompletePlan as e:
+        print(f"Meal Plan Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=502)
+    except Exception as e:
+        print(f"Meal Plan Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def get_plan(request):
+    day = query_day(request)
+    plan = await asyncio.to_thread(api.RESPONSE_CACHE.get, request.path_params['plan_id'])
+    if plan is None:
+        return JSONResponse({"error": "Plan not found or expired"}, status_code=404)
+    result = meal_plan.page(plan, day)
+    if result is None:
+        return JSONResponse({"error": "Day not in plan"}, status_code=404)
+    return JSONResponse(result)
+
+async def generate_shopping_list(request):
+    """Same modes as the Flask route: 'llm' (default, solver fallback), 'hybrid' and 'fast'."""
+    try:
+        data = await request.json()
+        cache_key = api.shop_cache_key(data)
+        cached = await asyncio.to_thread(api.RESPONSE_CACHE.get, cache_key)
+        if cached is not None:
+            return JSONResponse(cached)
+
+        loop = asyncio.get_running_loop()
+
+        def generate(prompt, **kwargs):
+            # api.make_shopping_list runs in a worker thread; its model calls still go through the async client here
+            return asyncio.run_coroutine_threadsafe(traced_generate(prompt, 'background', **kwargs), loop).result().text
+
+        items, cacheable = await asyncio.to_thread(api.make_shopping_list, data, generate)
+        if items and cacheable:
+            await asyncio.to_thread(api.RESPONSE_CACHE.set, cache_key, items, ttl=api.SHOP_CACHE_TTL)
+        return JSONResponse(items)
+
+    except Exception as e:
+        print(f"Shopping List Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def get_rations(request):
+    try:
+        data = await asyncio.to_thread(api.with_stored_inventory, await request.json())
+        return JSONResponse(await asyncio.to_thread(api.ration_plan, data))
+    except Exception as e:
+        print(f"Rations Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def score_recipes_nutrition(request):
+    try:
+        return JSONResponse(api.score_nutrition(await request.json()))
+    except Exception as e:
+        print(f"Nutrition Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def scan_photo(raw):
+    # Decoding and resizing is CPU work; keep it off the event loop
+    photo, items = await asyncio.to_thread(api.prepare_scan, raw)
+    cached = items is not None
+    if not cached:
+        response = await traced_generate(fridge_scan.build_scan_prompt(api.MASTER_INDEX, photo.jpeg), 'interactive')
+        items = api.finish_scan(photo, response.text)
+    return photo, items, cached
+
+async def scan_fridge(request):
+    """Same contract as the Flask /api/scan: multipart 'photos'/'photo' or JSON 'images' (base64)."""
+    try:
+        if request.headers.get('content-type', '').startswith('multipart/'):
+            form = await request.form()
+            photos = [await upload.read() for upload in form.getlist('photos') + form.getlist('photo')]
+        else:
+            photos = api.decode_images(await request.json())
+        if not photos:
+            return JSONResponse({"error": "No photos uploaded"}, status_code=400)
+        if len(photos) > fridge_scan.SCAN_MAX_PHOTOS:
+            return JSONResponse({"error": f"At most {fridge_scan.SCAN_MAX_PHOTOS} photos per scan"}, status_code=400)
+
+        results = await asyncio.gather(*(scan_photo(raw) for raw in photos))
+        return JSONResponse(api.assemble_scan(results))
+
+    except (fridge_scan.UnreadablePhoto, ValueError) as e:
+        return JSONResponse({"error": f"Unreadable photo: {e}"}, status_code=400)
+    except Exception as e:
+        print(f"Fridge Scan Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def update_inventory(request):
+    try:
+        data = await request.json()
+        if data.get('userId') and 'inventory' not in data:
+            expected = api.inventory_version(request.headers.get('if-match'), data)
+            result = await asyncio.to_thread(api.cook_stored, str(data['userId']), recipes_from_payload(data), expected)
+            return JSONResponse(result)
+        result = api.apply_cooked_recipes(data.get('inventory', []), recipes_from_payload(data))
+        return JSONResponse(result)
+    except InventoryConflict as e:
+        return JSONResponse({"error": str(e), "version": e.version}, status_code=412)
+    except InvalidVersion as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        print(f"Inventory Update Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def get_inventory(request):
+    version, items = await asyncio.to_thread(api.INVENTORY_STORE.load, request.path_params['user_id'])
+    return JSONResponse({"version": version, "items": items}, headers={'ETag': f'"{version}"'})
+
+async def put_inventory(request):
+    try:
+        data = await request.json()
+        expected = api.inventory_version(request.headers.get('if-match'), data)
+        version, changes = await asyncio.to_thread(
+            api.INVENTORY_STORE.replace, request.path_params['user_id'],
+            data.get('items', data.get('inventory', [])), expected)
+        return JSONResponse({"version": version, "changes": changes})
+    except InventoryConflict as e:
+        return JSONResponse({"error": str(e), "version": e.version}, status_code=412)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+async def inventory_delta(request):
+    try:
+        data = await request.json()
+        expected = api.inventory_version(request.headers.get('if-match'), data)
+        version, changes = await asyncio.to_thread(
+            api.INVENTORY_STORE.apply, request.path_params['user_id'], data.get('ops', []), expected)
+        return JSONResponse({"version": version, "changes": changes})
+    except InventoryConflict as e:
+        return JSONResponse({"error": str(e), "version": e.version}, status_code=412)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+async def inventory_changes(request):
+    since = int(request.query_params.get('since') or 0)
+    version, changes = await asyncio.to_thread(api.INVENTORY_STORE.changes_since, request.path_params['user_id'], since)
+    return JSONResponse({"version": version, "changes": changes})
+
+async def submit_batch_job(request):
+    """Same contract as the Flask /api/batch: 202 with the job ID, generations run on the batch pool."""
+    try:
+        # Stored pantries are loaded from SQLite while the batch is grouped: off the event loop
+        return JSONResponse(await asyncio.to_thread(api.submit_batch, await request.json()), status_code=202)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        print(f"Batch Submit Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+async def get_batch_job(request):
+    page = api.BATCH.poll(request.path_params['job_id'], int(request.query_params.get('since') or 0))
+    if page is None:
+        return JSONResponse({"error": "Batch job not found or expired"}, status_code=404)
+    return JSONResponse(page)
+
+# How often a batch stream looks for new results (it never blocks the loop waiting)
+BATCH_STREAM_INTERVAL = 0.25
+
+async def stream_batch_job(request):
+    """SSE twin of the Flask route: `result` per member, then `done`."""
+    job_id = request.path_params['job_id']
+    cursor = int(request.query_params.get('since') or 0)
+    if api.BATCH.poll(job_id, cursor) is None:
+        return JSONResponse({"error": "Batch job not found or expired"}, status_code=404)
+
+    async def generate():
+        since = cursor
+        while True:
+            page = api.BATCH.poll(job_id, since)
+            if page is None:
+                yield sse_event("error", {"error": "Batch job expired"})
+                return
+            for event, payload in batch_jobs.page_events(page):
+                yield sse_event(event, payload)
+            if page['status'] != 'running':
+                return
+            since = page['cursor']
+            await asyncio.sleep(BATCH_STREAM_INTERVAL)
+
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --- 2. THE APP ---
+app = Starlette(
+    routes=[
+        Route('/', home),
+        Route('/ready', ready),
+        Route('/api/cache/stats', cache_stats),
+        Route('/api/scheduler/stats', scheduler_stats),
+        Route('/api/validation/stats', validation_stats),
+        Route('/metrics', metrics),
+        Route('/api/recipes', generate_recipes, methods=['POST']),
+        Route('/api/recipes/stream', stream_recipes, methods=['POST']),
+        Route('/api/plan', generate_plan, methods=['POST']),
+        Route('/api/plan/{plan_id}', get_plan),
+        Route('/api/nutrition', score_recipes_nutrition, methods=['POST']),
+        Route('/api/rations', get_rations, methods=['POST']),
+        Route('/api/shop', generate_shopping_list, methods=['POST']),
+        Route('/api/scan', scan_fridge, methods=['POST']),
+        Route('/api/inventory/update', update_inventory, methods=['POST']),
+        Route('/api/inventory/{user_id}', get_inventory, methods=['GET']),
+        Route('/api/inventory/{user_id}', put_inventory, methods=['PUT']),
+        Route('/api/inventory/{user_id}/delta', inventory_delta, methods=['POST']),
+        Route('/api/inventory/{user_id}/changes', inventory_changes, methods=['GET']),
+        Route('/api/batch', submit_batch_job, methods=['POST']),
+        Route('/api/batch/{job_id}', get_batch_job),
+        Route('/api/batch/{job_id}/stream', stream_batch_job),
+    ],
+    middleware=[
+        Middleware(TraceMiddleware),
+        Middleware(PayloadMiddleware),
+        *([Middleware(RecorderMiddleware, recorder=api.RECORDER)] if api.RECORDER is not None else []),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'], expose_headers=['ETag']),
+    ],
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    api.warm_up()
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get("PORT", 5000)))
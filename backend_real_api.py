@@ -1,50 +1,229 @@
+import io
 import os
 import json
-import google.generativeai as genai
-from flask import Flask, request, jsonify
+import time
+import base64
+import threading
+import contextvars
+_IMPORT_STARTED = time.perf_counter()
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, request, jsonify, Response, stream_with_context, g
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-import PIL.Image
 from datetime import datetime
+from ingredient_index import IngredientIndex, diet_known
+from response_cache import cache_from_env, canonical_key, canonical_inventory
+import meal_plan
+from inventory_matcher import apply_recipes, recipes_from_payload
+from inventory_store import store_from_env, parse_version, InventoryConflict, InvalidVersion
+from recipe_reuse import RecipeReuseIndex, recipe_context
+from ration_planner import plan_rations, ration_constraints, horizon_days
+from output_validator import RecipeValidator, ShopValidator, ValidationStats
+from nutrition import NutritionTable, nutrition_report, plan_recipes
+from shop_optimizer import solve_shopping_list, build_flavor_prompt, apply_flavor
+from json_stream import IncrementalJSONParser, sse_event, recipe_sse_events, cached_recipe_sse
+from llm_scheduler import scheduler_from_env
+import fridge_scan
+import telemetry
+import traffic_recorder
+import llm_providers
+import http_payload
+import batch_jobs
 
 # Replace your current loading block with this:
 current_dir = os.path.dirname(os.path.abspath(__file__))
 json_path = os.path.join(current_dir, 'ingredients_master.json')
 
+# Loaded once (in the gunicorn master when preloading) and never mutated afterwards,
+# so every worker shares these pages copy-on-write instead of parsing its own copy.
 with open(json_path, 'r') as f:
-    INGREDIENTS_MASTER = json.load(f)
+    INGREDIENTS_MASTER = tuple(json.load(f))
+
+# Built once: every prompt gets a relevant slice instead of the whole file.
+MASTER_INDEX = IngredientIndex(INGREDIENTS_MASTER)
+NUTRITION_TABLE = NutritionTable(MASTER_INDEX)
 
 print(f"✅ Loaded {len(INGREDIENTS_MASTER)} master ingredients.")
 
 # --- 1. CONFIGURATION ---
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify and request.json through http_payload (orjson when installed); keys keep their order."""
+
+    def dumps(self, obj, **kwargs):
+        return http_payload.dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return http_payload.loads(s)
+
+    def response(self, *args, **kwargs):
+        return self._app.response_class(http_payload.dumps(self._prepare_response_obj(args, kwargs)), mimetype=self.mimetype)
+
 app = Flask(__name__)
-CORS(app)
+app.json = FastJSONProvider(app)
+# ETag exposed so browser clients can send it back as If-None-Match
+CORS(app, expose_headers=['ETag'])
 
 # Move these to the top so all functions can see them
 # --- 1. CONFIGURATION ---
-model = genai.GenerativeModel(
-    model_name='gemini-2.5-flash-lite',
-    generation_config={"response_mime_type": "application/json"},
-    system_instruction=(
-        "You are the Manna AI Kitchen Engine. Your mission is to help individuals eat amazing, healthy meals while wasting nothing. You must turn limited inventory into high-quality culinary experiences.\n\n"
-        
-        "STRICT OPERATIONAL RULES:\n"
-        "1. ZERO HALLUCINATIONS: You are strictly forbidden from using any item that is not currently in the inventory_data. Use the MASTER DATABASE ONLY to look up the 'substitute', 'shelf-life', or 'nutritional data' of items already present in the user inventory. If the user does not have an item in their inventory, you ARE FORBIDDEN from including it in a recipe.\n"
-        "2. ACCURACY & DIET: Strictly adhere to the user's dietary style (e.g., Vegan, Pescatarian). "
-        "If a recipe traditionally requires a non-compliant ingredient, do not suggest it unless "
-        "a suitable substitute exists in their inventory.\n"
-        "3. VIBE-DRIVEN LOGIC: Adapt the complexity and tone of instructions to the 'cookingVibe':\n"
-        "   - 'Speed': Max 15 mins, 1 pan, high efficiency.\n"
-        "   - 'Therapy': Focus on mindful preparation, chopping skills, and relaxation.\n"
-        "   - 'Pro': Focus on plating, sauce reductions, and advanced flavor balancing.\n"
-        "4. WASTE REDUCTION: For every generation, prioritize the item with the lowest 'daysLeft' value.\n"
-        "5. OUTPUT FORMAT: Return ONLY ONE high-quality JSON recipe object that matches the requested 'mealType' (Breakfast, Lunch, or Dinner). The description must explain why this specific meal was chosen for the user's current goal and vibe.\n"
-        "6. RATIONING LOGIC: You are a resource manager. Check 'daysRemaining'. "
-        "Proportionally divide ingredients so the user does not run out of food before their next shop. "
-        "For example, if they have 1kg of meat for 5 days, suggest 200g per recipe, not 500g."
-        "id, title, description, calories, macros (p, c, f), time, ingredients (name and amount), "
-        "instructions (step-by-step), and a relevant Unsplash image URL. UNIT CONSISTENCY: You MUST use the same 'unit' and 'name' provided in the user's inventory JSON."
-    )
+SYSTEM_INSTRUCTION = (
+    "You are the Manna AI Kitchen Engine. Your mission is to help individuals eat amazing, healthy meals while wasting nothing. You must turn limited inventory into high-quality culinary experiences.\n\n"
+    
+    "STRICT OPERATIONAL RULES:\n"
+    "1. ZERO HALLUCINATIONS: You are strictly forbidden from using any item that is not currently in the inventory_data. Use the MASTER DATABASE ONLY to look up the 'substitute', 'shelf-life', or 'nutritional data' of items already present in the user inventory. If the user does not have an item in their inventory, you ARE FORBIDDEN from including it in a recipe.\n"
+    "2. ACCURACY & DIET: Strictly adhere to the user's dietary style (e.g., Vegan, Pescatarian). "
+    "If a recipe traditionally requires a non-compliant ingredient, do not suggest it unless "
+    "a suitable substitute exists in their inventory.\n"
+    "3. VIBE-DRIVEN LOGIC: Adapt the complexity and tone of instructions to the 'cookingVibe':\n"
+    "   - 'Speed': Max 15 mins, 1 pan, high efficiency.\n"
+    "   - 'Therapy': Focus on mindful preparation, chopping skills, and relaxation.\n"
+    "   - 'Pro': Focus on plating, sauce reductions, and advanced flavor balancing.\n"
+    "4. WASTE REDUCTION: For every generation, prioritize the item with the lowest 'daysLeft' value.\n"
+    "5. OUTPUT FORMAT: Return ONLY ONE high-quality JSON recipe object that matches the requested 'mealType' (Breakfast, Lunch, or Dinner). The description must explain why this specific meal was chosen for the user's current goal and vibe.\n"
+    "6. RATIONING LOGIC: You are a resource manager. Check 'daysRemaining'. "
+    "Proportionally divide ingredients so the user does not run out of food before their next shop. "
+    "For example, if they have 1kg of meat for 5 days, suggest 200g per recipe, not 500g."
+    "id, title, description, calories, macros (p, c, f), time, ingredients (name and amount), "
+    "instructions (step-by-step), and a relevant Unsplash image URL. UNIT CONSISTENCY: You MUST use the same 'unit' and 'name' provided in the user's inventory JSON."
 )
+
+def create_gemini_model():
+    # The SDK (and gRPC under it) is the slowest import we have; only pay for it when a client is built
+    import google.generativeai as genai
+    return llm_providers.SingleAttemptGemini(genai.GenerativeModel(
+        model_name='gemini-2.5-flash-lite',
+        generation_config={"response_mime_type": "application/json"},
+        system_instruction=SYSTEM_INSTRUCTION
+    ))
+
+def create_model():
+    """
+    The real Gemini client, a router over several providers (MANNA_LLM_PROVIDERS), or a
+    local fake when MANNA_FAKE_MODEL_LATENCY is set (load tests).
+    """
+    fake_latency = os.environ.get("MANNA_FAKE_MODEL_LATENCY")
+    if fake_latency is not None:
+        from fake_model import FakeModel
+        return FakeModel(latency=float(fake_latency))
+    # Offline load tests: recorded answers at recorded latencies (benchmarks/replay.py)
+    cassette = os.environ.get("MANNA_REPLAY_CASSETTE")
+    if cassette:
+        return traffic_recorder.ReplayModel.from_file(cassette, speed=float(os.environ.get("MANNA_REPLAY_SPEED", 1.0)))
+    return llm_providers.router_from_env(create_gemini_model, SYSTEM_INSTRUCTION) or create_gemini_model()
+
+# Opt-in anonymized traffic capture (MANNA_RECORD_CASSETTE), replayable with benchmarks/replay.py
+RECORDER = traffic_recorder.recorder_from_env()
+
+# Startup timings for /ready; 'ready' flips once this process has its model client
+STARTUP = {"ready": False, "importSeconds": None, "modelSeconds": None, "masterEntries": len(INGREDIENTS_MASTER)}
+model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """
+    The model client for this process, created on first use. Under gunicorn that is
+    after the fork (see gunicorn.conf.py), so no gRPC channel is ever shared between workers.
+    """
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                start = time.perf_counter()
+                model = create_model()
+                if RECORDER is not None:
+                    model = RECORDER.wrap(model)
+                STARTUP["modelSeconds"] = round(time.perf_counter() - start, 3)
+                STARTUP["ready"] = True
+    return model
+
+def warm_up():
+    """Builds the model client ahead of the first request (gunicorn post_fork, or __main__)."""
+    try:
+        get_model()
+    except Exception as e:
+        print(f"Warm-up Error (will retry on first request): {e}")
+
+# Every model call goes through one scheduler: concurrency cap, RPM/TPM buckets,
+# retries with backoff, and recipes ahead of shopping lists/plans when it is busy.
+LLM = scheduler_from_env(get_model)
+
+def provider_stats():
+    """Per-provider health when MANNA_LLM_PROVIDERS routes between backends (None for a single client)."""
+    stats = getattr(model, 'provider_stats', None)
+    return stats() if callable(stats) else None
+
+def traced_generate(prompt, lane, **kwargs):
+    """One model call on behalf of the current request: prompt bytes, the 'model' span and token usage."""
+    telemetry.record_prompt(prompt)
+    with telemetry.span('model'):
+        response = LLM.generate(prompt, lane=lane, **kwargs)
+    telemetry.record_usage(response)
+    return response
+
+# Shared response cache (in-memory LRU + optional SQLite tier via MANNA_CACHE_DB)
+RESPONSE_CACHE = cache_from_env()
+RECIPE_CACHE_TTL = 600
+SHOP_CACHE_TTL = 3600
+FLAVOR_CACHE_TTL = 86400
+RATION_CACHE_TTL = 86400
+# Fridge scans keyed by perceptual hash, so a re-shot of the same shelves is a cache hit
+SCAN_CACHE = fridge_scan.PerceptualCache(RESPONSE_CACHE)
+
+# Past recipes a drifted pantry can still cook (per process, bounded LRU)
+RECIPE_REUSE = RecipeReuseIndex(MASTER_INDEX, max_recipes=int(os.environ.get("MANNA_REUSE_SIZE", 2048)))
+
+# Repair and re-call rates of the recipe/shopping-list validators
+VALIDATION = ValidationStats()
+
+# Durable per-user inventories (SQLite WAL at MANNA_INVENTORY_DB, else under ~/.local/share/manna)
+INVENTORY_STORE = store_from_env(MASTER_INDEX)
+
+# Bulk /api/batch jobs: one bounded pool of generations per worker (MANNA_BATCH_PARALLEL)
+BATCH = batch_jobs.runner_from_env(RESPONSE_CACHE.db_path)
+BATCH_MAX_MEMBERS = int(os.environ.get("MANNA_BATCH_MAX_MEMBERS", 500))
+
+# Scheduler and cache state, read at scrape time by /metrics
+telemetry.METRICS.add(telemetry.Gauge(
+    "manna_llm_in_flight", "Model calls currently running.", (),
+    lambda: {(): LLM.stats()["inFlight"]}))
+telemetry.METRICS.add(telemetry.Gauge(
+    "manna_llm_queue_depth", "Model calls waiting for a slot.", ("lane",),
+    lambda: {(lane,): depth for lane, depth in LLM.stats()["queueDepth"].items()}))
+telemetry.METRICS.add(telemetry.Gauge(
+    "manna_llm_events_total", "Scheduler calls, retries, failures, coalesced and throttled waits.", ("event",),
+    lambda: {(event,): LLM.stats()[event] for event in ("calls", "retries", "failures", "coalesced", "throttled")},
+    kind="counter"))
+telemetry.METRICS.add(telemetry.Gauge(
+    "manna_llm_provider_latency_seconds", "EWMA latency of successful calls per model provider.", ("provider",),
+    lambda: {(p["name"],): round(p["latencyMs"] / 1000, 4)
+             for p in (provider_stats() or {}).get("providers", []) if p["latencyMs"] is not None}))
+telemetry.METRICS.add(telemetry.Gauge(
+    "manna_llm_provider_up", "1 while a provider's circuit breaker lets calls through.", ("provider",),
+    lambda: {(p["name"],): int(p["state"] != "open") for p in (provider_stats() or {}).get("providers", [])}))
+telemetry.METRICS.add(telemetry.Gauge(
+    "manna_cache_lookups_total", "Response cache lookups.", ("result",),
+    lambda: {(result,): RESPONSE_CACHE.stats()[result] for result in ("hits", "misses")},
+    kind="counter"))
+telemetry.METRICS.add(telemetry.Gauge(
+    "manna_validation_total", "Model answers checked, and how many were repaired locally, re-called or still failing.",
+    ("kind", "result"),
+    lambda: {(kind, result): counts[result] for kind, counts in VALIDATION.stats().items()
+             for result in ("checked", "clean", "repaired", "recalled", "failed")},
+    kind="counter"))
+telemetry.METRICS.add(telemetry.Gauge(
+    "manna_batch_jobs_running", "Batch jobs with generations still pending.", (),
+    lambda: {(): BATCH.stats()["running"]}))
+telemetry.METRICS.add(telemetry.Gauge(
+    "manna_batch_generations_queued", "Batch generations waiting for a pool slot.", (),
+    lambda: {(): BATCH.stats()["queued"]}))
+
+# Upper bound for the full-LLM /api/shop call before we fall back to the local solver
+SHOP_MODEL_TIMEOUT = float(os.environ.get("MANNA_SHOP_MODEL_TIMEOUT", 30))
+PLAN_CACHE_TTL = 86400
+
+# /api/plan splits the period into at most this many day windows, generated in parallel
+PLAN_GENERATIONS = int(os.environ.get("MANNA_PLAN_GENERATIONS", 3))
+PLAN_MAX_DAYS = 14
+
 # --- 2. THE CLEANER ---
 def clean_gemini_json(text):
     """Bulletproof filter to extract JSON even if the AI adds chatter."""
@@ -55,20 +234,23 @@ def clean_gemini_json(text):
         # 2. Find the FIRST '[' and the LAST ']'
         start = clean.find("[")
         end = clean.rfind("]")
+        start_obj = clean.find("{")
         
-        if start != -1 and end != -1:
+        # A recipe object has lists inside it, so only take the list path when '[' comes first
+        if start != -1 and end != -1 and (start_obj == -1 or start < start_obj):
             json_str = clean[start:end + 1]
             return json.loads(json_str)
         
         # 3. Fallback: If it's an object with a 'recipes' key instead of a list
-        start_obj = clean.find("{")
         end_obj = clean.rfind("}")
         if start_obj != -1:
             data = json.loads(clean[start_obj:end_obj + 1])
             return data.get('recipes', data) # Return the list inside or the object
             
+        telemetry.record_cleaner_failure()
         return []
     except Exception as e:
+        telemetry.record_cleaner_failure()
         print(f"CRITICAL CLEANER ERROR: {e}")
         print(f"RAW TEXT THAT FAILED: {text[:200]}...") # See the first 200 chars
         return []
@@ -119,39 +301,36 @@ def get_caloric_needs(data):
     except Exception as e:
         print(f"Bio-Calculator Error: {e}")
         return 2000, 130 # Safe fallback for standard student needs
-# --- 4. ROUTES ---
 
-@app.route('/')
-def home():
-    return "Manna AI Server is Online!"
+# --- 4. PROMPT BUILDERS ---
+def resolve_meal_context(data):
+    """The frontend may send a specific 'mealType'; otherwise we go by time of day."""
+    # --- TIME-OF-DAY INTEGRATION ---
+    current_hour = datetime.now().hour
+    if 5 <= current_hour < 11:
+        default_meal = "Breakfast"
+    elif 11 <= current_hour < 16:
+        default_meal = "Lunch"
+    elif 16 <= current_hour < 22:
+        default_meal = "Dinner"
+    else:
+        default_meal = "Snack"
 
-@app.route('/api/recipes', methods=['POST'])
-def generate_recipes():
-    try:
-        data = request.json
-        inventory = data.get('inventory', [])
-        profile = data.get('userProfile', {})
-        vibe = profile.get('vibe', 'Speed')
-        days_left = int(profile.get('daysRemaining', 7)) 
-        tastes = profile.get('tastes', {})
-        
-        # --- TIME-OF-DAY INTEGRATION ---
-        current_hour = datetime.now().hour
-        if 5 <= current_hour < 11:
-            default_meal = "Breakfast"
-        elif 11 <= current_hour < 16:
-            default_meal = "Lunch"
-        elif 16 <= current_hour < 22:
-            default_meal = "Dinner"
-        else:
-            default_meal = "Snack"
+    return data.get('mealType', default_meal)
 
-        # This allows the frontend to send a specific 'mealType' (e.g., Breakfast)
-        meal_context = data.get('mealType', default_meal)
-        target_cals, target_protein = get_caloric_needs(profile)
-        
-        # PROMPT REWRITTEN FOR SINGLE OUTPUT (NO SHORTENING)
-        prompt = """
+def build_recipe_prompt(data, targets=None):
+    """Formats the /api/recipes prompt with only the master entries this inventory needs."""
+    inventory = data.get('inventory', [])
+    profile = data.get('userProfile', {})
+    vibe = profile.get('vibe', 'Speed')
+    days_left = horizon_days(profile.get('daysRemaining', 7))
+    tastes = profile.get('tastes', {})
+    meal_context = resolve_meal_context(data)
+    target_cals, target_protein = targets or get_caloric_needs(profile)
+    budgets, must_use = ration_constraints(ration_plan(data))
+
+    # PROMPT REWRITTEN FOR SINGLE OUTPUT (NO SHORTENING)
+    return """
         Role: Manna AI Master Chef & Resource Manager
         Mission: Create amazing, healthy meals using ONLY provided inventory that will last the user the perfect amount of time.
         You are Manna AI, a strategic kitchen operator.
@@ -168,18 +347,17 @@ def generate_recipes():
         Days until next shop: {days} days.
 
         TASK: 
-        1. MANDATORY RATIONING: You must calculate a budget for every ingredient: (Total Quantity ÷ {days} days). 
-           The 'amountValue' for EACH recipe MUST be less than or equal to this daily budget. 
-           *Example: If user has 500g Beef and 5 days left, 'amountValue' for one recipe cannot exceed 100g.*
+        1. MANDATORY RATIONING (BUDGETS ALREADY CALCULATED, DO NOT RECOMPUTE): {budgets}
+           The 'amountValue' for EACH ingredient MUST be less than or equal to its budget above. 
         2. MATCHING: The 'name' and 'unit' must be an EXACT string match to the inventory data provided.
         3. DATA TYPE: The 'amountValue' must be a raw Number, not a string.
-        4. CULINARY ROUNDING: Use human-friendly numbers. Round grams to the nearest 50g (e.g., 150g, 200g). For pieces/units, use whole numbers or halves (e.g., 1 lemon, 0.5 onion). NEVER output more than one decimal point."
+        4. CULINARY ROUNDING: Use human-friendly numbers. Round grams to the nearest 50g (e.g., 150g, 200g). For pieces/units, use whole numbers or halves (e.g., 1 lemon, 0.5 onion). NEVER output more than one decimal point. Never round above an item's budget."
        
         STRICT CONSTRAINTS:
         1. NO EXTERNAL INGREDIENTS: Use only items from the Inventory. (Salt, Pepper, Water, and 1 Oil allowed). 
         2. DIETARY PURITY: Strictly follow the diet specified in the profile.
         3. ZERO-WASTE PRIORITY: Focus on using up expiring items first.
-        4. ROTTENING LOGIC: Prioritize items with 'daysLeft' <= 2. They MUST be used in this recipe.
+        4. ROTTENING LOGIC: These items expire within 2 days and MUST be used in this recipe: {must_use}.
         5. PALATE ALIGNMENT: User tastes are {tastes}. If they like 'Tangy', suggest dressings (like Caesar). If 'Bold', increase seasoning.
         6. MEAL CONTEXT: This is strictly for {meal_type}. If 'Breakfast', respect the 'breakfastStyle' preference (Sweet vs Savory).
 
@@ -204,48 +382,62 @@ def generate_recipes():
             "image": "https://images.unsplash.com/photo-[ID]?w=800&q=80"
         }}
         """.format(
-            master_db=json.dumps(INGREDIENTS_MASTER),
+            master_db=MASTER_INDEX.prompt_slice(inventory),
             user_profile=json.dumps(profile),
             inventory_data=json.dumps(inventory),
             vibe_style=vibe,
             days=days_left,
             target_cals=target_cals,
             tastes=json.dumps(tastes),
-            meal_type=meal_context
+            meal_type=meal_context,
+            budgets=budgets,
+            must_use=must_use
         )
 
-        response = model.generate_content(prompt)
-        recipe = clean_gemini_json(response.text)
-        
-        # Ensuring we return a single object, not a list of one
-        if isinstance(recipe, list) and len(recipe) > 0:
-            recipe = recipe[0]
-        
-        return jsonify(recipe)
+def ration_plan(data):
+    """
+    Local budgets and must-use items for the recipe prompt. Inventories loaded from the
+    store are cached per (user, version, day), so every meal call that day reuses them.
+    """
+    inventory = data.get('inventory', [])
+    days_left = horizon_days(data.get('userProfile', {}).get('daysRemaining', 7))
+    version = data.get('inventoryVersion')
+    if version is None:
+        return plan_rations(inventory, days_left, MASTER_INDEX)
 
-    except Exception as e:
-        print(f"Error in Recipe Generation: {e}")
-        return jsonify({"error": str(e)}), 500
+    key = canonical_key('rations', {
+        'user': str(data.get('userId')),
+        'version': version,
+        'days': days_left,
+        'date': datetime.now().date().isoformat(),
+    })
+    plan = RESPONSE_CACHE.get(key)
+    if plan is None:
+        plan = plan_rations(inventory, days_left, MASTER_INDEX)
+        RESPONSE_CACHE.set(key, plan, ttl=RATION_CACHE_TTL)
+    return plan
 
-@app.route('/api/shop', methods=['POST'])
-def generate_shopping_list():
-    try:
-        data = request.json
-        profile = data.get('userProfile', {})
-        days = int(data.get('days', 7))
-        name = profile.get('name', 'Student')
-        tastes = profile.get('tastes', {})
-
-        target_cals, target_protein = get_caloric_needs(profile)
-        total_period_cals = target_cals * days
-        total_protein_g = target_protein * days
-        # Calculate rough carb quota (approx 45% of energy)
-        total_carbs_g = round(((target_cals * 0.45) / 4) * days)
-
-        # Fix: The f-string now correctly holds the Master DB and uses {{ }} for JSON
-        prompt = f"""
+def shop_targets(data, targets=None):
+    """Period targets shared by the LLM prompt and the local solver; batches pass their precomputed daily `targets`."""
+    profile = data.get('userProfile', {})
+    days = int(data.get('days', 7))
+    target_cals, target_protein = targets or get_caloric_needs(profile)
+    # Calculate rough carb quota (approx 45% of energy)
+    total_carbs_g = round(((target_cals * 0.45) / 4) * days)
+    return profile, days, target_cals, target_protein, total_carbs_g
+
+def build_shop_prompt(data, targets=None):
+    """Formats the /api/shop prompt against a diet-filtered, category-balanced master slice."""
+    profile, days, target_cals, target_protein, total_carbs_g = shop_targets(data, targets)
+    name = profile.get('name', 'Student')
+    tastes = profile.get('tastes', {})
+    total_period_cals = target_cals * days
+    total_protein_g = target_protein * days
+
+    # Fix: The f-string now correctly holds the Master DB and uses {{ }} for JSON
+    return f"""
         You are Manna AI, a strategic kitchen operator.
-        MASTER DATABASE: {json.dumps(INGREDIENTS_MASTER)}
+        MASTER DATABASE: {MASTER_INDEX.shopping_slice(profile.get('diet'), tastes)}
 
         TASK: When generating ingredients or recipes, you MUST ONLY use items from the MASTER DATABASE. 
         If an item is not in the database, use the 'substitute' listed in the database instead.
@@ -305,57 +497,791 @@ def generate_shopping_list():
         ]
         """
 
-        response = model.generate_content(prompt)
-        items = clean_gemini_json(response.text)
+def reuse_context(data):
+    return recipe_context(data.get('userProfile', {}), resolve_meal_context(data))
+
+def lookup_recipe(data, cache_key):
+    """Exact cache first, then a stored recipe this pantry can still cook. 'fresh': true skips reuse."""
+    with telemetry.span('cache'):
+        cached = RESPONSE_CACHE.get(cache_key)
+    if cached is None and not data.get('fresh'):
+        with telemetry.span('reuse'):
+            days_left = horizon_days(data.get('userProfile', {}).get('daysRemaining', 7))
+            cached = RECIPE_REUSE.find(data.get('inventory', []), reuse_context(data), days_left)
+    return cached
+
+def remember_recipe(data, cache_key, recipe):
+    RESPONSE_CACHE.set(cache_key, recipe, ttl=RECIPE_CACHE_TTL)
+    RECIPE_REUSE.add(recipe, reuse_context(data))
+
+def recipe_cache_key(data):
+    """Hash of everything that shapes the recipe prompt; the clock only counts via meal_context."""
+    return canonical_key('recipes', {
+        'inventory': canonical_inventory(data.get('inventory', [])),
+        'profile': data.get('userProfile', {}),
+        'meal': resolve_meal_context(data),
+    })
+
+def shop_cache_key(data):
+    return canonical_key('shop', {
+        'profile': data.get('userProfile', {}),
+        'days': int(data.get('days', 7)),
+        'mode': data.get('mode', 'llm'),
+    })
+
+def solved_shopping_list(data, flavor_text=None, targets=None):
+    """
+    Local solver list. `flavor_text(prompt)` (optional) lets the model rewrite the
+    emoji/'why' lines; that step is cached by item names + goal + tastes.
+    """
+    profile, days, target_cals, target_protein, total_carbs_g = shop_targets(data, targets)
+    with telemetry.span('solve'):
+        items, summary = solve_shopping_list(MASTER_INDEX, profile, days, target_cals, target_protein, total_carbs_g)
+    if not summary['withinTolerance']:
+        print(f"Shop Solver Gap (kcal, protein g still missing): {summary['gap']}")
+    if flavor_text is None:
+        return items
+
+    flavor_key = canonical_key('shop-flavor', {
+        'items': [item['name'] for item in items],
+        'goal': profile.get('goal'),
+        'diet': profile.get('diet'),
+        'tastes': profile.get('tastes', {}),
+    })
+    flavor = RESPONSE_CACHE.get(flavor_key)
+    if flavor is None:
+        try:
+            flavor = clean_gemini_json(flavor_text(build_flavor_prompt(items, profile)))
+            if flavor:
+                RESPONSE_CACHE.set(flavor_key, flavor, ttl=FLAVOR_CACHE_TTL)
+        except Exception as e:
+            print(f"Shop Flavor Error (keeping template text): {e}")
+            flavor = None
+    return apply_flavor(items, flavor)
+
+def apply_cooked_recipes(current_inventory, recipes):
+    """Subtracts cooked recipes from the inventory (shared by the sync and async apps)."""
+    return apply_recipes(current_inventory, recipes, MASTER_INDEX)
+
+def with_stored_inventory(data):
+    """Requests may send 'userId' instead of the whole 'inventory'; it is loaded from the store then."""
+    if data.get('userId') and 'inventory' not in data:
+        with telemetry.span('store'):
+            version, inventory = INVENTORY_STORE.load(str(data['userId']))
+        return {**data, 'inventory': inventory, 'inventoryVersion': version}
+    return data
+
+def cook_stored(user_id, recipes, expected_version=None):
+    """Applies cooked recipes to a stored inventory in one versioned write; answers with the changes only."""
+    def cook(items):
+        result = apply_cooked_recipes(items, recipes)
+        return result['updatedInventory'], result
+
+    with telemetry.span('store'):
+        version, changes, result = INVENTORY_STORE.transform(user_id, cook, expected_version)
+    return {
+        "success": True,
+        "version": version,
+        "changes": changes,
+        "lowStock": result['lowStock'],
+        "unmatched": result['unmatched'],
+    }
+
+def inventory_version(if_match, body=None):
+    """Expected version from the If-Match header, or a 'version' field in the body; InvalidVersion if unreadable."""
+    if if_match:
+        return parse_version(if_match)
+    return parse_version((body or {}).get('version'))
+
+def score_nutrition(data):
+    """Local calories/protein for one recipe, a list of recipes or a whole plan, vs. the user's targets."""
+    target_cals, target_protein = get_caloric_needs(data.get('userProfile', {}))
+    days = None
+    if data.get('plan'):
+        recipes, days = plan_recipes(data['plan'])
+    else:
+        recipes = recipes_from_payload(data)
+    return nutrition_report(NUTRITION_TABLE, recipes, target_cals, target_protein, days)
+
+def parse_recipe(text):
+    """Cleans the model output and makes sure we hand back a single recipe object."""
+    recipe = clean_gemini_json(text)
+
+    # Ensuring we return a single object, not a list of one
+    if isinstance(recipe, list) and len(recipe) > 0:
+        recipe = recipe[0]
+    return recipe
+
+def recipe_validator(data):
+    return RecipeValidator(data.get('inventory', []), ration_plan(data), MASTER_INDEX, NUTRITION_TABLE)
+
+def validated_recipe(data, recipe, prompt=None, regenerate=None):
+    """
+    Checks a parsed recipe against the inventory and ration budgets and repairs what it
+    can locally. Only what no local repair fixes (unknown ingredients, missing fields,
+    no must-use item) costs one targeted re-call through `regenerate(prompt) -> text`.
+    """
+    validator = recipe_validator(data)
+    with telemetry.span('validate'):
+        check = validator.check(recipe)
+    if not check.ok and regenerate is not None:
+        try:
+            fixed = parse_recipe(regenerate(validator.fix_prompt(check) or prompt))
+            with telemetry.span('validate'):
+                check = validator.recheck(check, fixed)
+        except Exception as e:
+            print(f"Recipe Re-call Error (keeping the local repair): {e}")
+    VALIDATION.record(check)
+    return check
+
+def validated_shopping_list(data, items, regenerate=None):
+    """Same for an LLM shopping list; the re-call only asks for replacements of the rejected items."""
+    profile, days = data.get('userProfile', {}), int(data.get('days', 7))
+    validator = ShopValidator(MASTER_INDEX, profile, days)
+    with telemetry.span('validate'):
+        check = validator.check(items)
+    fix_prompt = validator.fix_prompt(check)
+    if fix_prompt and regenerate is not None:
+        try:
+            replacements = clean_gemini_json(regenerate(fix_prompt))
+            with telemetry.span('validate'):
+                check = validator.recheck(check, replacements)
+        except Exception as e:
+            print(f"Shopping List Re-call Error (dropping the rejected items): {e}")
+    VALIDATION.record(check)
+    return check
+
+def make_shopping_list(data, generate, targets=None):
+    """
+    The /api/shop modes over a sync `generate(prompt, **kwargs) -> text`. Returns the items
+    and whether they may be cached: the solver fallback after a failed model list is not.
+    A diet the local rules don't know ('Keto') always goes to the model, whatever the mode.
+    """
+    mode = data.get('mode', 'llm')
+    diet = data.get('userProfile', {}).get('diet')
+    if not diet_known(diet):
+        mode = 'llm'
+    if mode == 'fast':
+        return solved_shopping_list(data, targets=targets), True
+    if mode == 'hybrid':
+        return solved_shopping_list(data, generate, targets), True
+
+    with telemetry.span('prompt_build'):
+        prompt = build_shop_prompt(data, targets)
+    try:
+        text = generate(prompt, request_options={"timeout": SHOP_MODEL_TIMEOUT})
+        with telemetry.span('parse'):
+            items = clean_gemini_json(text)
+        items = validated_shopping_list(data, items, lambda fix: generate(
+            fix, request_options={"timeout": SHOP_MODEL_TIMEOUT})).value
+    except Exception as e:
+        print(f"Shopping List Model Error (using local solver): {e}")
+        return fallback_shopping_list(data, targets), False
+    if not items:
+        return fallback_shopping_list(data, targets), False
+    return items, True
+
+def fallback_shopping_list(data, targets=None):
+    diet = data.get('userProfile', {}).get('diet')
+    if not diet_known(diet):
+        print(f"Shop Solver Warning: the local rules don't know the diet {diet!r}; check this list")
+    return solved_shopping_list(data, targets=targets)
+
+def decode_images(body):
+    """JSON uploads: 'images' is a list of base64 strings (data: URLs are fine)."""
+    if not isinstance(body, dict):
+        return []
+    return [base64.b64decode(str(image).split(',')[-1]) for image in body.get('images', [])]
+
+def prepare_scan(raw):
+    """Downscales one photo and checks the perceptual cache: (photo, cached items or None)."""
+    with telemetry.span('image_prep'):
+        photo = fridge_scan.prepare_image(raw)
+    return photo, SCAN_CACHE.get(photo.phash)
+
+def finish_scan(photo, text):
+    with telemetry.span('parse'):
+        items = fridge_scan.to_inventory(clean_gemini_json(text), MASTER_INDEX)
+    if items:
+        SCAN_CACHE.set(photo.phash, items)
+    return items
+
+def scan_photo(raw):
+    photo, items = prepare_scan(raw)
+    cached = items is not None
+    if not cached:
+        response = traced_generate(fridge_scan.build_scan_prompt(MASTER_INDEX, photo.jpeg), 'interactive')
+        items = finish_scan(photo, response.text)
+    return photo, items, cached
+
+def assemble_scan(results):
+    """
+    Merged inventory plus a per-photo report of what was sent and whether the cache answered.
+    A photo that is a near-duplicate of an earlier one in the same upload is not counted twice.
+    """
+    scans, photos = [], []
+    for number, (photo, items, cached) in enumerate(results):
+        duplicate_of = next((earlier for earlier, (other, _, _) in enumerate(results[:number])
+                             if SCAN_CACHE.is_near(photo.phash, other.phash)), None)
+        if duplicate_of is None:
+            scans.append(items)
+        photos.append({
+            "items": len(items),
+            "cached": cached,
+            "duplicateOf": duplicate_of,
+            "originalBytes": photo.original_bytes,
+            "uploadBytes": len(photo.jpeg),
+            "width": photo.size[0],
+            "height": photo.size[1],
+        })
+    return {"inventory": fridge_scan.merge_scans(scans), "photos": photos}
+
+def plan_days(data):
+    profile = data.get('userProfile', {})
+    return horizon_days(data.get('days', profile.get('daysRemaining', 7)), PLAN_MAX_DAYS)
+
+def plan_cache_key(data):
+    """Doubles as the plan ID, so resubmitting the same week returns the same plan."""
+    return canonical_key('plan', {
+        'inventory': canonical_inventory(data.get('inventory', [])),
+        'profile': data.get('userProfile', {}),
+        'days': plan_days(data),
+    })
+
+def build_plan_prompts(data):
+    """One prompt per day window; targets are computed once and inventory is pre-rationed per window."""
+    inventory = data.get('inventory', [])
+    profile = data.get('userProfile', {})
+    days = plan_days(data)
+    target_cals, target_protein = get_caloric_needs(profile)
+    master_db = MASTER_INDEX.prompt_slice(inventory)
+
+    # 7 days -> 3+3+1, 14 days -> 5+5+4: never more than PLAN_GENERATIONS model calls
+    chunks = meal_plan.plan_chunks(days, -(-days // max(1, PLAN_GENERATIONS)))
+    allotments = meal_plan.allot_inventory(inventory, days, chunks)
+    return [
+        (first, last, meal_plan.build_plan_prompt(profile, allotted, first, last, target_cals, target_protein, master_db))
+        for (first, last), allotted in zip(chunks, allotments)
+    ]
+
+def generate_plan_windows(jobs):
+    """Runs the window prompts in parallel on the background lane; returns the answer texts."""
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, LLM.generate, job[2], lane='background') for job in jobs]
+        responses = [future.result() for future in futures]
+    for job, response in zip(jobs, responses):
+        telemetry.record_prompt(job[2])
+        telemetry.record_usage(response)
+    return [response.text for response in responses]
+
+def parse_plan_windows(jobs, texts):
+    """The days of each window, or None where the answer was unparseable or left days out."""
+    windows = []
+    for (first, last, _), text in zip(jobs, texts):
+        days = meal_plan.chunk_days_from(clean_gemini_json(text), first, last)
+        windows.append(days if len(days) == last - first + 1 else None)
+    return windows
+
+def windows_to_retry(jobs, windows):
+    missing = [pos for pos, days in enumerate(windows) if days is None]
+    if missing:
+        print(f"Meal Plan Retry: no usable answer for windows {[jobs[pos][:2] for pos in missing]}")
+    return missing
+
+def assemble_plan(plan_id, data, jobs, windows):
+    """Raises meal_plan.IncompletePlan when any window is still missing: a plan with gaps is never served."""
+    missing = [(first, last) for (first, last, _), days in zip(jobs, windows) if days is None]
+    if missing:
+        raise meal_plan.IncompletePlan(missing)
+    return {"planId": plan_id, "daysRemaining": plan_days(data), "days": [day for days in windows for day in days]}
+
+def batch_members(body, kind):
+    """
+    One request body per member: 'members' (objects shaped like a single /api/recipes or
+    /api/shop body) or the 'userProfiles' shorthand, each over the shared top-level fields
+    ('inventory', 'mealType', 'days', 'mode', ...). A member's own inventory wins over the shared one.
+    """
+    shared = {k: v for k, v in body.items() if k not in ('kind', 'members', 'userProfiles')}
+    members = body.get('members')
+    if members is None:
+        members = [{'userProfile': profile} for profile in body.get('userProfiles') or []]
+    if not isinstance(members, list) or not members:
+        raise ValueError("Send 'userProfiles' or 'members' as a non-empty list")
+    if len(members) > BATCH_MAX_MEMBERS:
+        raise ValueError(f"At most {BATCH_MAX_MEMBERS} members per batch")
+    if not all(isinstance(m, dict) and isinstance(m.get('userProfile', {}), dict) for m in members):
+        raise ValueError("Every member needs a 'userProfile' object")
+    if kind != 'recipes':
+        shared.pop('userId', None)
+        return [{**shared, **member} for member in members]
+    # An account-wide userId loads its pantry once, not once per member, and names nobody
+    shared = with_stored_inventory(shared)
+    shared.pop('userId', None)
+    return [with_stored_inventory({**shared, **member}) for member in members]
+
+def batch_recipe(data, targets, cache_key):
+    """One shared generation of a recipes batch, on the background lane."""
+    cached = lookup_recipe(data, cache_key)
+    if cached is not None:
+        return cached
+    prompt = build_recipe_prompt(data, targets)
+    recipe = parse_recipe(traced_generate(prompt, 'background').text)
+    check = validated_recipe(data, recipe, prompt, lambda fix: traced_generate(fix, 'background').text)
+    if check.ok:
+        remember_recipe(data, cache_key, check.value)
+    return check.value
+
+def batch_shopping_list(data, targets, cache_key):
+    """One shared shopping list of a shop batch, same modes as /api/shop."""
+    cached = RESPONSE_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+    items, cacheable = make_shopping_list(
+        data, lambda prompt, **kwargs: traced_generate(prompt, 'background', **kwargs).text, targets)
+    if items and cacheable:
+        RESPONSE_CACHE.set(cache_key, items, ttl=SHOP_CACHE_TTL)
+    return items
+
+BATCH_RUNS = {'recipes': batch_recipe, 'shop': batch_shopping_list}
+
+def submit_batch(body):
+    """
+    Targets for the whole cohort in one vectorized pass, then members grouped by their
+    effective prompt (profile without body metrics or identity, targets rounded to the
+    batch steps, same pantry and meal) so each group costs one generation.
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Send the batch as a JSON object")
+    kind = body.get('kind', 'recipes')
+    if kind not in BATCH_RUNS:
+        raise ValueError(f"'kind' must be one of {', '.join(BATCH_RUNS)}")
+    members = batch_members(body, kind)
+    with telemetry.span('prompt_build'):
+        targets = batch_jobs.cohort_targets([data.get('userProfile', {}) for data in members]).tolist()
+
+        meta, groups, pantries = [], {}, {}
+        for index, (data, (calories, protein)) in enumerate(zip(members, targets)):
+            meta.append({"index": index, "userId": data.get('userId'), "targets": {"calories": calories, "protein": protein}})
+            shared = batch_jobs.shared_targets(calories, protein)
+            effective = {**data, 'userProfile': batch_jobs.effective_profile(data.get('userProfile', {}))}
+            if kind == 'recipes':
+                # A shared pantry is the same list object for every member: canonicalize it once
+                inventory = data.get('inventory', [])
+                if id(inventory) not in pantries:
+                    pantries[id(inventory)] = canonical_inventory(inventory)
+                parts = {'inventory': pantries[id(inventory)], 'meal': resolve_meal_context(data)}
+            else:
+                parts = {'days': int(data.get('days', 7)), 'mode': data.get('mode', 'llm')}
+            key = canonical_key(f'batch-{kind}', {**parts, 'profile': effective['userProfile'], 'targets': shared})
+            groups.setdefault(key, (key, effective, shared, []))[3].append(index)
+
+    state = BATCH.submit(kind, meta, list(groups.values()), BATCH_RUNS[kind])
+    return {**batch_jobs.page(state), "poll": f"/api/batch/{state['jobId']}", "stream": f"/api/batch/{state['jobId']}/stream"}
+
+# --- 5. ROUTES ---
+
+@app.route('/')
+def home():
+    return "Manna AI Server is Online!"
+
+@app.route('/ready')
+def ready():
+    """Readiness probe: 503 until this worker's model client exists, then its startup timings."""
+    return jsonify({**STARTUP, "pid": os.getpid()}), 200 if STARTUP["ready"] else 503
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    return jsonify({**RESPONSE_CACHE.stats(), "reuse": RECIPE_REUSE.stats()})
+
+@app.route('/api/scheduler/stats')
+def scheduler_stats():
+    return jsonify({**LLM.stats(), "providers": provider_stats()})
+
+@app.route('/api/validation/stats')
+def validation_stats():
+    return jsonify(VALIDATION.stats())
+
+@app.route('/metrics')
+def metrics():
+    return Response(telemetry.METRICS.render(), content_type=telemetry.CONTENT_TYPE)
+
+@app.route('/api/recipes', methods=['POST'])
+def generate_recipes():
+    try:
+        data = with_stored_inventory(request.json)
+        cache_key = recipe_cache_key(data)
+        cached = lookup_recipe(data, cache_key)
+        if cached is not None:
+            return jsonify(cached)
+
+        with telemetry.span('prompt_build'):
+            prompt = build_recipe_prompt(data)
+
+        response = traced_generate(prompt, 'interactive')
+        with telemetry.span('parse'):
+            recipe = parse_recipe(response.text)
+        check = validated_recipe(data, recipe, prompt, lambda fix: traced_generate(fix, 'interactive').text)
+
+        # Only cache answers that passed validation, never the cleaner's empty fallback
+        if check.ok:
+            remember_recipe(data, cache_key, check.value)
+        
+        return jsonify(check.value)
+
+    except Exception as e:
+        print(f"Error in Recipe Generation: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/recipes/stream', methods=['POST'])
+def stream_recipes():
+    """
+    Streaming variant of /api/recipes over Server-Sent Events.
+    Emits `field` events (title, description, ...), one `ingredient` per ingredient,
+    one `instruction` per step, then `done` with the assembled recipe.
+    """
+    data = with_stored_inventory(request.json)
+    cache_key = recipe_cache_key(data)
+    cached = lookup_recipe(data, cache_key)
+    with telemetry.span('prompt_build'):
+        prompt = build_recipe_prompt(data) if cached is None else None
+    trace = telemetry.current_trace()
+
+    def generate():
+        if cached is not None:
+            yield from cached_recipe_sse(cached)
+            return
+        try:
+            parser = IncrementalJSONParser()
+            telemetry.record_prompt(prompt, trace)
+            chunk = None
+            with telemetry.span('model'):
+                for chunk in LLM.generate(prompt, lane='interactive', stream=True):
+                    yield from recipe_sse_events(parser.feed(chunk.text))
+            # Gemini reports usage for the whole answer on the last chunk
+            telemetry.record_usage(chunk, trace)
+
+            # The events are already out, so only local repairs apply to the final recipe
+            check = validated_recipe(data, parser.finish())
+            if check.ok and parser.done:
+                remember_recipe(data, cache_key, check.value)
+            yield sse_event("done", check.value)
+        except Exception as e:
+            print(f"Error in Recipe Stream: {e}")
+            yield sse_event("error", {"error": str(e)})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/plan', methods=['POST'])
+def generate_plan():
+    """
+    Full Breakfast/Lunch/Dinner schedule for the whole period in 1-3 parallel generations.
+    A window the model botches is asked for once more; if it still fails, 502.
+    """
+    try:
+        data = with_stored_inventory(request.json)
+        plan_id = plan_cache_key(data)
+        plan = RESPONSE_CACHE.get(plan_id)
+
+        if plan is None:
+            with telemetry.span('prompt_build'):
+                jobs = build_plan_prompts(data)
+            with telemetry.span('model'):
+                texts = generate_plan_windows(jobs)
+            with telemetry.span('parse'):
+                windows = parse_plan_windows(jobs, texts)
+            retry = windows_to_retry(jobs, windows)
+            if retry:
+                retry_jobs = [jobs[pos] for pos in retry]
+                with telemetry.span('model'):
+                    texts = generate_plan_windows(retry_jobs)
+                with telemetry.span('parse'):
+                    for pos, days in zip(retry, parse_plan_windows(retry_jobs, texts)):
+                        windows[pos] = days
+            plan = assemble_plan(plan_id, data, jobs, windows)
+            RESPONSE_CACHE.set(plan_id, plan, ttl=PLAN_CACHE_TTL)
+
+        result = meal_plan.page(plan, request.args.get('day', type=int))
+        if result is None:
+            return jsonify({"error": "Day not in plan"}), 404
+        return jsonify(result)
+
+    except meal_plan.IncompletePlan as e:
+        print(f"Meal Plan Error: {e}")
+        return jsonify({"error": str(e)}), 502
+    except Exception as e:
+        print(f"Meal Plan Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/plan/<plan_id>')
+def get_plan(plan_id):
+    """Lets the client page through a generated plan: /api/plan/<id>?day=3"""
+    plan = RESPONSE_CACHE.get(plan_id)
+    if plan is None:
+        return jsonify({"error": "Plan not found or expired"}), 404
+    result = meal_plan.page(plan, request.args.get('day', type=int))
+    if result is None:
+        return jsonify({"error": "Day not in plan"}), 404
+    return jsonify(result)
+
+@app.route('/api/nutrition', methods=['POST'])
+def score_recipes_nutrition():
+    """Batch nutrition math from the master DB, so the client stops asking the LLM for it."""
+    try:
+        return jsonify(score_nutrition(request.json))
+    except Exception as e:
+        print(f"Nutrition Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/rations', methods=['POST'])
+def get_rations():
+    """The local rationing schedule (per-recipe budgets, per-day amounts, must-use items) the prompts use."""
+    try:
+        return jsonify(ration_plan(with_stored_inventory(request.json)))
+    except Exception as e:
+        print(f"Rations Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/shop', methods=['POST'])
+def generate_shopping_list():
+    """
+    mode='llm' (default): the model writes the whole list, the local solver takes over if it fails.
+    mode='hybrid': the solver builds the list, the model only adds emojis and 'why' lines.
+    mode='fast': solver only, no model call at all.
+    Diets the solver doesn't know (anything beyond vegan, vegetarian, pescatarian and gluten free) always use 'llm'.
+    """
+    try:
+        data = request.json
+        cache_key = shop_cache_key(data)
+        cached = RESPONSE_CACHE.get(cache_key)
+        if cached is not None:
+            return jsonify(cached)
+
+        items, cacheable = make_shopping_list(data, lambda prompt, **kwargs: traced_generate(prompt, 'background', **kwargs).text)
+        if items and cacheable:
+            RESPONSE_CACHE.set(cache_key, items, ttl=SHOP_CACHE_TTL)
         return jsonify(items)
 
     except Exception as e:
         print(f"Shopping List Error: {e}")
-        return jsonify({{"error": str(e)}}), 500
+        return jsonify({"error": str(e)}), 500
         
+@app.route('/api/scan', methods=['POST'])
+def scan_fridge():
+    """
+    Fridge/pantry photos -> inventory items mapped onto the master DB.
+    Multipart 'photos' (or 'photo') files, or JSON {"images": [base64, ...]}; photos are scanned concurrently.
+    """
+    try:
+        photos = [f.read() for f in request.files.getlist('photos') + request.files.getlist('photo')]
+        photos = photos or decode_images(request.get_json(silent=True))
+        if not photos:
+            return jsonify({"error": "No photos uploaded"}), 400
+        if len(photos) > fridge_scan.SCAN_MAX_PHOTOS:
+            return jsonify({"error": f"At most {fridge_scan.SCAN_MAX_PHOTOS} photos per scan"}), 400
+
+        with ThreadPoolExecutor(max_workers=len(photos)) as pool:
+            # Each worker gets its own copy of the request context so spans land on this trace
+            futures = [pool.submit(contextvars.copy_context().run, scan_photo, raw) for raw in photos]
+            results = [future.result() for future in futures]
+        return jsonify(assemble_scan(results))
+
+    except (fridge_scan.UnreadablePhoto, ValueError) as e:
+        return jsonify({"error": f"Unreadable photo: {e}"}), 400
+    except Exception as e:
+        print(f"Fridge Scan Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/inventory/update', methods=['POST'])
 def update_inventory():
+    """Accepts 'recipe', a list of 'recipes', or a whole 'plan' and applies them in one pass."""
     try:
         data = request.json
-        current_inventory = data.get('inventory', [])
-        cooked_recipe = data.get('recipe', {})
-        ingredients_used = cooked_recipe.get('ingredients', [])
-
-        low_stock_items = []
-        
-        # We iterate through the recipe ingredients and find their match in inventory
-        for used_item in ingredients_used:
-            used_name = used_item.get('name', '').lower().strip()
-            used_qty = float(used_item.get('amountValue', 0))
-
-            for inventory_item in current_inventory:
-                inventory_name = inventory_item.get('name', '').lower().strip()
-                
-                # FUZZY MATCH: If 'Oats' is in 'Rolled Oats' OR vice versa
-                if used_name in inventory_name or inventory_name in used_name:
-                    old_qty = float(inventory_item.get('quantity', 0))
-                    new_qty = max(0, old_qty - used_qty)
-                    
-                    inventory_item['quantity'] = round(new_qty, 2)
-
-                    # Trigger low stock alert if under 20%
-                    if 0 < new_qty <= (old_qty * 0.2):
-                        low_stock_items.append(inventory_item['name'])
-                    break 
-
-        # Filter out items that are effectively empty (less than 0.01)
-        final_inventory = [item for item in current_inventory if float(item.get('quantity', 0)) > 0.01]
-
-        return jsonify({
-            "success": True,
-            "updatedInventory": final_inventory,
-            "lowStock": list(set(low_stock_items)) # Remove duplicates
-        })
+        if data.get('userId') and 'inventory' not in data:
+            expected = inventory_version(request.headers.get('If-Match'), data)
+            return jsonify(cook_stored(str(data['userId']), recipes_from_payload(data), expected))
+        result = apply_cooked_recipes(data.get('inventory', []), recipes_from_payload(data))
+        return jsonify(result)
+    except InventoryConflict as e:
+        return jsonify({"error": str(e), "version": e.version}), 412
+    except InvalidVersion as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Inventory Update Error: {e}")
-        return jsonify({{"error": str(e)}}), 500
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/inventory/<user_id>', methods=['GET'])
+def get_inventory(user_id):
+    """The stored inventory and its version (also sent as the ETag)."""
+    version, items = INVENTORY_STORE.load(user_id)
+    response = jsonify({"version": version, "items": items})
+    response.headers['ETag'] = f'"{version}"'
+    return response
+
+@app.route('/api/inventory/<user_id>', methods=['PUT'])
+def put_inventory(user_id):
+    """Full upload, e.g. the first sync from a device that kept its pantry locally."""
+    try:
+        data = request.json
+        expected = inventory_version(request.headers.get('If-Match'), data)
+        version, changes = INVENTORY_STORE.replace(user_id, data.get('items', data.get('inventory', [])), expected)
+        return jsonify({"version": version, "changes": changes})
+    except InventoryConflict as e:
+        return jsonify({"error": str(e), "version": e.version}), 412
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/inventory/<user_id>/delta', methods=['POST'])
+def inventory_delta(user_id):
+    """{"ops": [{"op": "add"|"set"|"consume"|"remove", ...}]} with an optional If-Match version."""
+    try:
+        data = request.json
+        expected = inventory_version(request.headers.get('If-Match'), data)
+        version, changes = INVENTORY_STORE.apply(user_id, data.get('ops', []), expected)
+        return jsonify({"version": version, "changes": changes})
+    except InventoryConflict as e:
+        return jsonify({"error": str(e), "version": e.version}), 412
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/inventory/<user_id>/changes', methods=['GET'])
+def inventory_changes(user_id):
+    """Incremental sync: every change after ?since=<version>."""
+    version, changes = INVENTORY_STORE.changes_since(user_id, request.args.get('since', 0, type=int))
+    return jsonify({"version": version, "changes": changes})
+
+@app.route('/api/batch', methods=['POST'])
+def submit_batch_job():
+    """
+    Recipes or shopping lists for many profiles in one call (households, dorms, meal-prep
+    groups): {"kind": "recipes"|"shop", "userProfiles": [...] or "members": [...], plus the
+    shared "inventory", "mealType", "days", "mode"}. Answers 202 with the job ID at once.
+    """
+    try:
+        return jsonify(submit_batch(request.get_json(silent=True))), 202
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Batch Submit Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/batch/<job_id>')
+def get_batch_job(job_id):
+    """Job status and per-member results; ?since=<cursor> returns only what arrived after the last poll."""
+    page = BATCH.poll(job_id, request.args.get('since', 0, type=int))
+    if page is None:
+        return jsonify({"error": "Batch job not found or expired"}), 404
+    return jsonify(page)
+
+@app.route('/api/batch/<job_id>/stream')
+def stream_batch_job(job_id):
+    """SSE: one `result` event per member as its generation lands, then `done` with the totals."""
+    cursor = request.args.get('since', 0, type=int)
+    if BATCH.poll(job_id, cursor) is None:
+        return jsonify({"error": "Batch job not found or expired"}), 404
+
+    def generate():
+        since = cursor
+        while True:
+            page = BATCH.poll(job_id, since)
+            if page is None:
+                yield sse_event("error", {"error": "Batch job expired"})
+                return
+            for event, payload in batch_jobs.page_events(page):
+                yield sse_event(event, payload)
+            if page['status'] != 'running':
+                return
+            since = page['cursor']
+            BATCH.wait(job_id, since)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --- 6. TRACING HOOKS ---
+@app.before_request
+def begin_trace():
+    telemetry.start_trace(request.method, request.path, request.headers.get('X-Request-ID'))
+
+@app.after_request
+def end_trace(response):
+    trace = telemetry.current_trace()
+    if trace is None:
+        return response
+    # Label by the route template so /api/plan/<plan_id> stays one series
+    trace.route = request.url_rule.rule if request.url_rule else 'unmatched'
+    response.headers['X-Request-ID'] = trace.request_id
+    if response.is_streamed:
+        response.call_on_close(lambda: trace.finish(response.status_code))
+    else:
+        trace.finish(response.status_code, response.content_length)
+    return response
+
+@app.before_request
+def inflate_request():
+    """gzip/br/deflate request bodies are inflated before anything (recorder, routes) reads them."""
+    encoding = request.headers.get('Content-Encoding', 'identity')
+    if encoding.lower() == 'identity':
+        return None
+    try:
+        body = http_payload.decompress(request.environ['wsgi.input'].read(request.content_length or -1), encoding)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 413 if 'too large' in str(e) else 400
+    request.environ.update({'wsgi.input': io.BytesIO(body), 'CONTENT_LENGTH': str(len(body))})
+    request.environ.pop('HTTP_CONTENT_ENCODING', None)
+
+@app.after_request
+def finish_payload(response):
+    """
+    Content-hash ETags (and 304 for a matching If-None-Match) on generated results, then
+    gzip/br for what is still sent. Runs before end_trace, so traces count wire bytes.
+    Streams (SSE) are left alone so every event is flushed as it is produced.
+    """
+    if response.is_streamed:
+        return response
+    route = http_payload.route_template(request.url_rule.rule) if request.url_rule else None
+    # Only our own content-hash tags key the compressed-body cache; a route's tag (an inventory version) doesn't
+    content_tag = None
+    if response.status_code == 200 and route in http_payload.ETAG_ROUTES:
+        tag = response.headers.get('ETag')
+        if tag is None:
+            tag = content_tag = http_payload.etag(response.get_data())
+        response.headers['ETag'] = tag
+        if http_payload.etag_matches(request.headers.get('If-None-Match'), tag):
+            response.status_code = 304
+            response.set_data(b'')
+            return response
+    if http_payload.compressible(response.content_type, response.content_length or 0):
+        response.vary.add('Accept-Encoding')
+        encoding = http_payload.negotiate(request.headers.get('Accept-Encoding'))
+        if encoding and 'Content-Encoding' not in response.headers:
+            response.set_data(http_payload.compress(response.get_data(), encoding, content_tag))
+            response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.before_request
+def begin_recording():
+    if RECORDER is None:
+        return
+    trace = telemetry.current_trace()
+    # Only JSON bodies are read; reading a multipart stream here would starve request.files
+    g.recording = RECORDER.begin(
+        trace.request_id if trace else None, request.method, request.path,
+        {name.lower(): value for name, value in request.headers.items()},
+        request.get_data(cache=True) if request.is_json else None)
+
+@app.after_request
+def end_recording(response):
+    record = g.pop('recording', None)
+    if record is not None:
+        # On close, so streamed answers are timed (and their model call counted) in full
+        route, status, params = request.url_rule.rule if request.url_rule else 'unmatched', response.status_code, request.view_args
+        response.call_on_close(lambda: record.finish(route, status, params))
+    return response
+
+STARTUP["importSeconds"] = round(time.perf_counter() - _IMPORT_STARTED, 3)
 
 if __name__ == '__main__':
+    warm_up()
     # Using the port Render expects
     port = int(os.environ.get("PORT", 5000))
     app.run(host='0.0.0.0', port=port)
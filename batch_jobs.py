@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# --- 1. COHORT TARGETS ---
+ACTIVITY_MULTIPLIERS = {'sedentary': 1.2, 'moderate': 1.55, 'active': 1.725, 'athlete': 1.9}
+FALLBACK_TARGETS = (2000, 130)
+
+def _columns(profiles):
+    """weight, height, age, is-male, activity multiplier and goal columns; raises where get_caloric_needs would fall back."""
+    return (
+        np.array([float(p.get('weight', 70)) for p in profiles]),
+        np.array([float(p.get('height', 170)) for p in profiles]),
+        np.array([int(p.get('age', 20)) for p in profiles], dtype=float),
+        np.array([p.get('gender', 'female').lower() == 'male' for p in profiles], dtype=bool),
+        np.array([ACTIVITY_MULTIPLIERS.get(p.get('activityLevel', 'moderate').lower(), 1.2) for p in profiles]),
+        [p.get('goal', 'energy').lower() for p in profiles],
+    )
+
+def _readable(profile):
+    try:
+        float(profile.get('weight', 70)), float(profile.get('height', 170)), int(profile.get('age', 20))
+        profile.get('gender', 'female').lower(), profile.get('activityLevel', 'moderate').lower()
+        profile.get('goal', 'energy').lower()
+        return True
+    except Exception:
+        return False
+
+def cohort_targets(profiles):
+    """
+    get_caloric_needs for a whole cohort in one NumPy pass: an (n, 2) int array of
+    daily calories and protein grams. Same Mifflin-St Jeor maths, defaults and
+    rounding; a profile it can't read gets the same 2000 kcal / 130 g fallback.
+    """
+    targets = np.empty((len(profiles), 2), dtype=int)
+    try:
+        valid = np.ones(len(profiles), dtype=bool)
+        columns = _columns(profiles)
+    except Exception:
+        # Some profile is unreadable: find which ones, then compute the rest
+        valid = np.array([_readable(p) for p in profiles], dtype=bool)
+        columns = _columns([p for p, ok in zip(profiles, valid) if ok])
+    targets[~valid] = FALLBACK_TARGETS
+    if not valid.any():
+        return targets
+
+    weight, height, age, male, multiplier, goals = columns
+    loss = np.array(["loss" in goal or "weight" in goal for goal in goals], dtype=bool)
+    muscle = ~loss & np.array(["muscle" in goal or "bulk" in goal for goal in goals], dtype=bool)
+
+    tdee = (10 * weight + 6.25 * height - 5 * age + np.where(male, 5, -161)) * multiplier
+    calories = np.select([loss, muscle], [tdee - 500, tdee + 400], tdee)
+    protein = weight * np.select([loss, muscle], [2.0, 2.2], 1.6)
+    # np.rint rounds halves to even, exactly like round()
+    targets[valid] = np.rint(np.column_stack([calories, protein]))
+    return targets
+
+# --- 2. EFFECTIVE PROMPTS ---
+# Body metrics are folded into the targets and identity fields don't change the food,
+# so neither goes into a shared prompt
+BODY_FIELDS = ('weight', 'height', 'age', 'gender', 'activityLevel')
+IDENTITY_FIELDS = ('name', 'userId', 'id', 'email')
+# Shared generations cook to targets rounded to these steps, so near-identical people share one
+CALORIE_STEP = int(os.environ.get("MANNA_BATCH_CALORIE_STEP", 50))
+PROTEIN_STEP = int(os.environ.get("MANNA_BATCH_PROTEIN_STEP", 5))
+
+def effective_profile(profile):
+    return {k: v for k, v in profile.items() if k not in BODY_FIELDS + IDENTITY_FIELDS}
+
+def shared_targets(calories, protein):
+    return (int(round(calories / CALORIE_STEP) * CALORIE_STEP) if CALORIE_STEP > 1 else int(calories),
+            int(round(protein / PROTEIN_STEP) * PROTEIN_STEP) if PROTEIN_STEP > 1 else int(protein))
+
+# --- 3. JOBS ---
+class BatchJob:
+    """
+    One submitted batch. `state` is the JSON the poll route pages through: one result
+    per member, appended in completion order, so `?since=<cursor>` returns only news.
+    """
+
+    def __init__(self, kind, members, generations):
+        self.id = uuid.uuid4().hex
+        self.progress = threading.Condition()
+        self.state = {
+            "jobId": self.id,
+            "kind": kind,
+            "status": "running",
+            "total": len(members),
+            "completed": 0,
+            "failed": 0,
+            "generations": generations,
+            "cohort": {
+                "calories": sum(m["targets"]["calories"] for m in members),
+                "protein": sum(m["targets"]["protein"] for m in members),
+            },
+            "createdAt": time.time(),
+            "finishedAt": None,
+            "results": [],
+        }
+        self.members = members
+        # Results already written to the BatchStore, and one writer at a time so they go in order
+        self.persisted = 0
+        self.persist_lock = threading.Lock()
+
+    def record(self, indexes, result=None, error=None):
+        with self.progress:
+            for index in indexes:
+                entry = {**self.members[index], "sharedWith": len(indexes)}
+                if error is None:
+                    entry["result"] = result
+                    self.state["completed"] += 1
+                else:
+                    entry["error"] = error
+                    self.state["failed"] += 1
+                self.state["results"].append(entry)
+            if self.state["completed"] + self.state["failed"] >= self.state["total"]:
+                self.state["status"] = "done"
+                self.state["finishedAt"] = time.time()
+            self.progress.notify_all()
+
+    def snapshot(self):
+        with self.progress:
+            return {**self.state, "cohort": dict(self.state["cohort"]), "results": list(self.state["results"])}
+
+def page(state, since=0):
+    """The job summary plus the results after `since`; `cursor` is what to pass next time."""
+    since = max(0, int(since or 0))
+    return {**state, "cursor": len(state["results"]), "results": state["results"][since:]}
+
+def page_events(state):
+    """SSE (event, data) pairs for a page: one 'result' per member, then 'done' once the job is."""
+    events = [("result", entry) for entry in state["results"]]
+    if state["status"] != "running":
+        events.append(("done", {k: v for k, v in state.items() if k != "results"}))
+    return events
+
+# --- 4. CROSS-WORKER STORE ---
+class BatchStore:
+    """
+    Batch progress in the MANNA_CACHE_DB SQLite file, in tables of its own so jobs never
+    evict cached responses. An update writes the job summary and only the results added
+    since the previous update; rows go once the job's TTL has passed.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_db(self):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS batch_jobs ("
+                    " job_id TEXT PRIMARY KEY, summary TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS batch_results ("
+                    " job_id TEXT NOT NULL, seq INTEGER NOT NULL, entry TEXT NOT NULL, PRIMARY KEY (job_id, seq))"
+                )
+            self.expire()
+        except sqlite3.Error as e:
+            print(f"Batch DB Error (jobs stay in this worker): {e}")
+            self.db_path = None
+
+    def save(self, job_id, summary, first_seq, entries, expires_at):
+        if not self.db_path:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO batch_jobs (job_id, summary, expires_at) VALUES (?, ?, ?)",
+                    (job_id, json.dumps(summary), expires_at),
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO batch_results (job_id, seq, entry) VALUES (?, ?, ?)",
+                    [(job_id, first_seq + i, json.dumps(entry)) for i, entry in enumerate(entries)],
+                )
+        except sqlite3.Error as e:
+            print(f"Batch DB Error: {e}")
+
+    def page(self, job_id, since=0):
+        """Same shape as page(), read straight from SQLite; None for an unknown or expired job."""
+        if not self.db_path:
+            return None
+        since = max(0, int(since or 0))
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT summary FROM batch_jobs WHERE job_id = ? AND expires_at >= ?", (job_id, time.time())
+                ).fetchone()
+                if row is None:
+                    return None
+                entries = conn.execute(
+                    "SELECT entry FROM batch_results WHERE job_id = ? AND seq >= ? ORDER BY seq", (job_id, since)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Batch DB Error: {e}")
+            return None
+        summary = json.loads(row[0])
+        # Every member gets exactly one entry, completed or failed
+        return {**summary, "cursor": summary["completed"] + summary["failed"],
+                "results": [json.loads(entry) for (entry,) in entries]}
+
+    def expire(self):
+        if not self.db_path:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM batch_results WHERE job_id IN"
+                             " (SELECT job_id FROM batch_jobs WHERE expires_at < ?)", (time.time(),))
+                conn.execute("DELETE FROM batch_jobs WHERE expires_at < ?", (time.time(),))
+        except sqlite3.Error as e:
+            print(f"Batch DB Error: {e}")
+
+# --- 5. THE RUNNER ---
+class BatchRunner:
+    """
+    Fans the generations of every batch out over one bounded pool, largest groups
+    first so most members get their result early. Jobs live in this process; with a
+    shared SQLite file (MANNA_CACHE_DB) each update also goes to a BatchStore, so any
+    gunicorn worker can answer a poll.
+    """
+
+    def __init__(self, db_path=None, max_workers=8, ttl=3600):
+        self.store = BatchStore(db_path) if db_path else None
+        self.ttl = ttl
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch")
+        self.max_workers = max_workers
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.counters = {"jobs": 0, "members": 0, "generations": 0, "failedGenerations": 0}
+
+    def submit(self, kind, members, groups, run):
+        """
+        `members`: per-member metadata (index, userId, targets). `groups`: (key, data,
+        targets, member indexes) per distinct effective prompt. `run(data, targets, key)`
+        produces one group's result in a pool thread.
+        """
+        job = BatchJob(kind, members, len(groups))
+        if self.store is not None:
+            self.store.expire()
+        with self._lock:
+            self._expire()
+            self._jobs[job.id] = job
+            self.counters["jobs"] += 1
+            self.counters["members"] += len(members)
+            self.counters["generations"] += len(groups)
+        self._persist(job)
+        for key, data, targets, indexes in sorted(groups, key=lambda group: -len(group[3])):
+            self.pool.submit(self._run, job, run, key, data, targets, indexes)
+        return job.snapshot()
+
+    def _run(self, job, run, key, data, targets, indexes):
+        try:
+            job.record(indexes, result=run(data, targets, key))
+        except Exception as e:
+            print(f"Batch Generation Error ({job.id}): {e}")
+            with self._lock:
+                self.counters["failedGenerations"] += 1
+            job.record(indexes, error=str(e))
+        self._persist(job)
+
+    def _persist(self, job):
+        if self.store is None:
+            return
+        with job.persist_lock:
+            with job.progress:
+                summary = {k: v for k, v in job.state.items() if k != "results"}
+                first, entries = job.persisted, job.state["results"][job.persisted:]
+                job.persisted += len(entries)
+            self.store.save(job.id, summary, first, entries, time.time() + self.ttl)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.state["finishedAt"] is not None and job.state["finishedAt"] < cutoff]:
+            del self._jobs[job_id]
+
+    def poll(self, job_id, since=0):
+        """A page of the job (see page()), or None for an unknown or expired ID."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return page(job.snapshot(), since)
+        return self.store.page(job_id, since) if self.store is not None else None
+
+    def wait(self, job_id, cursor, timeout=1.0):
+        """Blocks until the job has results past `cursor` or finishes; a job from another worker is just slept on."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            time.sleep(timeout)
+            return
+        with job.progress:
+            job.progress.wait_for(lambda: len(job.state["results"]) > cursor or job.state["status"] != "running",
+                                  timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job.state["status"] == "running")
+            return {**self.counters, "running": running, "queued": self.pool._work_queue.qsize(),
+                    "maxWorkers": self.max_workers}
+
+def runner_from_env(db_path=None):
+    """MANNA_BATCH_PARALLEL (generations in flight per worker) / MANNA_BATCH_TTL (seconds a finished job stays pollable)."""
+    return BatchRunner(
+        db_path,
+        max_workers=int(os.environ.get("MANNA_BATCH_PARALLEL", 8)),
+        ttl=int(os.environ.get("MANNA_BATCH_TTL", 3600)),
+    )
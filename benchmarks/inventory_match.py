@@ -0,0 +1,80 @@
+"""
+Inventory matching benchmark: the old nested substring loop vs InventoryMatcher,
+on 1k-item pantries, for one recipe and for a whole week (21 recipes) in one pass.
+
+    python benchmarks/inventory_match.py
+"""
+import os
+import sys
+import copy
+import random
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json
+from ingredient_index import IngredientIndex
+from inventory_matcher import apply_recipes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+with open(os.path.join(ROOT, 'ingredients_master.json')) as f:
+    MASTER = json.load(f)
+INDEX = IngredientIndex(MASTER)
+
+BRANDS = ["Organic", "Fresh", "Store", "Family", "Value", "Farm", "Premium", "Local"]
+
+
+def legacy_update(current_inventory, ingredients_used):
+    """The pre-index algorithm from update_inventory, kept for comparison."""
+    for used_item in ingredients_used:
+        used_name = used_item.get('name', '').lower().strip()
+        used_qty = float(used_item.get('amountValue', 0))
+        for inventory_item in current_inventory:
+            inventory_name = inventory_item.get('name', '').lower().strip()
+            if used_name in inventory_name or inventory_name in used_name:
+                old_qty = float(inventory_item.get('quantity', 0))
+                inventory_item['quantity'] = round(max(0, old_qty - used_qty), 2)
+                break
+    return [item for item in current_inventory if float(item.get('quantity', 0)) > 0.01]
+
+
+def make_inventory(size, rng):
+    items = []
+    for i in range(size):
+        entry = MASTER[i % len(MASTER)]
+        name = entry['name'] if i < len(MASTER) else f"{rng.choice(BRANDS)} {entry['name']} #{i}"
+        items.append({"name": name, "quantity": 1000, "unit": entry['typical_unit'], "daysLeft": rng.randint(1, 30)})
+    return items
+
+
+def make_recipe(rng, size=12):
+    picks = rng.sample(MASTER, size)
+    return {"ingredients": [{"name": e['name'], "amountValue": 1, "unit": e['typical_unit']} for e in picks]}
+
+
+def bench(label, fn, number):
+    seconds = timeit.timeit(fn, number=number) / number
+    print(f"{label:<46}{seconds * 1000:>10.2f} ms")
+    return seconds
+
+
+def main():
+    rng = random.Random(7)
+    for size in (10, 100, 1000):
+        inventory = make_inventory(size, rng)
+        recipe = make_recipe(rng)
+        week = [make_recipe(rng) for _ in range(21)]
+        # Put the recipe items at the end of the pantry: the legacy loop's worst case.
+        inventory.reverse()
+        number = 50 if size < 1000 else 10
+
+        print(f"--- {size} inventory items ---")
+        bench("legacy, 1 recipe", lambda: legacy_update(copy.deepcopy(inventory), recipe['ingredients']), number)
+        bench("indexed, 1 recipe", lambda: apply_recipes(copy.deepcopy(inventory), [recipe], INDEX), number)
+        bench("legacy, 21 recipes (21 requests)",
+              lambda: [legacy_update(copy.deepcopy(inventory), r['ingredients']) for r in week], max(1, number // 5))
+        bench("indexed, 21 recipes (1 bulk pass)", lambda: apply_recipes(copy.deepcopy(inventory), week, INDEX), number)
+
+
+if __name__ == "__main__":
+    main()
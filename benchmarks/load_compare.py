@@ -0,0 +1,105 @@
+"""
+Load comparison: gunicorn sync workers (current Procfile) vs the ASGI app, both
+backed by the local FakeModel so no Gemini quota is spent.
+
+    python benchmarks/load_compare.py --latency 2 --requests 200 --concurrency 100
+
+Each request carries a different inventory so the response cache never hides the model,
+and every inventory covers FakeModel's recipe so its answer validates first time: one
+model call per request, as in normal traffic, not the validator's re-call path.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    "sync (gunicorn, {workers} workers)": ["gunicorn", "backend_real_api:app", "-w", "{workers}"],
+    "async (uvicorn worker, 1 process)": ["gunicorn", "backend_async_api:app", "-w", "1", "-k", "uvicorn.workers.UvicornWorker"],
+}
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return True
+        except Exception:
+            time.sleep(0.2)
+    return False
+
+
+def post_recipe(base_url, i):
+    body = json.dumps({
+        "inventory": [{"name": "Eggs", "quantity": 10 + i, "unit": "pcs", "daysLeft": 5},
+                      {"name": "Spinach", "quantity": 200, "unit": "g", "daysLeft": 2}],
+        "userProfile": {"daysRemaining": 5},
+        "mealType": "Lunch",
+    }).encode("utf-8")
+    req = urllib.request.Request(base_url + "/api/recipes", data=body, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=600) as resp:
+            resp.read()
+            ok = resp.status == 200
+    except Exception:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run_load(base_url, total, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda i: post_recipe(base_url, i), range(total)))
+    wall = time.perf_counter() - start
+    latencies = sorted(r[0] for r in results)
+    errors = sum(1 for r in results if not r[1])
+    return {
+        "throughput_rps": round(total / wall, 1),
+        "p50_s": round(statistics.median(latencies), 2),
+        "p95_s": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "errors": errors,
+        "wall_s": round(wall, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=2.0, help="fake model latency in seconds")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=2, help="sync worker count to compare against")
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+
+    env = dict(os.environ, MANNA_FAKE_MODEL_LATENCY=str(args.latency), PYTHONWARNINGS="ignore")
+    base_url = f"http://127.0.0.1:{args.port}"
+    report = {}
+
+    for label, cmd in SERVERS.items():
+        label = label.format(workers=args.workers)
+        cmd = [part.format(workers=args.workers) for part in cmd] + ["-b", f"127.0.0.1:{args.port}", "--timeout", "600"]
+        proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not wait_until_up(base_url + "/"):
+                print(f"❌ {label} did not start")
+                continue
+            report[label] = run_load(base_url, args.requests, args.concurrency)
+            print(f"{label}: {report[label]}")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    return report
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
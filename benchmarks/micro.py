@@ -0,0 +1,297 @@
+"""
+Microbenchmarks for the CPU side of the backend: prompt building, JSON cleaning,
+inventory matching, the bio-calculator (per profile and per cohort) and whole requests through the Flask test
+client with a zero-latency FakeModel. Results are compared against a JSON baseline
+so a regression shows up as a ratio, not a feeling.
+
+    python benchmarks/micro.py                    # run, compare with the baseline
+    python benchmarks/micro.py --save             # run, write the baseline
+    python benchmarks/micro.py -k prompt --check  # subset; exit 1 on a regression
+
+Every case is timed asv-style: autorange picks a loop count worth ~0.2s, then
+--repeat rounds of it; the median per call is what gets compared (min and stdev
+are kept to judge the noise). Baselines are machine-specific, refresh them with
+--save on the machine you compare on.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import timeit
+import argparse
+import platform
+import tempfile
+import itertools
+import contextlib
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+BASELINE = os.path.join(ROOT, "benchmarks", "baselines", "micro.json")
+
+# The backend reads these at import: no model latency, no request log, a scratch store
+SCRATCH = tempfile.TemporaryDirectory()
+os.environ.update(MANNA_FAKE_MODEL_LATENCY="0", MANNA_REQUEST_LOG="0",
+                  MANNA_INVENTORY_DB=os.path.join(SCRATCH.name, "inventory.db"))
+for name in ("MANNA_CACHE_DB", "MANNA_RECORD_CASSETTE", "MANNA_REPLAY_CASSETTE"):
+    os.environ.pop(name, None)
+
+DEVNULL = open(os.devnull, "w")
+with contextlib.redirect_stdout(DEVNULL):
+    import backend_real_api as api
+from fake_model import FAKE_RECIPE, FAKE_SHOPPING_LIST  # noqa: E402
+
+BRANDS = ["Organic", "Fresh", "Store", "Family", "Value", "Farm", "Premium", "Local"]
+
+PROFILE = {
+    "weight": 72, "height": 178, "age": 21, "gender": "male", "activityLevel": "moderate",
+    "goal": "Build Muscle", "diet": "Vegetarian", "vibe": "Speed", "daysRemaining": 5,
+    "tastes": {"flavors": ["Spicy", "Tangy"], "seasoning": "Bold", "breakfastStyle": "Savory"},
+}
+
+
+# --- 1. FIXTURES ---
+def make_inventory(size, seed=7):
+    """`size` pantry items: master names first, then branded variants of them."""
+    rng = random.Random(seed)
+    master = api.INGREDIENTS_MASTER
+    items = []
+    for i in range(size):
+        entry = master[i % len(master)]
+        name = entry['name'] if i < len(master) else f"{rng.choice(BRANDS)} {entry['name']} #{i}"
+        items.append({"name": name, "quantity": 1000, "unit": entry['typical_unit'], "daysLeft": rng.randint(1, 30)})
+    return items
+
+
+def make_week(seed=7, recipes=21, size=8):
+    rng = random.Random(seed)
+    return [{"ingredients": [{"name": e['name'], "amountValue": 1, "unit": e['typical_unit']}
+                             for e in rng.sample(api.INGREDIENTS_MASTER, size)]} for _ in range(recipes)]
+
+
+RECIPES_JSON = json.dumps([dict(FAKE_RECIPE, id=f"r{i}") for i in range(3)], indent=2)
+MODEL_OUTPUTS = {
+    "clean": RECIPES_JSON,
+    "fenced": f"```json\n{RECIPES_JSON}\n```",
+    "chatty": f"Sure! Here are three meals for your pantry:\n```json\n{RECIPES_JSON}\n```\nEnjoy, and tell me if you want swaps [or a dessert].",
+    "truncated": RECIPES_JSON[: len(RECIPES_JSON) * 2 // 3],
+    "shopping": "Here is your list: " + json.dumps(FAKE_SHOPPING_LIST),
+}
+
+PROFILE_GRID = [
+    {"weight": w, "height": h, "age": a, "gender": g, "activityLevel": act, "goal": goal}
+    for w, h, a, g, act, goal in itertools.product(
+        (50, 70, 95), (160, 180), (19, 35, 60), ("male", "female"),
+        ("sedentary", "moderate", "active", "athlete"), ("Weight Loss", "Build Muscle", "Energy"))
+]
+
+
+# --- 2. THE CASES ---
+# name -> setup() returning the zero-argument callable that gets timed
+CASES = {}
+
+
+def case(name):
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+for _size in (10, 100, 1000):
+    @case(f"prompt.recipe[{_size} items]")
+    def _recipe_prompt(size=_size):
+        data = {"inventory": make_inventory(size), "userProfile": PROFILE, "mealType": "Lunch"}
+        return lambda: api.build_recipe_prompt(data)
+
+for _diet in ("None", "Vegetarian", "Vegan"):
+    @case(f"prompt.shop[{_diet}]")
+    def _shop_prompt(diet=_diet):
+        data = {"userProfile": dict(PROFILE, diet=diet), "days": 7}
+        return lambda: api.build_shop_prompt(data)
+
+for _kind in MODEL_OUTPUTS:
+    @case(f"clean_json[{_kind}]")
+    def _clean_json(kind=_kind):
+        text = MODEL_OUTPUTS[kind]
+
+        def run():
+            # The truncated case prints its failure; keep that out of the timings' output
+            with contextlib.redirect_stdout(DEVNULL):
+                return api.clean_gemini_json(text)
+        return run
+
+for _size in (10, 100, 1000):
+    @case(f"update_inventory[{_size} items, 21 recipes]")
+    def _update_inventory(size=_size):
+        inventory, week = make_inventory(size), make_week()
+        return lambda: api.apply_cooked_recipes(copy.deepcopy(inventory), week)
+
+
+@case(f"caloric_needs[{len(PROFILE_GRID)} profiles]")
+def _caloric_needs():
+    return lambda: [api.get_caloric_needs(profile) for profile in PROFILE_GRID]
+
+
+@case(f"cohort_targets[{len(PROFILE_GRID)} profiles]")
+def _cohort_targets():
+    return lambda: api.batch_jobs.cohort_targets(PROFILE_GRID)
+
+
+def request_inventory():
+    """A pantry that covers FakeModel's recipe, so its answer validates (and gets cached) as a real one would."""
+    return [{"name": "Eggs", "quantity": 10, "unit": "pcs", "daysLeft": 9},
+            {"name": "Spinach", "quantity": 200, "unit": "g", "daysLeft": 2}] + make_inventory(10)
+
+
+def _poster(path, payload):
+    client = api.app.test_client()
+    return lambda: client.post(path, json=payload() if callable(payload) else payload).get_data()
+
+
+@case("request.recipes[model]")
+def _request_recipes():
+    # A new quantity every call and 'fresh' so neither the cache nor recipe reuse answers
+    counter = itertools.count()
+    inventory = request_inventory()
+    return _poster("/api/recipes", lambda: {
+        "inventory": inventory + [{"name": "Rice", "quantity": 500 + next(counter), "unit": "g"}],
+        "userProfile": PROFILE, "mealType": "Lunch", "fresh": True})
+
+
+@case("request.recipes[cache hit]")
+def _request_recipes_cached():
+    payload = {"inventory": request_inventory(), "userProfile": PROFILE, "mealType": "Dinner"}
+    run = _poster("/api/recipes", payload)
+    run()
+    return run
+
+
+@case("request.recipes_stream[model]")
+def _request_stream():
+    counter = itertools.count()
+    inventory = request_inventory()
+    return _poster("/api/recipes/stream", lambda: {
+        "inventory": inventory + [{"name": "Rice", "quantity": 500 + next(counter), "unit": "g"}],
+        "userProfile": PROFILE, "mealType": "Lunch", "fresh": True})
+
+
+@case("request.shop[local]")
+def _request_shop():
+    counter = itertools.count()
+    return _poster("/api/shop", lambda: {"userProfile": dict(PROFILE, weight=60 + next(counter) / 1000), "days": 7})
+
+
+@case("request.plan[model]")
+def _request_plan():
+    # A new pantry every call so the plan cache never answers: three window generations each
+    counter = itertools.count()
+    inventory = request_inventory()
+    return _poster("/api/plan", lambda: {
+        "inventory": inventory + [{"name": "Rice", "quantity": 500 + next(counter), "unit": "g"}],
+        "userProfile": PROFILE, "days": 7})
+
+
+@case("request.inventory_update[100 items]")
+def _request_update():
+    return _poster("/api/inventory/update", {"inventory": make_inventory(100), "recipes": make_week(recipes=3)})
+
+
+# --- 3. RUNNER ---
+def measure(fn, repeat):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    runs = [seconds / number for seconds in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "median_us": round(statistics.median(runs) * 1e6, 2),
+        "min_us": round(min(runs) * 1e6, 2),
+        "stdev_us": round(statistics.stdev(runs) * 1e6, 2) if len(runs) > 1 else 0.0,
+        "loops": number,
+        "repeat": repeat,
+    }
+
+
+def machine():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or None,
+        "cpus": os.cpu_count(),
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%d"),
+    }
+
+
+def compare(results, baseline, threshold):
+    """(name, old, new, ratio) for every case in both runs, and the names slower than the threshold."""
+    rows, regressions = [], []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        ratio = result["median_us"] / old["median_us"] if old["median_us"] else float("inf")
+        rows.append((name, old["median_us"], result["median_us"], ratio))
+        if ratio > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-k", dest="pattern", help="only cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=1.25, help="median ratio that counts as a regression")
+    parser.add_argument("--check", action="store_true", help="exit 1 when a case regressed")
+    parser.add_argument("--out", help="also write this run's JSON here")
+    args = parser.parse_args()
+
+    results = {}
+    for name, setup in CASES.items():
+        if args.pattern and args.pattern not in name:
+            continue
+        results[name] = measure(setup(), args.repeat)
+        print(f"{name:<44}{results[name]['median_us']:>12.1f} µs  (±{results[name]['stdev_us']:.1f})")
+
+    report = {"machine": machine(), "results": results}
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows, regressions = compare(results, baseline["results"], args.threshold)
+        print(f"\nvs baseline {baseline['machine'].get('commit')} ({baseline['machine'].get('date')}):")
+        for name, old, new, ratio in rows:
+            flag = "  ❌ slower" if name in regressions else ("  ✅ faster" if ratio < 1 / args.threshold else "")
+            print(f"{name:<44}{old:>12.1f} → {new:>10.1f} µs  x{ratio:.2f}{flag}")
+
+    if args.save:
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                saved = json.load(f)["results"]
+        # A -k run only refreshes its own cases
+        saved.update(results)
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"machine": report["machine"], "results": saved}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nbaseline written to {os.path.relpath(args.baseline, ROOT)}")
+
+    return not (args.check and regressions)
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,68 @@
+"""
+Bytes on the wire for typical response payloads: the old Flask JSON (sorted keys,
+ASCII-escaped emoji) vs compact UTF-8 from http_payload, then gzip and brotli, and
+what a revalidated 304 costs. Also serialization time, json vs orjson.
+
+    python benchmarks/payload_size.py
+
+Brotli is reported when the brotli package is installed.
+"""
+import os
+import sys
+import json
+import timeit
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MANNA_FAKE_MODEL_LATENCY", "0")
+os.environ.setdefault("MANNA_REQUEST_LOG", "0")
+
+with contextlib.redirect_stdout(open(os.devnull, "w")):
+    import backend_real_api as api
+import http_payload
+from fake_model import FAKE_RECIPE
+from micro import PROFILE, make_inventory, make_week
+
+
+def legacy_dumps(obj):
+    """What Flask's default provider sent: sorted keys, compact, non-ASCII escaped."""
+    return json.dumps(obj, sort_keys=True, separators=(",", ":")).encode("ascii")
+
+
+def payloads():
+    week = make_week(recipes=3)
+    yield "recipe", FAKE_RECIPE
+    for days in (7, 14):
+        data = {"userProfile": PROFILE, "days": days}
+        yield f"shop list ({days} days)", api.solved_shopping_list(data)
+    for size in (50, 200):
+        yield f"inventory/update echo ({size} items)", api.apply_cooked_recipes(make_inventory(size), week)
+    yield "inventory GET (200 items)", {"version": 12, "items": make_inventory(200)}
+
+
+def ms(fn, number=200):
+    return timeit.timeit(fn, number=number) / number * 1000
+
+
+def main():
+    encodings = http_payload.supported_encodings()
+    print(f"{'payload':<34}{'old':>8}{'new':>8}" + "".join(f"{e:>8}" for e in encodings)
+          + f"{'304':>6}{'saved':>8}   json ms / orjson ms")
+    report = {}
+    for name, obj in payloads():
+        old, new = legacy_dumps(obj), http_payload.dumps(obj)
+        sizes = {"old": len(old), "new": len(new)}
+        for encoding in encodings:
+            sizes[encoding] = len(http_payload.compress(new, encoding))
+        best = min(sizes[e] for e in encodings)
+        sizes["saved_pct"] = round(100 * (1 - best / len(old)), 1)
+        sizes["json_ms"] = round(ms(lambda: legacy_dumps(obj)), 3)
+        sizes["orjson_ms"] = round(ms(lambda: http_payload.dumps(obj)), 3)
+        report[name] = sizes
+        print(f"{name:<34}{sizes['old']:>8}{sizes['new']:>8}" + "".join(f"{sizes[e]:>8}" for e in encodings)
+              + f"{0:>6}{sizes['saved_pct']:>7}%   {sizes['json_ms']:.3f} / {sizes['orjson_ms']:.3f}")
+    return report
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
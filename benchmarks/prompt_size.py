@@ -0,0 +1,81 @@
+"""
+Prompt-size report: bytes and estimated tokens per endpoint, comparing the old
+"dump all of INGREDIENTS_MASTER" prompts with the relevance-pruned slices.
+
+    python benchmarks/prompt_size.py
+"""
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend_real_api as api
+
+# Rough rule of thumb for Gemini/GPT tokenizers on English + JSON text.
+CHARS_PER_TOKEN = 4
+
+SAMPLE_PROFILE = {
+    "name": "Sam", "weight": 72, "height": 178, "age": 21, "gender": "male",
+    "activityLevel": "moderate", "goal": "Build Muscle", "diet": "Vegetarian",
+    "vibe": "Speed", "daysRemaining": 5,
+    "tastes": {"flavors": ["Spicy", "Tangy"], "seasoning": "Bold", "breakfastStyle": "Savory"},
+}
+
+SAMPLE_INVENTORY = [
+    {"name": "Eggs", "quantity": 10, "unit": "pcs", "daysLeft": 9},
+    {"name": "Spinach", "quantity": 200, "unit": "g", "daysLeft": 2},
+    {"name": "Rolled Oats", "quantity": 900, "unit": "g", "daysLeft": 120},
+    {"name": "Greek Yogurt", "quantity": 500, "unit": "g", "daysLeft": 6},
+    {"name": "Cherry Tomatoes", "quantity": 250, "unit": "g", "daysLeft": 4},
+    {"name": "Basmati Rice", "quantity": 1000, "unit": "g", "daysLeft": 300},
+    {"name": "Firm Tofu", "quantity": 400, "unit": "g", "daysLeft": 5},
+    {"name": "Red Bell Pepper", "quantity": 2, "unit": "pcs", "daysLeft": 6},
+    {"name": "Garlic", "quantity": 1, "unit": "pcs", "daysLeft": 30},
+    {"name": "Lemon", "quantity": 2, "unit": "pcs", "daysLeft": 12},
+    {"name": "Olive Oil", "quantity": 500, "unit": "ml", "daysLeft": 365},
+    {"name": "Cheddar Cheese", "quantity": 200, "unit": "g", "daysLeft": 14},
+]
+
+
+class FullDumpIndex:
+    """Stands in for MASTER_INDEX to reproduce the old prompts (whole file, re-dumped)."""
+
+    def prompt_slice(self, inventory):
+        return json.dumps(api.INGREDIENTS_MASTER)
+
+    def shopping_slice(self, diet=None, tastes=None, per_category=6):
+        return json.dumps(api.INGREDIENTS_MASTER)
+
+
+def measure(builder, data):
+    prompt = builder(data)
+    size = len(prompt.encode("utf-8"))
+    return size, round(len(prompt) / CHARS_PER_TOKEN)
+
+
+def report():
+    cases = {
+        "/api/recipes": (api.build_recipe_prompt, {"inventory": SAMPLE_INVENTORY, "userProfile": SAMPLE_PROFILE, "mealType": "Dinner"}),
+        "/api/shop": (api.build_shop_prompt, {"userProfile": SAMPLE_PROFILE, "days": 7}),
+    }
+    rows = []
+    pruned_index = api.MASTER_INDEX
+    for route, (builder, data) in cases.items():
+        api.MASTER_INDEX = FullDumpIndex()
+        try:
+            before = measure(builder, data)
+        finally:
+            api.MASTER_INDEX = pruned_index
+        after = measure(builder, data)
+        rows.append((route, before, after))
+
+    print(f"{'route':<14}{'before B':>10}{'after B':>10}{'before tok':>12}{'after tok':>11}{'saved':>8}")
+    for route, (b_bytes, b_tok), (a_bytes, a_tok) in rows:
+        saved = 100 * (1 - a_bytes / b_bytes)
+        print(f"{route:<14}{b_bytes:>10}{a_bytes:>10}{b_tok:>12}{a_tok:>11}{saved:>7.1f}%")
+    return rows
+
+
+if __name__ == "__main__":
+    report()
@@ -0,0 +1,189 @@
+"""
+Replays a recorded traffic cassette (MANNA_RECORD_CASSETTE, see traffic_recorder.py)
+against the backend. The server gets MANNA_REPLAY_CASSETTE, so its model is a stub that
+answers every prompt with the recorded answer after the recorded latency: real request
+mix, real prompts and parsing, no Gemini quota.
+
+    python benchmarks/replay.py traffic.jsonl --server async --rate 50 --concurrency 100
+    python benchmarks/replay.py traffic.jsonl --url http://127.0.0.1:5000   # already running
+
+--rate is requests per second (0 keeps the recorded pacing, divided by --speed).
+--speed divides recorded model latencies as well, to squeeze a long recording.
+Requests recorded without a body (photo uploads) are not replayed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from traffic_recorder import read_cassette  # noqa: E402
+
+SERVERS = {
+    "sync": ["gunicorn", "backend_real_api:app", "-w", "{workers}", "-k", "gthread", "--threads", "8"],
+    "async": ["gunicorn", "backend_async_api:app", "-w", "{workers}", "-k", "uvicorn.workers.UvicornWorker"],
+}
+
+
+def wait_until_ready(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as resp:
+                if resp.status == 200:
+                    return True
+        except Exception:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def replayable(entries):
+    requests = [e for e in entries if e.get("type") == "request" and not e.get("skipped")]
+    return sorted(requests, key=lambda e: e.get("t", 0))
+
+
+def send(base_url, entry):
+    body = json.dumps(entry["body"]).encode("utf-8") if entry.get("body") is not None else None
+    headers = dict(entry.get("headers") or {})
+    if body is not None:
+        headers.setdefault("content-type", "application/json")
+    req = urllib.request.Request(base_url + entry["path"], data=body, headers=headers, method=entry["method"])
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=600) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        e.read()
+        status = e.code
+    except Exception:
+        status = None
+    return time.perf_counter() - start, status
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, max(0, int(round(q * len(values))) - 1))]
+
+
+def run_replay(base_url, requests, rate, speed, concurrency):
+    """Sends every request at its scheduled offset; returns (results, wall seconds)."""
+    if rate > 0:
+        offsets = [i / rate for i in range(len(requests))]
+    else:
+        first = requests[0].get("t", 0)
+        offsets = [(e.get("t", 0) - first) / speed for e in requests]
+
+    results = [None] * len(requests)
+    start = time.perf_counter()
+
+    def fire(i):
+        results[i] = send(base_url, requests[i])
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i, offset in enumerate(offsets):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(fire, i)
+    return results, time.perf_counter() - start
+
+
+def summarize(requests, results, wall):
+    """Per recorded route: throughput, latency percentiles, errors and status drift."""
+    routes = {}
+    for entry, (seconds, status) in zip(requests, results):
+        route = routes.setdefault(f"{entry['method']} {entry.get('route') or entry['path']}",
+                                  {"latencies": [], "errors": 0, "mismatched": 0})
+        route["latencies"].append(seconds)
+        if status is None or status >= 500:
+            route["errors"] += 1
+        if status != entry.get("status"):
+            route["mismatched"] += 1
+
+    report = {}
+    for name, route in sorted(routes.items()):
+        latencies = sorted(route["latencies"])
+        count = len(latencies)
+        report[name] = {
+            "requests": count,
+            "throughput_rps": round(count / wall, 2),
+            "p50_ms": round(statistics.median(latencies) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+            "errors": route["errors"],
+            "error_rate": round(route["errors"] / count, 4),
+            "status_mismatches": route["mismatched"],
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("cassette")
+    parser.add_argument("--server", choices=sorted(SERVERS), default="async")
+    parser.add_argument("--url", help="replay against an already running server instead (it needs MANNA_REPLAY_CASSETTE)")
+    parser.add_argument("--rate", type=float, default=0.0, help="requests per second; 0 keeps the recorded pacing")
+    parser.add_argument("--speed", type=float, default=1.0, help="divides recorded pacing and model latencies")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=5057)
+    parser.add_argument("--out", help="write the JSON report here")
+    args = parser.parse_args()
+
+    cassette = os.path.abspath(args.cassette)
+    requests = replayable(read_cassette(cassette))
+    if not requests:
+        print(f"❌ no replayable requests in {cassette}")
+        return None
+
+    proc, scratch = None, tempfile.TemporaryDirectory()
+    base_url = args.url.rstrip("/") if args.url else f"http://127.0.0.1:{args.port}"
+    try:
+        if not args.url:
+            env = dict(os.environ, MANNA_REPLAY_CASSETTE=cassette, MANNA_REPLAY_SPEED=str(args.speed),
+                       MANNA_INVENTORY_DB=os.path.join(scratch.name, "inventory.db"),
+                       MANNA_REQUEST_LOG="0", PYTHONWARNINGS="ignore")
+            for name in ("MANNA_FAKE_MODEL_LATENCY", "MANNA_RECORD_CASSETTE"):
+                env.pop(name, None)
+            cmd = [part.format(workers=args.workers) for part in SERVERS[args.server]]
+            cmd += ["-b", f"127.0.0.1:{args.port}", "--timeout", "600"]
+            proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if not wait_until_ready(base_url + "/ready"):
+                print(f"❌ {args.server} server did not start")
+                return None
+
+        results, wall = run_replay(base_url, requests, args.rate, args.speed, args.concurrency)
+        report = {
+            "server": args.url or args.server,
+            "requests": len(requests),
+            "wall_s": round(wall, 2),
+            "throughput_rps": round(len(requests) / wall, 2),
+            "routes": summarize(requests, results, wall),
+        }
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        scratch.cleanup()
+
+    for route, stats in report["routes"].items():
+        print(f"{route}: {stats}")
+    print(f"total: {report['requests']} requests in {report['wall_s']}s ({report['throughput_rps']} req/s)")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
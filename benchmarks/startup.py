@@ -0,0 +1,144 @@
+"""
+Cold-start cost of the backend: import time and memory of a fresh process, and
+per-worker memory of a real gunicorn deployment (gunicorn.conf.py is picked up
+from the repo root, so preload/post_fork apply when it exists).
+
+    python benchmarks/startup.py --runs 5 --workers 4
+
+The real SDK code path is measured (a dummy GOOGLE_API_KEY, no requests are sent).
+RSS counts shared pages once per worker; PSS splits them between the processes
+sharing them and USS is what each worker alone costs, so USS is what preloading
+and copy-on-write sharing should bring down.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("google.generativeai", "grpc", "PIL.Image", "numpy", "flask", "starlette")
+
+IMPORT_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+rss_kb = next(int(line.split()[1]) for line in open('/proc/self/status') if line.startswith('VmRSS'))
+print(json.dumps({{"seconds": seconds, "rss_mb": rss_kb / 1024,
+                  "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def probe_import(module, env):
+    code = IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def memory(pid):
+    """(rss, pss, uss) in MB from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                fields[parts[0][:-1]] = int(parts[1])
+    uss = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return fields.get("Rss", 0) / 1024, fields.get("Pss", 0) / 1024, uss / 1024
+
+
+def children(pid):
+    found = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                    found.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return found
+
+
+def wait_until_ready(base_url, timeout=60):
+    """Polls /ready (falls back to / on trees without it); returns seconds until the first 200."""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        for path in ("/ready", "/"):
+            try:
+                with urllib.request.urlopen(base_url + path, timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - start
+            except urllib.error.HTTPError as e:
+                if e.code != 404:
+                    break
+            except Exception:
+                break
+        time.sleep(0.1)
+    return None
+
+
+def measure_workers(app, workers, port, env, worker_class=None):
+    cmd = ["gunicorn", app, "-w", str(workers), "-b", f"127.0.0.1:{port}"]
+    if worker_class:
+        cmd += ["-k", worker_class]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = wait_until_ready(f"http://127.0.0.1:{port}")
+        if ready is None:
+            return {"error": "did not start"}
+        time.sleep(1.0)
+        per_worker = [memory(pid) for pid in children(proc.pid)]
+        master = memory(proc.pid)
+        return {
+            "ready_s": round(ready, 2),
+            "workers": len(per_worker),
+            "master_rss_mb": round(master[0], 1),
+            "worker_rss_mb": round(statistics.mean(m[0] for m in per_worker), 1),
+            "worker_pss_mb": round(statistics.mean(m[1] for m in per_worker), 1),
+            "worker_uss_mb": round(statistics.mean(m[2] for m in per_worker), 1),
+            "total_pss_mb": round(master[1] + sum(m[1] for m in per_worker), 1),
+        }
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="fresh-process imports per module")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=5056)
+    args = parser.parse_args()
+
+    env = dict(os.environ, GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY", "startup-benchmark"),
+               PYTHONWARNINGS="ignore", MANNA_REQUEST_LOG="0")
+    env.pop("MANNA_FAKE_MODEL_LATENCY", None)
+    report = {"imports": {}, "gunicorn": {}}
+
+    for module in ("backend_real_api", "backend_async_api"):
+        runs = [probe_import(module, env) for _ in range(args.runs)]
+        report["imports"][module] = {
+            "median_s": round(statistics.median(r["seconds"] for r in runs), 3),
+            "rss_mb": round(statistics.median(r["rss_mb"] for r in runs), 1),
+            "heavy_loaded": runs[-1]["loaded"],
+        }
+        print(f"import {module}: {report['imports'][module]}")
+
+    for label, app, worker_class in (
+        ("sync", "backend_real_api:app", None),
+        ("async", "backend_async_api:app", "uvicorn.workers.UvicornWorker"),
+    ):
+        report["gunicorn"][label] = measure_workers(app, args.workers, args.port, env, worker_class)
+        print(f"gunicorn {label} x{args.workers}: {report['gunicorn'][label]}")
+
+    return report
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
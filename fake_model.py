@@ -0,0 +1,125 @@
+import re
+import time
+import json
+import asyncio
+
+from meal_plan import MEALS
+
+# --- 1. CANNED ANSWERS ---
+FAKE_RECIPE = {
+    "id": "fake-recipe-1",
+    "title": "Garlicky Spinach & Egg Scramble",
+    "description": "Uses the spinach before it wilts and keeps you on track for your protein goal.",
+    "calories": 420,
+    "macros": {"p": 28, "c": 12, "f": 26},
+    "time": "12 mins",
+    "ingredients": [
+        {"name": "Eggs", "amount": "3 pcs", "amountValue": 3, "unit": "pcs"},
+        {"name": "Spinach", "amount": "50g", "amountValue": 50, "unit": "g"},
+    ],
+    "instructions": ["Wilt the spinach in a hot pan.", "Add the beaten eggs and stir gently until set."],
+    "image": "https://images.unsplash.com/photo-1525351484163-7529414344d8?w=800&q=80",
+}
+
+FAKE_SHOPPING_LIST = [
+    {"name": "Eggs 🥚", "amount": "12 pcs", "nutrition": "High Protein", "substitute": "Egg Whites", "why": "Cheap, fast protein for every meal type."},
+    {"name": "Spinach 🥬", "amount": "200g", "nutrition": "Iron, Folate", "substitute": "Kale", "why": "Greens for omelettes, pasta and bowls."},
+    {"name": "Brown Rice 🍚", "amount": "500g", "nutrition": "Complex Carbs", "substitute": "Quinoa", "why": "Steady energy that keeps all week."},
+]
+
+FAKE_SCAN = [
+    {"name": "Eggs", "quantity": 6, "unit": "pcs"},
+    {"name": "Spinach", "quantity": 1, "unit": "bag"},
+    {"name": "Greek Yogurt", "quantity": 500, "unit": "g"},
+    {"name": "Mystery Leftovers", "quantity": 1, "unit": "tub"},
+]
+
+
+def fake_plan(first_day, last_day):
+    """One window of a meal plan: FAKE_RECIPE for every meal, each with its own id."""
+    return {"days": [
+        {"day": day, "meals": {meal: {**FAKE_RECIPE, "id": f"fake-plan-{day}-{meal.lower()}"} for meal in MEALS}}
+        for day in range(first_day, last_day + 1)
+    ]}
+
+
+class FakeResponse:
+    """Mimics the bits of a Gemini response the backend reads."""
+
+    def __init__(self, text, prompt=""):
+        self.text = text
+        self.usage_metadata = type("Usage", (), {
+            "prompt_token_count": len(str(prompt)) // 4,
+            "candidates_token_count": len(text) // 4,
+            "total_token_count": (len(str(prompt)) + len(text)) // 4,
+        })()
+
+
+def _chunks(text, size=24):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class FakeAsyncStream:
+    """Async-iterable like the SDK's streamed response: `async for chunk in response`."""
+
+    def __init__(self, pieces, delay, prompt):
+        self.pieces = pieces
+        self.delay = delay
+        self.prompt = prompt
+
+    async def __aiter__(self):
+        for piece in self.pieces:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield FakeResponse(piece, self.prompt)
+
+
+# --- 2. THE FAKE MODEL ---
+class FakeModel:
+    """
+    Drop-in stand-in for genai.GenerativeModel with a configurable latency, so load
+    tests and benchmarks can run without spending Gemini quota.
+    """
+
+    def __init__(self, latency=0.0, answer=None):
+        self.latency = latency
+        self.answer = answer
+        self.calls = 0
+
+    def _text_for(self, prompt):
+        if self.answer is not None:
+            return self.answer(prompt) if callable(self.answer) else self.answer
+        text = prompt[0] if isinstance(prompt, (list, tuple)) else str(prompt)
+        if "Procurement Agent" in text:
+            return json.dumps(FAKE_SHOPPING_LIST)
+        if "Fridge Scanner" in text:
+            return json.dumps(FAKE_SCAN)
+        if "Meal Planner" in text:
+            window = re.search(r"planning days (\d+) to (\d+)", text)
+            if window:
+                return json.dumps(fake_plan(int(window.group(1)), int(window.group(2))))
+        return json.dumps(FAKE_RECIPE)
+
+    def _stream(self, prompt):
+        pieces = _chunks(self._text_for(prompt))
+        for piece in pieces:
+            if self.latency:
+                time.sleep(self.latency / len(pieces))
+            yield FakeResponse(piece, prompt)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        if stream:
+            return self._stream(prompt)
+        if self.latency:
+            time.sleep(self.latency)
+        return FakeResponse(self._text_for(prompt), prompt)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        self.calls += 1
+        if stream:
+            pieces = _chunks(self._text_for(prompt))
+            return FakeAsyncStream(pieces, self.latency / len(pieces), prompt)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return FakeResponse(self._text_for(prompt), prompt)
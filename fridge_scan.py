@@ -0,0 +1,197 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from response_cache import canonical_key
+from units import normalize_unit, convert
+
+# Gemini bills images per 768px tile; 1024px on the long side keeps labels and
+# small items readable while sending ~4 tiles instead of a 12MP original.
+SCAN_MAX_SIDE = int(os.environ.get("MANNA_SCAN_MAX_SIDE", 1024))
+SCAN_JPEG_QUALITY = int(os.environ.get("MANNA_SCAN_JPEG_QUALITY", 80))
+# Two photos whose 64-bit dHashes differ in at most this many bits count as the same fridge
+SCAN_HASH_DISTANCE = int(os.environ.get("MANNA_SCAN_HASH_DISTANCE", 6))
+SCAN_CACHE_TTL = 86400
+SCAN_MAX_PHOTOS = 6
+HASH_INDEX_SIZE = 4096
+
+# --- 1. IMAGE PREP ---
+# Pillow is imported by the first scan, not at startup: most workers never see a photo.
+class UnreadablePhoto(ValueError):
+    """The upload is not an image Pillow can decode."""
+
+class PreparedPhoto:
+    def __init__(self, jpeg, phash, original_bytes, size):
+        self.jpeg = jpeg
+        self.phash = phash
+        self.original_bytes = original_bytes
+        self.size = size
+
+def dhash(image, hash_size=8):
+    """Difference hash: 64 bits of 'is this pixel brighter than its right neighbour' on a 9x8 thumbnail."""
+    from PIL import Image
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+def prepare_image(raw, max_side=SCAN_MAX_SIDE, quality=SCAN_JPEG_QUALITY):
+    """Decodes, fixes EXIF rotation, downscales and re-encodes one upload as a compact JPEG."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    try:
+        image = Image.open(io.BytesIO(raw))
+    except UnidentifiedImageError as e:
+        raise UnreadablePhoto(str(e)) from e
+    # Let the JPEG decoder do most of the shrinking (DCT scaling) before we touch pixels
+    image.draft("RGB", (max_side, max_side))
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality, optimize=True)
+    return PreparedPhoto(buffer.getvalue(), dhash(image), len(raw), image.size)
+
+# --- 2. NEAR-DUPLICATE CACHE ---
+class PerceptualCache:
+    """
+    Scan results keyed by perceptual hash. Values live in the shared ResponseCache
+    (TTL, SQLite tier); this class only keeps a band index of recent hashes so a
+    re-shot of the same fridge (different exposure, slight angle) finds the old result.
+    Splitting the 64-bit hash into 8 bytes means any hash within 7 bits shares at
+    least one byte with the query, so only those candidates are compared.
+    """
+
+    def __init__(self, cache, max_distance=SCAN_HASH_DISTANCE, max_hashes=HASH_INDEX_SIZE):
+        self.cache = cache
+        self.max_distance = max_distance
+        self.max_hashes = max_hashes
+        self.hashes = OrderedDict()
+        self.bands = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bands(phash):
+        return [(i, (phash >> (8 * i)) & 0xFF) for i in range(8)]
+
+    @staticmethod
+    def _key(phash):
+        return canonical_key('scan', format(phash, '016x'))
+
+    def _forget(self, phash):
+        self.hashes.pop(phash, None)
+        for band in self._bands(phash):
+            members = self.bands.get(band)
+            if members is not None:
+                members.discard(phash)
+                if not members:
+                    del self.bands[band]
+
+    def is_near(self, phash, other):
+        return bin(phash ^ other).count("1") <= self.max_distance
+
+    def get(self, phash):
+        exact = self.cache.get(self._key(phash))
+        if exact is not None:
+            return exact
+
+        with self._lock:
+            candidates = set()
+            for band in self._bands(phash):
+                candidates.update(self.bands.get(band, ()))
+            nearest = sorted(candidates, key=lambda other: bin(other ^ phash).count("1"))
+
+        for other in nearest:
+            if bin(other ^ phash).count("1") > self.max_distance:
+                break
+            found = self.cache.get(self._key(other))
+            if found is not None:
+                return found
+            with self._lock:
+                self._forget(other)
+        return None
+
+    def set(self, phash, items, ttl=SCAN_CACHE_TTL):
+        self.cache.set(self._key(phash), items, ttl=ttl)
+        with self._lock:
+            if phash in self.hashes:
+                self.hashes.move_to_end(phash)
+                return
+            self.hashes[phash] = True
+            for band in self._bands(phash):
+                self.bands.setdefault(band, set()).add(phash)
+            while len(self.hashes) > self.max_hashes:
+                self._forget(next(iter(self.hashes)))
+
+# --- 3. PROMPT & MAPPING ---
+def build_scan_prompt(master_index, jpeg):
+    """Multimodal prompt: the catalogue names (with their usual unit) plus the downscaled photo."""
+    catalogue = ", ".join(f"{e['name']} ({e.get('typical_unit', 'pcs')})" for e in master_index.entries)
+    text = f"""
+        Role: Manna AI Fridge Scanner.
+        Look at this photo of a fridge or pantry and list every food item you can see.
+
+        KNOWN ITEMS (name and usual unit): {catalogue}
+
+        RULES:
+        1. If an item is in KNOWN ITEMS, use that exact name and unit.
+        2. 'quantity' is your best estimate of how much is visible, as a raw Number in that unit.
+        3. Skip containers you cannot identify. Do not guess brands.
+
+        OUTPUT FORMAT:
+        Return ONLY a JSON array: [{{"name": "Spinach", "quantity": 1, "unit": "bag"}}]
+        """
+    return [text, {"mime_type": "image/jpeg", "data": jpeg}]
+
+def to_inventory(detections, master_index):
+    """Maps raw detections onto master entries with the catalogue's unit, shelf life and category."""
+    items = []
+    for found in detections if isinstance(detections, list) else []:
+        if not isinstance(found, dict) or not found.get('name'):
+            continue
+        name = str(found['name']).strip()
+        try:
+            quantity = float(found.get('quantity', 1) or 1)
+        except (TypeError, ValueError):
+            quantity = 1.0
+        unit = found.get('unit') or ''
+
+        entry = master_index.lookup(name)
+        if entry is None:
+            items.append({"name": name, "quantity": quantity, "unit": unit or "pcs",
+                          "daysLeft": 7, "category": "Other", "inMasterDb": False})
+            continue
+
+        typical = entry.get('typical_unit') or 'pcs'
+        if unit and normalize_unit(unit) != normalize_unit(typical):
+            converted = convert(quantity, unit, typical, entry)
+            if converted is not None:
+                quantity, unit = converted, typical
+        else:
+            unit = typical
+        items.append({
+            "name": entry['name'],
+            "quantity": round(quantity, 2),
+            "unit": unit,
+            "daysLeft": entry.get('default_shelf_life', 7),
+            "category": entry.get('category', 'Other'),
+            "inMasterDb": True,
+        })
+    return items
+
+def merge_scans(scans):
+    """Combines per-photo item lists; the same item in the same unit is summed, keeping the shortest shelf life."""
+    merged = {}
+    for items in scans:
+        for item in items:
+            key = (item['name'].lower(), normalize_unit(item['unit']))
+            if key in merged:
+                merged[key]['quantity'] = round(merged[key]['quantity'] + item['quantity'], 2)
+                merged[key]['daysLeft'] = min(merged[key]['daysLeft'], item['daysLeft'])
+            else:
+                merged[key] = dict(item)
+    return list(merged.values())
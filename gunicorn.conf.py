@@ -0,0 +1,29 @@
+"""
+Gunicorn settings, picked up automatically from the working directory by the Procfile
+command (and by benchmarks/*.py).
+
+The app is imported once in the master (preload_app), so the master DB, its indexes
+and the NumPy nutrition columns are built a single time and shared copy-on-write by
+every worker. The model client (and the gRPC channels under it) must not cross a
+fork, so each worker builds its own in post_fork; /ready answers 503 until it has.
+MANNA_PRELOAD=0 goes back to every worker importing the app itself.
+"""
+import gc
+import os
+import threading
+
+preload_app = os.environ.get("MANNA_PRELOAD", "1") != "0"
+
+def when_ready(server):
+    # Runs in the master after the preload, before the first fork. The SDK modules are
+    # imported (never instantiated) here so all workers share them; importing opens no channel.
+    if os.environ.get("MANNA_FAKE_MODEL_LATENCY") is None:
+        import google.generativeai  # noqa: F401
+    # Moving every object into the permanent generation stops the collector from writing
+    # to their headers, which would otherwise un-share those pages in every worker.
+    gc.collect()
+    gc.freeze()
+
+def post_fork(server, worker):
+    import backend_real_api as api
+    threading.Thread(target=api.warm_up, name="manna-warm-up", daemon=True).start()
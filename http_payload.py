@@ -0,0 +1,284 @@
+import re
+import json
+import gzip
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# --- 1. JSON ---
+def dumps(obj):
+    """Compact UTF-8 JSON bytes; orjson when installed (several times faster than json on our payloads)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            pass  # a type orjson doesn't know: the stdlib path below reports it properly
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+# --- 2. COMPRESSION ---
+# Below this a compressed body saves less than the headers and CPU it costs
+MIN_COMPRESS_BYTES = 512
+# Request bodies are inflated up to this size; anything larger is refused (zip bombs)
+MAX_INFLATED_BYTES = 16 * 1024 * 1024
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+# Fast settings: these bodies are generated per request, not static assets
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+# Compressed bodies kept by content-hash ETag, at most this many bytes in all;
+# a body bigger than a tenth of that is never kept
+COMPRESSED_CACHE_BYTES = 8 * 1024 * 1024
+# Brotli output is drawn at most this much at a time while inflating
+BROTLI_OUTPUT_STEP = 256 * 1024
+
+_compressed = OrderedDict()
+_compressed_bytes = 0
+_compressed_lock = threading.Lock()
+
+def supported_encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+def negotiate(accept_encoding):
+    """Best encoding we support from an Accept-Encoding header (q-values honoured, br before gzip on ties)."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                q = float(match.group(1))
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in supported_encodings():
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+def compressible(content_type, size):
+    return size >= MIN_COMPRESS_BYTES and (content_type or "").startswith(COMPRESSIBLE_TYPES)
+
+def compress(body, encoding, tag=None):
+    """
+    `tag`: the body's content-hash etag(), when the caller computed one. Cache hits and
+    'same list again' requests then compress once; untagged bodies are never kept.
+    """
+    key = (tag, encoding)
+    if tag is not None:
+        with _compressed_lock:
+            data = _compressed.get(key)
+            if data is not None:
+                _compressed.move_to_end(key)
+                return data
+    if encoding == "br":
+        data = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        data = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    if tag is not None and len(data) <= COMPRESSED_CACHE_BYTES // 10:
+        _keep_compressed(key, data)
+    return data
+
+def _keep_compressed(key, data):
+    global _compressed_bytes
+    with _compressed_lock:
+        if key in _compressed:
+            return
+        _compressed[key] = data
+        _compressed_bytes += len(data)
+        while _compressed_bytes > COMPRESSED_CACHE_BYTES:
+            _, old = _compressed.popitem(last=False)
+            _compressed_bytes -= len(old)
+
+def _inflate_brotli(body):
+    """Streams through brotli.Decompressor, refusing the body as soon as the output passes MAX_INFLATED_BYTES."""
+    decompressor = brotli.Decompressor()
+    parts, size = [], 0
+    part = decompressor.process(body, output_buffer_limit=BROTLI_OUTPUT_STEP)
+    while True:
+        size += len(part)
+        if size > MAX_INFLATED_BYTES:
+            raise ValueError("Request body too large once decompressed")
+        parts.append(part)
+        if decompressor.is_finished():
+            break
+        # The rest of the input is buffered: drain it a step at a time
+        part = decompressor.process(b"", output_buffer_limit=BROTLI_OUTPUT_STEP)
+        if not part:
+            raise ValueError("Corrupt br request body: truncated")
+    return b"".join(parts)
+
+def decompress(body, encoding):
+    """Inflates a Content-Encoding'd request body; ValueError for unknown, corrupt or oversized bodies."""
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return body
+    try:
+        if encoding in ("gzip", "x-gzip", "deflate"):
+            # wbits: 16+ for a gzip wrapper, plain zlib for deflate
+            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding != "deflate" else zlib.MAX_WBITS)
+            data = inflater.decompress(body, MAX_INFLATED_BYTES + 1)
+        elif encoding == "br" and brotli is not None:
+            data = _inflate_brotli(body)
+        else:
+            raise ValueError(f"Unsupported Content-Encoding: {encoding}")
+    except ValueError:
+        raise
+    except Exception as e:  # zlib.error, brotli.error
+        raise ValueError(f"Corrupt {encoding} request body: {e}")
+    if len(data) > MAX_INFLATED_BYTES:
+        raise ValueError("Request body too large once decompressed")
+    return data
+
+# --- 3. ETAGS ---
+# Generated results worth revalidating (route templates as both apps spell them)
+ETAG_ROUTES = {
+    "/api/recipes", "/api/shop", "/api/inventory/update", "/api/plan", "/api/plan/{plan_id}",
+    "/api/rations", "/api/nutrition", "/api/inventory/{user_id}", "/api/batch/{job_id}",
+}
+
+def route_template(rule):
+    """Flask's '/api/plan/<plan_id>' -> '/api/plan/{plan_id}', the Starlette spelling."""
+    return re.sub(r"<(?:[^:<>]+:)?([^<>]+)>", r"{\1}", rule or "")
+
+def etag(body):
+    """
+    Weak content-hash validator: the same JSON is the same resource whether it goes out
+    gzip'd, br'd or plain, so one tag serves every encoding.
+    """
+    return 'W/"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+def etag_matches(if_none_match, tag):
+    """If-None-Match uses weak comparison: W/ prefixes are ignored, '*' matches anything."""
+    if not if_none_match or not tag:
+        return False
+    opaque = tag.removeprefix("W/")
+    return any(candidate.strip() == "*" or candidate.strip().removeprefix("W/") == opaque
+               for candidate in if_none_match.split(","))
+
+def add_vary(value):
+    parts = [part.strip() for part in (value or "").split(",") if part.strip()]
+    if "accept-encoding" not in (part.lower() for part in parts):
+        parts.append("Accept-Encoding")
+    return ", ".join(parts)
+
+# --- 4. ASGI MIDDLEWARE ---
+class PayloadMiddleware:
+    """
+    ASGI side: inflates gzip/br/deflate request bodies, answers If-None-Match with 304
+    on ETAG_ROUTES and compresses single-message responses. Multi-message responses
+    (SSE) pass through untouched so every event still reaches the client as it is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers") or []}
+        if headers.get("content-encoding", "identity").lower() != "identity":
+            try:
+                receive = await self._inflate(scope, receive, headers["content-encoding"])
+            except ValueError as e:
+                return await self._error(send, 400 if "too large" not in str(e) else 413, str(e))
+
+        encoding = negotiate(headers.get("accept-encoding"))
+        if_none_match = headers.get("if-none-match")
+        state = {"start": None}
+
+        async def payload_send(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                return
+            if message["type"] != "http.response.body" or state["start"] is None:
+                return await send(message)
+
+            start, state["start"] = state["start"], None
+            if message.get("more_body", False):
+                # A stream: headers go out now and the body is not touched
+                await send(start)
+                return await send(message)
+
+            response_headers = list(start.get("headers", []))
+            content_type = _header(response_headers, b"content-type")
+
+            body = message.get("body", b"")
+            status = start["status"]
+            route = getattr(scope.get("route"), "path", None)
+            tag, content_tag = _header(response_headers, b"etag"), None
+            if status == 200 and route in ETAG_ROUTES:
+                if tag is None:
+                    tag = content_tag = etag(body)
+                response_headers = _set_header(response_headers, b"etag", tag)
+                if etag_matches(if_none_match, tag):
+                    response_headers = [(k, v) for k, v in response_headers if k.lower() not in (b"content-length", b"content-type")]
+                    await send({**start, "status": 304, "headers": response_headers})
+                    return await send({"type": "http.response.body", "body": b""})
+
+            if compressible(content_type, len(body)):
+                response_headers = _set_header(response_headers, b"vary", add_vary(_header(response_headers, b"vary")))
+                if encoding and _header(response_headers, b"content-encoding") is None:
+                    body = compress(body, encoding, content_tag)
+                    response_headers = _set_header(response_headers, b"content-encoding", encoding)
+                    response_headers = _set_header(response_headers, b"content-length", str(len(body)))
+            await send({**start, "headers": response_headers})
+            await send({**message, "body": body})
+
+        await self.app(scope, receive, payload_send)
+
+    @staticmethod
+    async def _inflate(scope, receive, content_encoding):
+        chunks, more = [], True
+        while more:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more = message.get("more_body", False)
+        body = decompress(b"".join(chunks), content_encoding)
+        # In place: the router records the matched route on this same scope dict
+        scope["headers"] = [(k, v) for k, v in scope.get("headers") or []
+                            if k.lower() not in (b"content-encoding", b"content-length")]
+        scope["headers"].append((b"content-length", str(len(body)).encode("latin-1")))
+        delivered = False
+
+        async def inflated_receive():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+        return inflated_receive
+
+    @staticmethod
+    async def _error(send, status, message):
+        body = dumps({"error": message})
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+def _header(headers, name):
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+def _set_header(headers, name, value):
+    return [(k, v) for k, v in headers if k.lower() != name] + [(name, value.encode("latin-1"))]
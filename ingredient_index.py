@@ -0,0 +1,209 @@
+import re
+import json
+
+# --- 1. NAME NORMALIZATION ---
+_NON_WORD = re.compile(r"[^a-z0-9\s]+")
+
+def normalize_name(name):
+    """Lowercase, strip emojis/punctuation and collapse spaces: ' Rolled Oats 🥣' -> 'rolled oats'."""
+    clean = _NON_WORD.sub(" ", str(name or "").lower())
+    return " ".join(clean.split())
+
+def singular(word):
+    """Very small plural folder so 'carrots' and 'tomatoes' find their master entries."""
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+def name_tokens(name):
+    return tuple(singular(t) for t in normalize_name(name).split())
+
+# --- 2. DIET & TASTE RULES ---
+MEAT_WORDS = {"chicken", "beef", "turkey", "pork", "bacon", "ham", "lamb", "sausage"}
+FISH_WORDS = {"salmon", "tuna", "trout", "sardine", "shrimp", "cod", "fish"}
+ANIMAL_WORDS = {"egg", "honey", "butter", "milk", "cheese", "yogurt", "cream"}
+# Wheat, barley and rye foods; an entry tagged "gluten-free" (tamari, quinoa) never counts
+GLUTEN_WORDS = {"wheat", "pasta", "spaghetti", "bread", "flour", "barley", "rye", "couscous",
+                "seitan", "semolina", "bulgur", "spelt", "farro"}
+GLUTEN_PHRASES = ("soy sauce",)
+# Every word is_diet_compatible understands; a diet with any other word ('Keto', 'Halal')
+# is left to the model, which reads the diet itself
+DIET_WORDS = {"vegan", "vegetarian", "pescatarian", "gluten", "free", "classic", "none", "no",
+              "restriction", "restrictions", "omnivore", "any", "and"}
+
+# Maps the app's "Craved Flavors" onto master DB tags.
+TASTE_TAGS = {
+    "spicy": {"spicy", "hot", "pungent"},
+    "tangy": {"tangy", "acidic", "citrus", "tart"},
+    "creamy": {"creamy", "rich", "soft"},
+    "sweet": {"sweet", "berry"},
+    "savory": {"savory", "umami", "salty"},
+    "bold": {"spice", "aromatic", "herb", "seasoning"},
+    "fresh": {"fresh", "crisp", "herb"},
+}
+
+def is_diet_compatible(entry, diet):
+    """True when a master entry is allowed for the user's dietary style."""
+    diet = (diet or "").lower()
+    tokens = set(name_tokens(entry["name"])) | set(entry.get("tags", []))
+    is_meat = bool(tokens & MEAT_WORDS) or "meat" in tokens
+    is_fish = bool(tokens & FISH_WORDS)
+    if "gluten" in diet and contains_gluten(entry):
+        return False
+    if "vegan" in diet:
+        return not (is_meat or is_fish or entry["category"] == "Dairy" or tokens & ANIMAL_WORDS)
+    if "vegetarian" in diet:
+        return not (is_meat or is_fish)
+    if "pescatarian" in diet:
+        return not is_meat
+    return True
+
+def contains_gluten(entry):
+    if "gluten-free" in entry.get("tags", []):
+        return False
+    name = normalize_name(entry["name"])
+    # Raw words too: singular() folds 'couscous' to 'couscou'
+    words = set(name.split()) | set(name_tokens(name))
+    return bool(words & GLUTEN_WORDS) or any(phrase in name for phrase in GLUTEN_PHRASES)
+
+def diet_known(diet):
+    """True when is_diet_compatible understands the whole diet, so local lists can honour it."""
+    return set(normalize_name(diet).split()) <= DIET_WORDS
+
+def taste_tags(tastes):
+    """Collects the master DB tags that match whatever taste words the profile contains."""
+    words = set(normalize_name(json.dumps(tastes or {})).split())
+    wanted = set()
+    for word in words:
+        wanted |= TASTE_TAGS.get(word, set())
+    return wanted
+
+# --- 3. THE INDEX ---
+FIND_CACHE_SIZE = 8192
+
+class IngredientIndex:
+    """
+    In-memory view of ingredients_master.json built once at load time.
+    Entries are keyed by normalized name, category, tag and substitute, and every
+    entry's compact JSON is serialized up front so prompts only join strings.
+    """
+
+    def __init__(self, master):
+        self.entries = tuple(master)
+        self.by_name = {}
+        self.by_tokens = {}
+        self.by_word = {}
+        self.by_category = {}
+        self.by_tag = {}
+        self.by_substitute = {}
+        self._tokens = []
+        self._json = []
+        # Pantry names repeat across requests, so remember resolved lookups
+        self._find_cache = {}
+
+        for pos, entry in enumerate(self.entries):
+            key = normalize_name(entry["name"])
+            self.by_name.setdefault(key, pos)
+            tokens = name_tokens(entry["name"])
+            self._tokens.append(tokens)
+            self.by_tokens.setdefault(tokens, pos)
+            for word in set(tokens):
+                self.by_word.setdefault(word, []).append(pos)
+            self.by_category.setdefault(entry["category"], []).append(pos)
+            for tag in entry.get("tags", []):
+                self.by_tag.setdefault(tag, []).append(pos)
+            sub = normalize_name(entry.get("substitute", ""))
+            if sub:
+                self.by_substitute.setdefault(sub, []).append(pos)
+            self._json.append(json.dumps(entry, separators=(",", ":"), ensure_ascii=False))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def find(self, name):
+        """Position of the master entry for a (possibly decorated) item name, or None."""
+        name = str(name or "")
+        if name in self._find_cache:
+            return self._find_cache[name]
+        pos = self._resolve(name)
+        if len(self._find_cache) >= FIND_CACHE_SIZE:
+            self._find_cache.clear()
+        self._find_cache[name] = pos
+        return pos
+
+    def _resolve(self, name):
+        key = normalize_name(name)
+        if not key:
+            return None
+        if key in self.by_name:
+            return self.by_name[key]
+        tokens = name_tokens(name)
+        if tokens in self.by_tokens:
+            return self.by_tokens[tokens]
+
+        # Fallback: the longest master name whose words all appear in the item name
+        # ('Organic Baby Spinach' -> 'Spinach'), never the other way around.
+        token_set = set(tokens)
+        best, best_len = None, 0
+        for word in token_set:
+            for pos in self.by_word.get(word, ()):
+                entry_tokens = self._tokens[pos]
+                if len(entry_tokens) > best_len and token_set.issuperset(entry_tokens):
+                    best, best_len = pos, len(entry_tokens)
+        return best
+
+    def lookup(self, name):
+        pos = self.find(name)
+        return self.entries[pos] if pos is not None else None
+
+    def serialize(self, positions):
+        """Compact JSON array for the given entry positions (pre-serialized, no re-dump)."""
+        return "[" + ",".join(self._json[p] for p in positions) + "]"
+
+    # --- 4. PROMPT SLICES ---
+    def inventory_slice(self, inventory):
+        """Positions of the inventory items' master entries plus their substitutes."""
+        picked = []
+        seen = set()
+
+        def add(pos):
+            if pos is not None and pos not in seen:
+                seen.add(pos)
+                picked.append(pos)
+
+        for item in inventory or []:
+            pos = self.find(item.get("name", "") if isinstance(item, dict) else item)
+            add(pos)
+            if pos is not None:
+                add(self.find(self.entries[pos].get("substitute", "")))
+        return picked
+
+    def shopping_candidates(self, diet=None, tastes=None, per_category=6):
+        """
+        Category-balanced candidate set for /api/shop: up to `per_category` diet-compatible
+        entries from every category, ranked by how well their tags match the user's tastes.
+        """
+        wanted = taste_tags(tastes)
+        picked = []
+        for positions in self.by_category.values():
+            allowed = [p for p in positions if is_diet_compatible(self.entries[p], diet)]
+            ranked = sorted(
+                allowed,
+                key=lambda p: (
+                    -len(wanted & set(self.entries[p].get("tags", []))),
+                    "baking" in self.entries[p].get("tags", []),
+                    p,
+                ),
+            )
+            picked.extend(ranked[:per_category])
+        return picked
+
+    def prompt_slice(self, inventory):
+        return self.serialize(self.inventory_slice(inventory))
+
+    def shopping_slice(self, diet=None, tastes=None, per_category=6):
+        return self.serialize(self.shopping_candidates(diet, tastes, per_category))
@@ -0,0 +1,187 @@
+from ingredient_index import normalize_name, name_tokens
+from units import convert
+
+# --- 1. THE MATCHER ---
+class InventoryMatcher:
+    """
+    Resolves recipe ingredient names to inventory items, built once per request.
+
+    Lookup order: exact normalized name -> same master DB entry (so 'Oats' and
+    'Rolled Oats' meet through ingredients_master.json) -> whole-token overlap
+    ('Oil' finds 'Olive Oil' but never 'Boiled Eggs') -> the master substitute.
+    A token match needs the same head noun on both sides, and a generic name only
+    finds a more specific item when the master DB doesn't know it as something
+    else: 'Butter' never takes 'Peanut Butter', 'Pepper' never 'Red Bell Pepper'.
+    Every step is a dict lookup or a walk over the items sharing a token, so a
+    1k-item pantry costs the same as a 10-item one per ingredient.
+    """
+
+    def __init__(self, inventory, master_index):
+        self.inventory = inventory
+        self.master_index = master_index
+        self.by_name = {}
+        for pos, item in enumerate(inventory):
+            self.by_name.setdefault(normalize_name(item.get('name', '')), pos)
+
+        # Token and master indexes are only built if an exact lookup ever misses
+        self.by_master = None
+        self.by_token = None
+        self.tokens = None
+        self.masters = None
+        self.entries = [None] * len(inventory)
+        self._generic = {}
+
+    def _build_indexes(self):
+        self.by_master = {}
+        self.by_token = {}
+        self.tokens = []
+        self.masters = []
+        for pos, item in enumerate(self.inventory):
+            name = item.get('name', '')
+            master_pos = self.master_index.find(name)
+            if master_pos is not None:
+                self.entries[pos] = self.master_index.entries[master_pos]
+                self.by_master.setdefault(master_pos, pos)
+            self.masters.append(master_pos)
+            tokens = name_tokens(name)
+            self.tokens.append(tokens)
+            for token in tokens:
+                self.by_token.setdefault(token, []).append(pos)
+
+    def match(self, name):
+        """Inventory position for a recipe ingredient name, or None."""
+        key = normalize_name(name)
+        if not key:
+            return None
+        if key in self.by_name:
+            return self.by_name[key]
+        if self.by_token is None:
+            self._build_indexes()
+
+        master_pos = self.master_index.find(name)
+        if master_pos is not None and master_pos in self.by_master:
+            return self.by_master[master_pos]
+
+        pos = self._token_match(name_tokens(name), master_pos)
+        if pos is not None:
+            return pos
+
+        if master_pos is not None:
+            substitute = self.master_index.find(self.master_index.entries[master_pos].get('substitute', ''))
+            if substitute is not None and substitute in self.by_master:
+                return self.by_master[substitute]
+        return None
+
+    def _token_match(self, tokens, master_pos):
+        """
+        Best item whose words contain the ingredient's words (or vice versa) with the
+        same head noun; exact fits first, then the fewest extra words.
+        """
+        if not tokens:
+            return None
+        wanted = set(tokens)
+        candidates = set()
+        for token in wanted:
+            candidates.update(self.by_token.get(token, ()))
+
+        best, best_extra = None, None
+        for pos in sorted(candidates):
+            item_tokens = self.tokens[pos]
+            if not item_tokens or item_tokens[-1] != tokens[-1]:
+                continue
+            have = set(item_tokens)
+            if not (wanted <= have or have <= wanted):
+                continue
+            if wanted < have:
+                # The pantry item is more specific: only if the DB doesn't tell them apart
+                if master_pos is not None and self.masters[pos] not in (None, master_pos):
+                    continue
+                if self._is_ambiguous(tokens):
+                    continue
+            extra = len(wanted ^ have)
+            if best_extra is None or extra < best_extra:
+                best, best_extra = pos, extra
+        return best
+
+    def _is_ambiguous(self, tokens):
+        """True when the master foods ending in this name span several categories ('pepper': bell vs black)."""
+        key = tuple(tokens)
+        if key not in self._generic:
+            wanted = set(tokens)
+            entries = (self.master_index.entries[pos] for pos in self.master_index.by_word.get(tokens[-1], ()))
+            categories = {
+                entry['category'] for entry in entries
+                if (entry_tokens := name_tokens(entry['name']))[-1] == tokens[-1] and wanted <= set(entry_tokens)
+            }
+            self._generic[key] = len(categories) > 1
+        return self._generic[key]
+
+    def amount_in_item_units(self, pos, amount, unit):
+        """
+        Converts a recipe amount into the matched item's own unit (None if they can't be
+        related). A missing unit on either side means the master entry's typical_unit.
+        """
+        item = self.inventory[pos]
+        entry = self.entries[pos]
+        if entry is None:
+            entry = self.master_index.lookup(item.get('name', ''))
+        typical = entry.get('typical_unit') if entry is not None else None
+        item_unit = item.get('unit') or typical or unit
+        return convert(amount, unit or typical or item_unit, item_unit, entry)
+
+# --- 2. APPLYING COOKED MEALS ---
+def recipes_from_payload(data):
+    """Accepts a single 'recipe', a list of 'recipes', or a whole 'plan' (or one day of it)."""
+    if data.get('recipes'):
+        return list(data['recipes'])
+    plan = data.get('plan')
+    if plan:
+        days = plan.get('days') or [plan.get('day', plan)]
+        return [meal for day in days for meal in (day.get('meals') or {}).values() if isinstance(meal, dict)]
+    recipe = data.get('recipe')
+    return [recipe] if recipe else []
+
+def apply_recipes(inventory, recipes, master_index):
+    """
+    Subtracts every ingredient of every recipe from the inventory in one pass.
+    Low-stock alerts compare against the quantity before the whole batch.
+    """
+    matcher = InventoryMatcher(inventory, master_index)
+    start = [float(item.get('quantity', 0) or 0) for item in inventory]
+    remaining = list(start)
+    unmatched = []
+
+    for recipe in recipes:
+        for used_item in recipe.get('ingredients', []):
+            name = used_item.get('name', '')
+            try:
+                used_qty = float(used_item.get('amountValue', 0) or 0)
+            except (TypeError, ValueError):
+                unmatched.append(name)
+                continue
+
+            pos = matcher.match(name)
+            qty = matcher.amount_in_item_units(pos, used_qty, used_item.get('unit')) if pos is not None else None
+            if qty is None:
+                unmatched.append(name)
+                continue
+            remaining[pos] = max(0, remaining[pos] - qty)
+
+    low_stock_items = []
+    for pos, item in enumerate(inventory):
+        if remaining[pos] == start[pos]:
+            continue
+        item['quantity'] = round(remaining[pos], 2)
+        # Trigger low stock alert if under 20%
+        if 0 < remaining[pos] <= (start[pos] * 0.2):
+            low_stock_items.append(item['name'])
+
+    # Filter out items that are effectively empty (less than 0.01)
+    final_inventory = [item for item in inventory if float(item.get('quantity', 0) or 0) > 0.01]
+
+    return {
+        "success": True,
+        "updatedInventory": final_inventory,
+        "lowStock": list(dict.fromkeys(low_stock_items)),
+        "unmatched": list(dict.fromkeys(unmatched)),
+    }
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import sqlite3
+
+from ingredient_index import normalize_name
+from units import convert
+
+class InventoryConflict(Exception):
+    """The client's If-Match version is stale; `version` is the current one."""
+
+    def __init__(self, version):
+        super().__init__(f"Inventory is at version {version}")
+        self.version = version
+
+class InvalidVersion(ValueError):
+    """An If-Match header or 'version' field that isn't an inventory version number."""
+
+    def __init__(self, value):
+        super().__init__(f"If-Match or 'version' must be an inventory version number such as 3, got {value!r}")
+        self.value = value
+
+# --- 1. DELTA OPS ---
+def item_id(name):
+    return normalize_name(name)
+
+def apply_ops(items, ops, master_index=None):
+    """
+    Applies client deltas to a list of inventory items and returns the new list.
+      {"op": "add", "item": {...}}           adds quantity to an existing item (same unit) or inserts it
+      {"op": "set", "item": {...}}           replaces the item's fields
+      {"op": "consume", "name", "amount", "unit"}  subtracts, converting units via the master DB
+      {"op": "remove", "name"}               drops the item
+    """
+    by_id = {item_id(item.get('name', '')): dict(item) for item in items}
+    for op in ops:
+        kind = op.get('op')
+        if kind in ('add', 'set'):
+            item = dict(op.get('item') or {})
+            key = item_id(item.get('name', ''))
+            if not key:
+                raise ValueError(f"'{kind}' needs an item with a name")
+            current = by_id.get(key)
+            if kind == 'add' and current is not None:
+                amount = convert(float(item.get('quantity', 0) or 0), item.get('unit') or current.get('unit'),
+                                 current.get('unit') or item.get('unit'),
+                                 master_index.lookup(key) if master_index else None)
+                if amount is None:
+                    raise ValueError(f"Can't add {item.get('unit')} to {current.get('unit')} for '{current.get('name')}'")
+                item = {**current, **{k: v for k, v in item.items() if k not in ('name', 'quantity', 'unit')},
+                        'quantity': round(float(current.get('quantity', 0) or 0) + amount, 2)}
+            by_id[key] = item
+        elif kind == 'consume':
+            key = item_id(op.get('name', ''))
+            current = by_id.get(key)
+            if current is None:
+                raise ValueError(f"No '{op.get('name')}' in inventory")
+            amount = convert(float(op.get('amount', 0) or 0), op.get('unit') or current.get('unit'),
+                             current.get('unit') or op.get('unit'),
+                             master_index.lookup(key) if master_index else None)
+            if amount is None:
+                raise ValueError(f"Can't consume {op.get('unit')} of '{current.get('name')}'")
+            left = max(0.0, float(current.get('quantity', 0) or 0) - amount)
+            if left > 0.01:
+                by_id[key] = {**current, 'quantity': round(left, 2)}
+            else:
+                del by_id[key]
+        elif kind == 'remove':
+            by_id.pop(item_id(op.get('name', '')), None)
+        else:
+            raise ValueError(f"Unknown op '{kind}'")
+    return list(by_id.values())
+
+def diff_items(before, after):
+    """The change records that turn `before` into `after`: ('set', id, item) and ('remove', id, None)."""
+    old = {item_id(item.get('name', '')): item for item in before}
+    new = {item_id(item.get('name', '')): item for item in after}
+    changes = [('set', key, item) for key, item in new.items() if old.get(key) != item]
+    changes += [('remove', key, None) for key in old if key not in new]
+    return changes
+
+# --- 2. THE STORE ---
+class InventoryStore:
+    """
+    Per-user inventories in SQLite (WAL, shared by every gunicorn worker).
+    Every write bumps the user's version and appends its item-level changes to
+    an append-only log, so clients can send deltas with If-Match and pull
+    `changes since N` instead of shipping the whole pantry on every call.
+    """
+
+    def __init__(self, db_path, master_index=None):
+        self.db_path = db_path
+        self.master_index = master_index
+        self._init_db()
+
+    def _connect(self):
+        # Autocommit mode; writes open their own BEGIN IMMEDIATE so the version check and the write are atomic
+        conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_db(self):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS inventory_items ("
+                " user_id TEXT NOT NULL, item_id TEXT NOT NULL, data TEXT NOT NULL,"
+                " PRIMARY KEY (user_id, item_id))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS inventory_versions ("
+                " user_id TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS inventory_changes ("
+                " user_id TEXT NOT NULL, version INTEGER NOT NULL, op TEXT NOT NULL,"
+                " item_id TEXT NOT NULL, data TEXT, created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS inventory_changes_by_version ON inventory_changes (user_id, version)"
+            )
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _version(conn, user_id):
+        row = conn.execute("SELECT version FROM inventory_versions WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _items(conn, user_id):
+        rows = conn.execute(
+            "SELECT data FROM inventory_items WHERE user_id = ? ORDER BY rowid", (user_id,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def load(self, user_id):
+        """(version, items) for a user; unknown users are an empty inventory at version 0."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN")
+            version = self._version(conn, user_id)
+            items = self._items(conn, user_id)
+            conn.execute("COMMIT")
+            return version, items
+        finally:
+            conn.close()
+
+    def changes_since(self, user_id, since):
+        """(version, changes) with every change after `since`, oldest first."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN")
+            version = self._version(conn, user_id)
+            rows = conn.execute(
+                "SELECT version, op, item_id, data FROM inventory_changes"
+                " WHERE user_id = ? AND version > ? ORDER BY rowid",
+                (user_id, since),
+            ).fetchall()
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return version, [
+            {"version": v, "op": op, "id": key, "item": json.loads(data) if data else None}
+            for v, op, key, data in rows
+        ]
+
+    def transform(self, user_id, fn, expected_version=None):
+        """
+        Runs fn(items) -> (new items, extra) under the write lock, persists the diff as
+        one new version and returns (version, changes, extra). Raises InventoryConflict
+        when `expected_version` is given and stale.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = self._version(conn, user_id)
+                if expected_version is not None and expected_version != version:
+                    raise InventoryConflict(version)
+
+                before = self._items(conn, user_id)
+                after, extra = fn([dict(item) for item in before])
+                changes = diff_items(before, after)
+                if changes:
+                    version += 1
+                    now = time.time()
+                    for op, key, item in changes:
+                        data = json.dumps(item) if item is not None else None
+                        if op == 'set':
+                            conn.execute(
+                                "INSERT INTO inventory_items (user_id, item_id, data) VALUES (?, ?, ?)"
+                                " ON CONFLICT (user_id, item_id) DO UPDATE SET data = excluded.data",
+                                (user_id, key, data),
+                            )
+                        else:
+                            conn.execute("DELETE FROM inventory_items WHERE user_id = ? AND item_id = ?", (user_id, key))
+                        conn.execute(
+                            "INSERT INTO inventory_changes (user_id, version, op, item_id, data, created_at)"
+                            " VALUES (?, ?, ?, ?, ?, ?)",
+                            (user_id, version, op, key, data, now),
+                        )
+                    conn.execute(
+                        "INSERT INTO inventory_versions (user_id, version) VALUES (?, ?)"
+                        " ON CONFLICT (user_id) DO UPDATE SET version = excluded.version",
+                        (user_id, version),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+        return version, [{"op": op, "id": key, "item": item} for op, key, item in changes], extra
+
+    def apply(self, user_id, ops, expected_version=None):
+        """Applies delta ops atomically: (version, changes)."""
+        version, changes, _ = self.transform(
+            user_id, lambda items: (apply_ops(items, ops, self.master_index), None), expected_version)
+        return version, changes
+
+    def replace(self, user_id, items, expected_version=None):
+        """Full upload (first sync from a device); stored as a normal versioned diff."""
+        version, changes, _ = self.transform(
+            user_id, lambda current: (apply_ops([], [{"op": "set", "item": i} for i in items]), None), expected_version)
+        return version, changes
+
+def parse_version(value):
+    """
+    If-Match value ('3', '"3"' or 'W/"3"') or a body 'version' (3) -> 3; None when
+    absent or '*'. Anything else raises InvalidVersion, which routes answer with 400.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise InvalidVersion(value)
+    text = str(value).strip()
+    if not text or text == '*':
+        return None
+    try:
+        version = int(text.removeprefix('W/').strip('"'))
+    except ValueError:
+        raise InvalidVersion(value) from None
+    if version < 0:
+        raise InvalidVersion(value)
+    return version
+
+def default_db_path():
+    """$XDG_DATA_HOME/manna (~/.local/share/manna): user data, never the source tree."""
+    data_home = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(data_home, "manna", "manna_inventory.db")
+
+def store_from_env(master_index=None):
+    """MANNA_INVENTORY_DB, defaulting to default_db_path()."""
+    db_path = os.environ.get("MANNA_INVENTORY_DB") or default_db_path()
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    return InventoryStore(db_path, master_index)
@@ -0,0 +1,182 @@
+import json
+
+# --- 1. THE INCREMENTAL EXTRACTOR ---
+class IncrementalJSONParser:
+    """
+    Fault-tolerant, incremental extractor for one streamed JSON object.
+
+    Feed it model text as it arrives; it skips chatter and ```json fences before the
+    first bracket, tracks strings/escapes/nesting, and reports every top-level field
+    and every element of a top-level list the moment its closing character arrives.
+    The wrappers clean_gemini_json accepts are unwrapped the same way: '[{...}]' and
+    '{"recipes": [{...}]}' to their first object, '{"recipes": {...}}' to the inner
+    one. Each completed value is parsed exactly once, so the whole stream costs O(n).
+
+    feed() returns a list of events:
+        ("field", key, value)  - a top-level field is complete
+        ("item", key, value)   - one element of a top-level list is complete
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0
+        self.stack = []
+        self.root_depth = None
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.done = False
+        self.result = {}
+        self.errors = 0
+        self.unwrapped = False
+
+    # --- Frame helpers ---
+    def _expects_value(self, frame):
+        return frame["start"] is None and (frame["type"] == "[" or frame["state"] == "value")
+
+    def _mark_start(self, index):
+        if self.stack and self._expects_value(self.stack[-1]):
+            self.stack[-1]["start"] = index
+
+    def _complete(self, frame, end, events):
+        """A value inside `frame` (always the innermost open container) has just ended at `end`."""
+        text = self.buf[frame["start"]:end].strip()
+        frame["start"] = None
+        key = frame.get("key")
+        if frame["type"] == "{":
+            frame["state"] = "key"
+        depth = len(self.stack)
+        if not text or self.root_depth is None or depth < self.root_depth:
+            return
+        try:
+            value = json.loads(text)
+        except ValueError:
+            self.errors += 1
+            return
+
+        if depth == self.root_depth and frame["type"] == "{":
+            self.result[key] = value
+            events.append(("field", key, value))
+        elif depth == self.root_depth + 1 and frame["type"] == "[":
+            parent_key = self.stack[self.root_depth - 1].get("key")
+            self.result.setdefault(parent_key, []).append(value)
+            events.append(("item", parent_key, value))
+
+    # --- Main loop ---
+    def feed(self, chunk):
+        events = []
+        if self.done or not chunk:
+            return events
+        self.buf += chunk
+
+        while self.pos < len(self.buf) and not self.done:
+            i = self.pos
+            c = self.buf[i]
+            self.pos += 1
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+                    self._end_string(i, events)
+                continue
+
+            if not self.stack:
+                # Chatter or code fences before the JSON starts
+                if c in "{[":
+                    self.stack.append(self._frame(c))
+                    if c == "{":
+                        self.root_depth = 1
+                continue
+
+            frame = self.stack[-1]
+            if c == '"':
+                if frame["type"] == "{" and frame["state"] == "key":
+                    frame["key_start"] = i
+                else:
+                    self._mark_start(i)
+                self.in_string = True
+                self.string_start = i
+            elif c in "{[":
+                if self._is_wrapper(frame):
+                    self._unwrap(c)
+                    continue
+                self._mark_start(i)
+                self.stack.append(self._frame(c))
+                if self.root_depth is None and c == "{":
+                    self.root_depth = len(self.stack)
+            elif c in "}]":
+                if frame["start"] is not None:
+                    self._complete(frame, i, events)
+                self.stack.pop()
+                if self.root_depth is not None and len(self.stack) < self.root_depth:
+                    self.done = True
+                elif self.stack and self.stack[-1]["start"] is not None:
+                    self._complete(self.stack[-1], i + 1, events)
+            elif c == ",":
+                if frame["start"] is not None:
+                    self._complete(frame, i, events)
+            elif c == ":":
+                if frame["type"] == "{":
+                    frame["state"] = "value"
+            elif not c.isspace():
+                self._mark_start(i)
+        return events
+
+    def _is_wrapper(self, frame):
+        """The value of 'recipes' in the outermost object is about to open."""
+        return (not self.unwrapped and len(self.stack) == 1 and self.root_depth == 1
+                and frame["type"] == "{" and frame["state"] == "value" and frame["key"] == "recipes")
+
+    def _unwrap(self, kind):
+        """Re-roots on the wrapped recipe: fields already seen belonged to the wrapper."""
+        self.unwrapped = True
+        self.result = {}
+        self.stack.append(self._frame(kind))
+        # A list wrapper waits for its first object, like a top-level list
+        self.root_depth = len(self.stack) if kind == "{" else None
+
+    def _frame(self, kind):
+        return {"type": kind, "state": "key", "key": None, "key_start": None, "start": None}
+
+    def _end_string(self, i, events):
+        frame = self.stack[-1]
+        if frame["type"] == "{" and frame["state"] == "key" and frame["key_start"] is not None:
+            try:
+                frame["key"] = json.loads(self.buf[frame["key_start"]:i + 1])
+            except ValueError:
+                self.errors += 1
+                frame["key"] = None
+            frame["key_start"] = None
+        elif frame["start"] == self.string_start:
+            self._complete(frame, i + 1, events)
+
+    def finish(self):
+        """Everything assembled so far; a truncated stream still yields its completed fields."""
+        return self.result
+
+# --- 2. SERVER-SENT EVENTS ---
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def recipe_sse_events(parser_events):
+    """Maps parser events onto the recipe stream: fields, then one event per ingredient/step."""
+    out = []
+    for kind, key, value in parser_events:
+        if kind == "item" and key == "ingredients":
+            out.append(sse_event("ingredient", value))
+        elif kind == "item" and key == "instructions":
+            out.append(sse_event("instruction", value))
+        elif kind == "field" and key not in ("ingredients", "instructions"):
+            out.append(sse_event("field", {"key": key, "value": value}))
+    return out
+
+def cached_recipe_sse(recipe):
+    """Replays a finished recipe through the same event shapes as a live stream."""
+    events = [("field", k, v) for k, v in recipe.items() if k not in ("ingredients", "instructions")]
+    events += [("item", "ingredients", v) for v in recipe.get("ingredients", [])]
+    events += [("item", "instructions", v) for v in recipe.get("instructions", [])]
+    return recipe_sse_events(events) + [sse_event("done", recipe)]
@@ -0,0 +1,550 @@
+import os
+import time
+import base64
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from llm_scheduler import prompt_parts, is_retryable
+
+# --- 1. MODEL CLIENTS ---
+class ChatResponse:
+    """The bits of a Gemini response the backend reads (.text, .usage_metadata), for chat completions."""
+
+    def __init__(self, text, usage=None):
+        self.text = text or ""
+        self.usage_metadata = type("Usage", (), {
+            "prompt_token_count": getattr(usage, "prompt_tokens", None),
+            "candidates_token_count": getattr(usage, "completion_tokens", None),
+            "total_token_count": getattr(usage, "total_tokens", None),
+        })()
+
+class OpenAIChatModel:
+    """
+    genai.GenerativeModel look-alike over any OpenAI-compatible chat completions API
+    (OpenAI, Azure, vLLM, Ollama, OpenRouter): same generate_content(_async) calls, same
+    multimodal prompt lists, request_options={'timeout': s} mapped to the client timeout.
+    JSON mode is left off on purpose: it forces an object and /api/shop asks for an array.
+    """
+
+    def __init__(self, model, system_instruction=None, api_key=None, base_url=None):
+        import openai
+        self.model = model
+        self.system_instruction = system_instruction
+        # The scheduler is the one retry layer (MANNA_LLM_MAX_RETRIES); the SDK's own 2 retries would multiply it
+        self.client = openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.async_client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+    def _messages(self, prompt):
+        content = []
+        for part in prompt_parts(prompt):
+            if isinstance(part, str):
+                content.append({"type": "text", "text": part})
+            else:
+                data = base64.b64encode(part["data"]).decode("ascii")
+                content.append({"type": "image_url", "image_url": {"url": f"data:{part['mime_type']};base64,{data}"}})
+        if all(item["type"] == "text" for item in content):
+            content = "\n".join(item["text"] for item in content)
+        messages = [{"role": "user", "content": content}]
+        if self.system_instruction:
+            messages.insert(0, {"role": "system", "content": self.system_instruction})
+        return messages
+
+    def _request(self, prompt, stream, request_options=None):
+        request = {"model": self.model, "messages": self._messages(prompt)}
+        if stream:
+            request.update(stream=True, stream_options={"include_usage": True})
+        if request_options and request_options.get("timeout"):
+            request["timeout"] = request_options["timeout"]
+        return request
+
+    @staticmethod
+    def _chunk(chunk):
+        piece = chunk.choices[0].delta.content if chunk.choices else None
+        return ChatResponse(piece, getattr(chunk, "usage", None))
+
+    def generate_content(self, prompt, stream=False, request_options=None, **kwargs):
+        response = self.client.chat.completions.create(**self._request(prompt, stream, request_options))
+        if stream:
+            return (self._chunk(chunk) for chunk in response)
+        return ChatResponse(response.choices[0].message.content, response.usage)
+
+    async def generate_content_async(self, prompt, stream=False, request_options=None, **kwargs):
+        response = await self.async_client.chat.completions.create(**self._request(prompt, stream, request_options))
+        if stream:
+            return self._stream_async(response)
+        return ChatResponse(response.choices[0].message.content, response.usage)
+
+    async def _stream_async(self, chunks):
+        async for chunk in chunks:
+            yield self._chunk(chunk)
+
+class SingleAttemptGemini:
+    """
+    genai.GenerativeModel with the SDK's own retries off (its gRPC layer retries 503s for
+    up to 600s by default), so the scheduler's MANNA_LLM_MAX_RETRIES is the only retry layer.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    @staticmethod
+    def _options(request_options):
+        return {**(request_options or {}), "retry": None}
+
+    def generate_content(self, prompt, request_options=None, **kwargs):
+        return self.model.generate_content(prompt, request_options=self._options(request_options), **kwargs)
+
+    async def generate_content_async(self, prompt, request_options=None, **kwargs):
+        return await self.model.generate_content_async(prompt, request_options=self._options(request_options), **kwargs)
+
+# --- 2. PROVIDER HEALTH ---
+class ProvidersUnavailable(Exception):
+    """Every provider's breaker is open; 503 so the scheduler backs off and tries again."""
+    code = 503
+
+class InvalidAnswer(Exception):
+    """A provider answered, but with nothing usable (empty or blocked text)."""
+
+def counts_against(error):
+    """Outages, throttling, timeouts and empty answers count against a provider; our own bad requests (4xx) don't."""
+    if isinstance(error, InvalidAnswer) or is_retryable(error):
+        return True
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    code = getattr(code, "value", code)
+    return not (isinstance(code, int) and 400 <= code < 500)
+
+# Latency assumed for a provider that has never answered, so it ranks behind every one that has
+UNKNOWN_LATENCY = 10.0
+
+class Provider:
+    """
+    One model backend behind the router: a lazily built client (built after the fork,
+    like the single model) plus its rolling health.
+
+    - latency: EWMA of successful call seconds; error_rate: EWMA of failures (0/1).
+    - The last `window` latencies give the p95 a hedge waits for.
+    - Circuit breaker: `failures` failures in a row open it for `cooldown` seconds, then
+      one trial call is let through (half-open); its outcome closes or reopens it.
+    """
+
+    def __init__(self, name, factory, alpha=0.2, window=200, failures=5, cooldown=30.0):
+        self.name = name
+        self.factory = factory
+        self.alpha = alpha
+        self.failures_to_open = failures
+        self.cooldown = cooldown
+        self.latency = None
+        self.error_rate = 0.0
+        self.recent = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.counters = {"calls": 0, "failures": 0, "invalid": 0, "wins": 0, "hedges": 0, "opened": 0}
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self.factory()
+        return self._client
+
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def acquire(self):
+        """False while the breaker is open; half-open lets exactly one trial call through."""
+        with self._lock:
+            state = self.state()
+            if state == "half-open" and not self.trial:
+                self.trial = True
+                return True
+            return state == "closed"
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def release(self):
+        """A call that was abandoned (a cancelled hedge loser) frees the half-open trial slot."""
+        with self._lock:
+            self.trial = False
+
+    def record(self, seconds, error=None):
+        with self._lock:
+            self.counters["calls"] += 1
+            failed = error is not None and counts_against(error)
+            self.error_rate += self.alpha * ((1.0 if failed else 0.0) - self.error_rate)
+            if error is None:
+                self.latency = seconds if self.latency is None else self.latency + self.alpha * (seconds - self.latency)
+                self.recent.append(seconds)
+                self.consecutive_failures, self.opened_at, self.trial = 0, None, False
+                return
+            self.counters["failures"] += 1
+            if isinstance(error, InvalidAnswer):
+                self.counters["invalid"] += 1
+            if not failed:
+                self.trial = False
+                return
+            self.consecutive_failures += 1
+            if self.trial or (self.opened_at is None and self.consecutive_failures >= self.failures_to_open):
+                self.opened_at, self.trial = time.monotonic(), False
+                self.counters["opened"] += 1
+
+    def score(self):
+        """
+        Expected seconds per usable answer. Untried providers score 0 so each gets sampled
+        once; one that has only failed so far is assumed slow (UNKNOWN_LATENCY).
+        """
+        if self.latency is None and not self.counters["calls"]:
+            return 0.0
+        latency = self.latency if self.latency is not None else UNKNOWN_LATENCY
+        return latency / max(0.05, 1.0 - self.error_rate)
+
+    def quantile(self, q):
+        if len(self.recent) < 10:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self):
+        with self._lock:
+            p95 = self.quantile(0.95)
+            return {
+                "name": self.name,
+                "state": self.state(),
+                "latencyMs": round(self.latency * 1000, 1) if self.latency is not None else None,
+                "p95Ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "errorRate": round(self.error_rate, 4),
+                **self.counters,
+            }
+
+# --- 3. THE ROUTER ---
+def has_text(response):
+    """Default answer check: non-empty text (.text raises on a blocked Gemini answer)."""
+    return bool(response.text.strip())
+
+class ProviderRouter:
+    """
+    Stands in for the single model client, so the scheduler, recorder and routes are
+    unchanged. Each call goes to the provider with the best latency/error EWMA whose
+    breaker is closed (with a small `explore` share to the others so their numbers stay
+    fresh), and fails over down that order when a provider errors or answers nothing.
+
+    With `hedge`, a non-streamed call that has not answered by the provider's p95 (or
+    `hedge_default` until there are enough samples) is also sent to the next provider;
+    the first usable answer wins. Hedges only fire in the tail, roughly 5% of calls, and
+    the scheduler's in-flight cap counts a hedged call once. Streams are never hedged
+    and only fail over before their first chunk.
+    """
+
+    def __init__(self, providers, hedge=False, hedge_quantile=0.95, hedge_min=0.25, hedge_default=4.0,
+                 explore=0.02, accept=has_text):
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min = hedge_min
+        self.hedge_default = hedge_default
+        self.explore = explore
+        self.accept = accept
+        self.counters = {"calls": 0, "failovers": 0, "hedged": 0, "hedgeWins": 0, "unavailable": 0}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def ranked(self):
+        ready = [p for p in self.providers if p.state() != "open"]
+        ready.sort(key=lambda p: (p.score(), self.providers.index(p)))
+        if len(ready) > 1 and random.random() < self.explore:
+            ready.insert(0, ready.pop(random.randrange(1, len(ready))))
+        return ready
+
+    def hedge_delay(self, provider):
+        p95 = provider.quantile(self.hedge_quantile)
+        return max(self.hedge_min, p95 if p95 is not None else self.hedge_default)
+
+    def _next(self, order):
+        """Pops providers off `order` until one lets a call through (an open breaker or a taken trial doesn't)."""
+        while order:
+            provider = order.pop(0)
+            if provider.acquire():
+                return provider
+        return None
+
+    def _checked(self, provider, response):
+        try:
+            usable = self.accept(response)
+        except Exception as e:
+            raise InvalidAnswer(f"{provider.name}: {e}") from e
+        if not usable:
+            raise InvalidAnswer(f"{provider.name} returned an empty answer")
+        return response
+
+    def _unavailable(self, last_error):
+        if last_error is not None:
+            raise last_error
+        self._count("unavailable")
+        raise ProvidersUnavailable("No model provider available (all circuit breakers open)")
+
+    # --- sync path ---
+    def _call(self, provider, prompt, kwargs):
+        start = time.perf_counter()
+        try:
+            response = self._checked(provider, provider.client.generate_content(prompt, **kwargs))
+        except Exception as e:
+            provider.record(time.perf_counter() - start, e)
+            raise
+        provider.record(time.perf_counter() - start)
+        return response
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        self._count("calls")
+        order = self.ranked()
+        if stream:
+            return self._stream(order, prompt, kwargs)
+        if self.hedge and len(order) > 1:
+            return self._hedged(order, prompt, kwargs)
+        last_error = None
+        while (provider := self._next(order)) is not None:
+            try:
+                return self._won(provider, self._call(provider, prompt, kwargs))
+            except Exception as e:
+                last_error = e
+                if order:
+                    self._count("failovers")
+        self._unavailable(last_error)
+
+    def _won(self, provider, response, hedged=False):
+        provider.count("wins")
+        if hedged:
+            self._count("hedgeWins")
+        return response
+
+    def _submit(self, provider, prompt, kwargs):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=64, thread_name_prefix="manna-hedge")
+        # Copy the context so the request's trace and recording follow the call onto the pool thread
+        future = self._pool.submit(contextvars.copy_context().run, self._call, provider, prompt, kwargs)
+        future.provider, future.hedge = provider, False
+        return future
+
+    def _hedged(self, order, prompt, kwargs):
+        provider = self._next(order)
+        if provider is None:
+            self._unavailable(None)
+        running = {self._submit(provider, prompt, kwargs)}
+        hedge_at = time.monotonic() + self.hedge_delay(provider)
+        last_error = None
+        while running:
+            timeout = max(0.0, hedge_at - time.monotonic()) if hedge_at is not None else None
+            done, running = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # The first call is in its tail: race it against the next provider. Losers run to completion
+                # (a sync call can't be cancelled) and still feed their provider's numbers.
+                hedge_at = None
+                backup = self._next(order)
+                if backup is not None:
+                    self._count("hedged")
+                    backup.count("hedges")
+                    hedge = self._submit(backup, prompt, kwargs)
+                    hedge.hedge = True
+                    running.add(hedge)
+                continue
+            for future in done:
+                try:
+                    return self._won(future.provider, future.result(), hedged=getattr(future, "hedge", False))
+                except Exception as e:
+                    last_error = e
+            if not running and (backup := self._next(order)) is not None:
+                self._count("failovers")
+                running.add(self._submit(backup, prompt, kwargs))
+        self._unavailable(last_error)
+
+    def _stream(self, order, prompt, kwargs):
+        last_error = None
+        while (provider := self._next(order)) is not None:
+            start = time.perf_counter()
+            try:
+                chunks = provider.client.generate_content(prompt, stream=True, **kwargs)
+            except Exception as e:
+                provider.record(time.perf_counter() - start, e)
+                last_error = e
+                if order:
+                    self._count("failovers")
+                continue
+            self._won(provider, None)
+            return self._relay(provider, chunks, start)
+        self._unavailable(last_error)
+
+    @staticmethod
+    def _relay(provider, chunks, start):
+        try:
+            yield from chunks
+        except GeneratorExit:
+            # The client went away mid-stream: no verdict on the provider
+            provider.release()
+            raise
+        except Exception as e:
+            provider.record(time.perf_counter() - start, e)
+            raise
+        provider.record(time.perf_counter() - start)
+
+    # --- async path ---
+    async def _call_async(self, provider, prompt, kwargs):
+        start = time.perf_counter()
+        try:
+            response = self._checked(provider, await provider.client.generate_content_async(prompt, **kwargs))
+        except asyncio.CancelledError:
+            provider.release()
+            raise
+        except Exception as e:
+            provider.record(time.perf_counter() - start, e)
+            raise
+        provider.record(time.perf_counter() - start)
+        return response
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        self._count("calls")
+        order = self.ranked()
+        if stream:
+            return await self._stream_async(order, prompt, kwargs)
+        if self.hedge and len(order) > 1:
+            return await self._hedged_async(order, prompt, kwargs)
+        last_error = None
+        while (provider := self._next(order)) is not None:
+            try:
+                return self._won(provider, await self._call_async(provider, prompt, kwargs))
+            except Exception as e:
+                last_error = e
+                if order:
+                    self._count("failovers")
+        self._unavailable(last_error)
+
+    async def _hedged_async(self, order, prompt, kwargs):
+        provider = self._next(order)
+        if provider is None:
+            self._unavailable(None)
+        tasks = {asyncio.ensure_future(self._call_async(provider, prompt, kwargs)): provider}
+        running, hedges = set(tasks), set()
+        hedge_at = time.monotonic() + self.hedge_delay(provider)
+        last_error = None
+        try:
+            while running:
+                timeout = max(0.0, hedge_at - time.monotonic()) if hedge_at is not None else None
+                done, running = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedge_at = None
+                    backup = self._next(order)
+                    if backup is not None:
+                        self._count("hedged")
+                        backup.count("hedges")
+                        task = asyncio.ensure_future(self._call_async(backup, prompt, kwargs))
+                        tasks[task] = backup
+                        hedges.add(task)
+                        running.add(task)
+                    continue
+                for task in done:
+                    try:
+                        return self._won(tasks[task], task.result(), hedged=task in hedges)
+                    except Exception as e:
+                        last_error = e
+                if not running and (backup := self._next(order)) is not None:
+                    self._count("failovers")
+                    task = asyncio.ensure_future(self._call_async(backup, prompt, kwargs))
+                    tasks[task] = backup
+                    running.add(task)
+        finally:
+            # Unlike threads, the losing coroutine can be stopped
+            for task in running:
+                task.cancel()
+        self._unavailable(last_error)
+
+    async def _stream_async(self, order, prompt, kwargs):
+        last_error = None
+        while (provider := self._next(order)) is not None:
+            start = time.perf_counter()
+            try:
+                chunks = await provider.client.generate_content_async(prompt, stream=True, **kwargs)
+            except Exception as e:
+                provider.record(time.perf_counter() - start, e)
+                last_error = e
+                if order:
+                    self._count("failovers")
+                continue
+            self._won(provider, None)
+            return self._relay_async(provider, chunks, start)
+        self._unavailable(last_error)
+
+    @staticmethod
+    async def _relay_async(provider, chunks, start):
+        try:
+            async for chunk in chunks:
+                yield chunk
+        except (GeneratorExit, asyncio.CancelledError):
+            provider.release()
+            raise
+        except Exception as e:
+            provider.record(time.perf_counter() - start, e)
+            raise
+        provider.record(time.perf_counter() - start)
+
+    # --- visibility ---
+    def provider_stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return {"providers": [provider.stats() for provider in self.providers], "hedging": self.hedge, **counters}
+
+# --- 4. CONFIGURATION ---
+def router_from_env(gemini_factory, system_instruction=None):
+    """
+    MANNA_LLM_PROVIDERS=gemini,openai[,stub] turns the router on (unset: the single Gemini
+    client as before); the order is the preference until there are latency numbers.
+
+    - openai: OPENAI_API_KEY, MANNA_OPENAI_MODEL (gpt-4o-mini), MANNA_OPENAI_BASE_URL for
+      any other OpenAI-compatible server.
+    - stub: the local FakeModel (MANNA_STUB_LATENCY seconds), for offline runs only; it
+      answers with canned recipes.
+    - MANNA_LLM_HEDGE=1 enables hedging (MANNA_LLM_HEDGE_MIN_MS, MANNA_LLM_HEDGE_DEFAULT_MS).
+    - MANNA_LLM_BREAKER_FAILURES / MANNA_LLM_BREAKER_COOLDOWN tune the circuit breaker.
+    """
+    names = [name.strip().lower() for name in os.environ.get("MANNA_LLM_PROVIDERS", "").split(",") if name.strip()]
+    if not names:
+        return None
+
+    def openai_factory():
+        return OpenAIChatModel(os.environ.get("MANNA_OPENAI_MODEL", "gpt-4o-mini"), system_instruction,
+                               api_key=os.environ.get("OPENAI_API_KEY"),
+                               base_url=os.environ.get("MANNA_OPENAI_BASE_URL") or None)
+
+    def stub_factory():
+        from fake_model import FakeModel
+        return FakeModel(latency=float(os.environ.get("MANNA_STUB_LATENCY", 0)))
+
+    factories = {"gemini": gemini_factory, "openai": openai_factory, "stub": stub_factory}
+    unknown = set(names) - factories.keys()
+    if unknown:
+        raise ValueError(f"Unknown MANNA_LLM_PROVIDERS entries: {', '.join(sorted(unknown))}")
+
+    breaker = {
+        "failures": int(os.environ.get("MANNA_LLM_BREAKER_FAILURES", 5)),
+        "cooldown": float(os.environ.get("MANNA_LLM_BREAKER_COOLDOWN", 30)),
+    }
+    return ProviderRouter(
+        [Provider(name, factories[name], **breaker) for name in dict.fromkeys(names)],
+        hedge=os.environ.get("MANNA_LLM_HEDGE", "0") == "1",
+        hedge_min=float(os.environ.get("MANNA_LLM_HEDGE_MIN_MS", 250)) / 1000,
+        hedge_default=float(os.environ.get("MANNA_LLM_HEDGE_DEFAULT_MS", 4000)) / 1000,
+    )
@@ -0,0 +1,356 @@
+import os
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+
+# Lower number = served first when both lanes are waiting
+LANES = {"interactive": 0, "background": 1}
+
+# Errors worth retrying: quota (429), server errors and timeouts from the Gemini/OpenAI SDKs
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "RateLimitError", "APITimeoutError", "APIConnectionError", "TimeoutError",
+}
+
+def is_retryable(error):
+    code = getattr(error, "code", None)
+    code = getattr(code, "value", code)
+    if isinstance(code, int) and code in RETRYABLE_CODES:
+        return True
+    return type(error).__name__ in RETRYABLE_NAMES
+
+# Gemini charges 258 tokens per 768px tile; a 1024px scan photo is up to 4 tiles
+IMAGE_TOKENS = 1032
+
+def prompt_parts(prompt):
+    """A prompt is a string or a multimodal list of strings and {'mime_type', 'data'} blobs."""
+    return prompt if isinstance(prompt, (list, tuple)) else [prompt]
+
+def estimate_tokens(prompt):
+    total = 0
+    for part in prompt_parts(prompt):
+        total += len(part) // 4 if isinstance(part, str) else IMAGE_TOKENS
+    return max(1, total)
+
+# --- 1. TOKEN BUCKET ---
+class TokenBucket:
+    """Classic refilling bucket; capacity is the per-minute quota (0 disables it)."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` is available (0 if it is now)."""
+        if not self.capacity:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        if self.capacity:
+            self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        if self.capacity:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+# --- 2. THE SCHEDULER ---
+class LLMScheduler:
+    """
+    Shared front door for every model call.
+
+    - max_in_flight caps concurrent calls; 'interactive' waiters always go before 'background'.
+    - Requests-per-minute and tokens-per-minute token buckets keep us under the Gemini quota.
+    - Retryable errors (429/5xx/timeouts) back off exponentially with full jitter.
+    - Identical prompts already in flight are coalesced onto one call (single-flight).
+    """
+
+    def __init__(self, get_model, max_in_flight=32, rpm=0, tpm=0, max_retries=3,
+                 base_backoff=0.5, max_backoff=8.0, expected_output_tokens=800):
+        self.get_model = get_model
+        self.max_in_flight = max_in_flight
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.expected_output_tokens = expected_output_tokens
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._waiting = {lane: 0 for lane in LANES}
+        self._pending = {}          # single-flight key -> Future (thread path)
+        self._pending_async = {}    # single-flight key -> asyncio.Future (event-loop path)
+        self.counters = {"calls": 0, "coalesced": 0, "retries": 0, "failures": 0, "throttled": 0}
+        self._wait_total = {lane: 0.0 for lane in LANES}
+        self._wait_count = {lane: 0 for lane in LANES}
+        self._wait_max = {lane: 0.0 for lane in LANES}
+
+    # --- admission ---
+    def _try_acquire(self, lane, cost):
+        """Returns 0 when a slot was taken, otherwise how long to wait before trying again."""
+        rank = LANES.get(lane, 1)
+        if any(self._waiting[other] for other, r in LANES.items() if r < rank):
+            return 0.05
+        if self._in_flight >= self.max_in_flight:
+            return 0.05
+        delay = max(self.requests.wait_time(1), self.tokens.wait_time(cost))
+        if delay > 0:
+            self.counters["throttled"] += 1
+            return delay
+        self.requests.take(1)
+        self.tokens.take(cost)
+        self._in_flight += 1
+        return 0.0
+
+    def _record_wait(self, lane, waited):
+        self._wait_total[lane] += waited
+        self._wait_count[lane] += 1
+        self._wait_max[lane] = max(self._wait_max[lane], waited)
+
+    def _acquire(self, lane, cost):
+        start = time.monotonic()
+        with self._cond:
+            self._waiting[lane] += 1
+            try:
+                while True:
+                    delay = self._try_acquire(lane, cost)
+                    if delay == 0:
+                        break
+                    self._cond.wait(timeout=delay)
+            finally:
+                self._waiting[lane] -= 1
+            self._record_wait(lane, time.monotonic() - start)
+
+    async def _acquire_async(self, lane, cost):
+        start = time.monotonic()
+        with self._lock:
+            self._waiting[lane] += 1
+        try:
+            while True:
+                with self._lock:
+                    delay = self._try_acquire(lane, cost)
+                if delay == 0:
+                    break
+                await asyncio.sleep(min(delay, 0.05))
+        finally:
+            with self._lock:
+                self._waiting[lane] -= 1
+                self._record_wait(lane, time.monotonic() - start)
+
+    def _release(self, cost, response=None):
+        with self._cond:
+            self._in_flight -= 1
+            # Settle the token estimate against what the model actually reported
+            usage = getattr(response, "usage_metadata", None)
+            actual = getattr(usage, "total_token_count", None)
+            if isinstance(actual, int) and actual < cost:
+                self.tokens.give_back(cost - actual)
+            self._cond.notify_all()
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+
+    def _key(self, prompt, kwargs):
+        digest = hashlib.sha256()
+        for part in prompt_parts(prompt):
+            data = part.get("data", b"") if isinstance(part, dict) else part
+            digest.update(data if isinstance(data, bytes) else str(data).encode("utf-8"))
+            digest.update(b"\0")
+        digest.update(repr(sorted(kwargs.items())).encode("utf-8"))
+        return digest.hexdigest()
+
+    # --- sync path (Flask workers and threads) ---
+    def _call(self, prompt, lane, kwargs):
+        cost = estimate_tokens(prompt) + self.expected_output_tokens
+        attempt = 0
+        while True:
+            self._acquire(lane, cost)
+            response = None
+            try:
+                with self._lock:
+                    self.counters["calls"] += 1
+                response = self.get_model().generate_content(prompt, **kwargs)
+                return response
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    with self._lock:
+                        self.counters["failures"] += 1
+                    raise
+                with self._lock:
+                    self.counters["retries"] += 1
+            finally:
+                self._release(cost, response)
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def generate(self, prompt, lane="interactive", **kwargs):
+        if kwargs.get("stream"):
+            return self._stream(prompt, lane, kwargs)
+
+        key = self._key(prompt, kwargs)
+        with self._lock:
+            leader = key not in self._pending
+            if leader:
+                future = self._pending[key] = Future()
+            else:
+                future = self._pending[key]
+                self.counters["coalesced"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            response = self._call(prompt, lane, kwargs)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            if not future.done():
+                # The leader died of a BaseException; followers must not wait forever
+                future.set_exception(RuntimeError("Coalesced model call was aborted"))
+
+    def _stream(self, prompt, lane, kwargs):
+        """Streams hold their slot until the last chunk; they are never coalesced or retried mid-stream."""
+        cost = estimate_tokens(prompt) + self.expected_output_tokens
+        self._acquire(lane, cost)
+        with self._lock:
+            self.counters["calls"] += 1
+        try:
+            chunks = self.get_model().generate_content(prompt, **kwargs)
+        except Exception:
+            self._release(cost)
+            with self._lock:
+                self.counters["failures"] += 1
+            raise
+
+        def relay():
+            try:
+                yield from chunks
+            finally:
+                self._release(cost)
+        return relay()
+
+    # --- async path (ASGI app) ---
+    async def _call_async(self, prompt, lane, kwargs):
+        cost = estimate_tokens(prompt) + self.expected_output_tokens
+        attempt = 0
+        while True:
+            await self._acquire_async(lane, cost)
+            response = None
+            try:
+                with self._lock:
+                    self.counters["calls"] += 1
+                response = await self.get_model().generate_content_async(prompt, **kwargs)
+                return response
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    with self._lock:
+                        self.counters["failures"] += 1
+                    raise
+                with self._lock:
+                    self.counters["retries"] += 1
+            finally:
+                self._release(cost, response)
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def generate_async(self, prompt, lane="interactive", **kwargs):
+        if kwargs.get("stream"):
+            return await self._stream_async(prompt, lane, kwargs)
+
+        key = self._key(prompt, kwargs)
+        future = self._pending_async.get(key)
+        if future is not None:
+            with self._lock:
+                self.counters["coalesced"] += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The leader was cancelled (its client went away), not us: make the call ourselves
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                return await self.generate_async(prompt, lane, **kwargs)
+
+        future = self._pending_async[key] = asyncio.get_running_loop().create_future()
+        try:
+            response = await self._call_async(prompt, lane, kwargs)
+            future.set_result(response)
+            return response
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; don't let asyncio warn about an unretrieved error
+            future.exception()
+            raise
+        finally:
+            self._pending_async.pop(key, None)
+            # Cancelled (or any other BaseException): wake the followers instead of leaving them hanging
+            if not future.done():
+                future.cancel()
+
+    async def _stream_async(self, prompt, lane, kwargs):
+        cost = estimate_tokens(prompt) + self.expected_output_tokens
+        await self._acquire_async(lane, cost)
+        with self._lock:
+            self.counters["calls"] += 1
+        try:
+            chunks = await self.get_model().generate_content_async(prompt, **kwargs)
+        except Exception:
+            self._release(cost)
+            with self._lock:
+                self.counters["failures"] += 1
+            raise
+
+        async def relay():
+            try:
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                self._release(cost)
+        return relay()
+
+    # --- visibility ---
+    def stats(self):
+        with self._lock:
+            return {
+                "inFlight": self._in_flight,
+                "maxInFlight": self.max_in_flight,
+                "queueDepth": dict(self._waiting),
+                "avgWaitSeconds": {
+                    lane: round(self._wait_total[lane] / self._wait_count[lane], 4) if self._wait_count[lane] else 0.0
+                    for lane in LANES
+                },
+                "maxWaitSeconds": {lane: round(v, 4) for lane, v in self._wait_max.items()},
+                "requestTokensLeft": round(self.requests.tokens, 1) if self.requests.capacity else None,
+                "tokenBudgetLeft": round(self.tokens.tokens) if self.tokens.capacity else None,
+                **self.counters,
+            }
+
+def scheduler_from_env(get_model):
+    """MANNA_LLM_MAX_IN_FLIGHT / MANNA_LLM_RPM / MANNA_LLM_TPM / MANNA_LLM_MAX_RETRIES (0 = no limit)."""
+    return LLMScheduler(
+        get_model,
+        max_in_flight=int(os.environ.get("MANNA_LLM_MAX_IN_FLIGHT", 32)),
+        rpm=int(os.environ.get("MANNA_LLM_RPM", 0)),
+        tpm=int(os.environ.get("MANNA_LLM_TPM", 0)),
+        max_retries=int(os.environ.get("MANNA_LLM_MAX_RETRIES", 3)),
+    )
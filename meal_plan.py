@@ -0,0 +1,118 @@
+import json
+import math
+
+MEALS = ("Breakfast", "Lunch", "Dinner")
+
+class IncompletePlan(Exception):
+    """Some day windows came back unparseable or short; such a plan is never served or cached."""
+
+    def __init__(self, windows):
+        self.windows = windows
+        spans = ", ".join(f"{first}-{last}" if first != last else str(first) for first, last in windows)
+        super().__init__(f"The model gave no usable plan for days {spans}")
+
+# --- 1. CHUNKING & RATIONING ---
+def plan_chunks(days, chunk_days):
+    """Splits days 1..N into (first_day, last_day) windows that can be generated in parallel."""
+    chunk_days = max(1, int(chunk_days))
+    return [(start, min(start + chunk_days - 1, days)) for start in range(1, days + 1, chunk_days)]
+
+def allot_inventory(inventory, days, chunks):
+    """
+    Splits every inventory item across the chunks up front so parallel generations
+    can't double-spend it. Quantities are shared evenly over the days the item is
+    still good for; anything expiring before a chunk starts gets no share there.
+    Returns one allotted inventory list per chunk.
+    """
+    allotments = [[] for _ in chunks]
+    for item in inventory or []:
+        try:
+            quantity = float(item.get('quantity', 0))
+        except (TypeError, ValueError):
+            quantity = 0
+        try:
+            usable_days = min(days, max(1, int(item.get('daysLeft', days))))
+        except (TypeError, ValueError):
+            usable_days = days
+
+        for pos, (first, last) in enumerate(chunks):
+            overlap = max(0, min(last, usable_days) - first + 1)
+            if overlap <= 0 or quantity <= 0:
+                continue
+            share = dict(item)
+            # Round down so the windows never add up to more than the user has
+            share['quantity'] = math.floor(quantity * overlap / usable_days * 10) / 10
+            if usable_days < days:
+                share['mustUseBy'] = usable_days
+            allotments[pos].append(share)
+    return allotments
+
+# --- 2. THE PROMPT ---
+def build_plan_prompt(profile, allotted, first_day, last_day, target_cals, target_protein, master_db):
+    span = last_day - first_day + 1
+    return f"""
+        Role: Manna AI Meal Planner & Resource Manager
+        You are planning days {first_day} to {last_day} ({span} days) of a meal plan. Create Breakfast, Lunch and Dinner for EACH day.
+
+        STRICT MASTER DATABASE: {master_db}
+
+        User Profile: {json.dumps(profile)}
+        Daily Target: {target_cals} kcal, {target_protein}g protein.
+        Target Cooking Vibe: {profile.get('vibe', 'Speed')}
+        Tastes: {json.dumps(profile.get('tastes', {}))}
+
+        ALLOTTED INVENTORY FOR THESE {span} DAYS: {json.dumps(allotted)}
+
+        RATIONING (ALREADY DONE FOR YOU):
+        1. Each 'quantity' above is the TOTAL you may use across ALL {span * len(MEALS)} meals in this window. The sum of 'amountValue' for an item across the window MUST NOT exceed it.
+        2. Items with 'mustUseBy' set must be fully used on or before that day.
+        3. Spread proteins and fresh produce across days so no day is left with only staples.
+
+        STRICT CONSTRAINTS:
+        1. NO EXTERNAL INGREDIENTS: Use only allotted items (Salt, Pepper, Water, and 1 Oil allowed).
+        2. DIETARY PURITY: Strictly follow the diet specified in the profile.
+        3. MATCHING: 'name' and 'unit' must be an EXACT string match to the allotted inventory. 'amountValue' is a raw Number.
+        4. VARIETY: Do not repeat a recipe title within the window.
+        5. CULINARY ROUNDING: Round grams to the nearest 50g; pieces to whole numbers or halves.
+
+        OUTPUT FORMAT:
+        Return ONLY a single JSON object:
+        {{
+          "days": [
+            {{
+              "day": {first_day},
+              "meals": {{
+                "Breakfast": {{ "id": "unique string", "title": "string", "description": "string", "calories": number,
+                               "macros": {{ "p": number, "c": number, "f": number }}, "time": "string",
+                               "ingredients": [{{ "name": "match inventory exactly", "amount": "150g", "amountValue": 150, "unit": "g" }}],
+                               "instructions": ["string steps"], "image": "https://images.unsplash.com/photo-[ID]?w=800&q=80" }},
+                "Lunch": {{ ...same shape... }},
+                "Dinner": {{ ...same shape... }}
+              }}
+            }}
+          ]
+        }}
+        """
+
+# --- 3. ASSEMBLY ---
+def chunk_days_from(parsed, first_day, last_day):
+    """Pulls the day objects out of one chunk's answer and pins their day numbers to the window."""
+    days = parsed.get('days', []) if isinstance(parsed, dict) else parsed
+    out = []
+    for offset, day in enumerate(days or []):
+        if not isinstance(day, dict):
+            continue
+        number = first_day + offset
+        if number > last_day:
+            break
+        out.append({"day": number, "meals": day.get('meals', {})})
+    return out
+
+def page(plan, day=None):
+    """The whole plan, or just one day of it when the client pages with ?day=N."""
+    if day is None:
+        return plan
+    for entry in plan['days']:
+        if entry['day'] == day:
+            return {"planId": plan['planId'], "daysRemaining": plan['daysRemaining'], "day": entry}
+    return None
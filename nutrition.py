@@ -0,0 +1,132 @@
+import numpy as np
+
+from units import convert, bare_unit
+
+# --- 1. THE COLUMNAR TABLE ---
+class NutritionTable:
+    """
+    ingredients_master.json as NumPy columns (kcal and protein per 100 g), so whole
+    batches of recipe ingredients are scored with one vectorized gather + scatter-add
+    instead of the LLM doing the arithmetic.
+    """
+
+    def __init__(self, master_index):
+        self.master_index = master_index
+        entries = master_index.entries
+        self.kcal_per_100g = np.array([float(e.get('calories_per_100', 0) or 0) for e in entries], dtype=np.float64)
+        self.protein_per_100g = np.array([float(e.get('protein_per_100', 0) or 0) for e in entries], dtype=np.float64)
+
+    def _flatten(self, recipes):
+        """Resolves every ingredient to (recipe number, master row, grams). Unknowns get row -1."""
+        owners, rows, grams, unknown = [], [], [], []
+        for number, recipe in enumerate(recipes):
+            for item in recipe.get('ingredients', []) or []:
+                name = item.get('name', '')
+                pos = self.master_index.find(name)
+                amount = None
+                if pos is not None:
+                    entry = self.master_index.entries[pos]
+                    try:
+                        value = float(item.get('amountValue', 0) or 0)
+                        # No unit: '2' eggs are two eggs, '200' rice is grams, as ShopValidator reads them
+                        amount = convert(value, item.get('unit') or bare_unit(value, entry), 'g', entry)
+                    except (TypeError, ValueError):
+                        amount = None
+                owners.append(number)
+                rows.append(pos if amount is not None else -1)
+                grams.append(amount or 0.0)
+                if amount is None:
+                    unknown.append((number, name))
+        return np.array(owners, dtype=np.intp), np.array(rows, dtype=np.intp), np.array(grams, dtype=np.float64), unknown
+
+    def score(self, recipes):
+        """
+        Returns per-recipe arrays: computed kcal, computed protein (g), and the share of
+        ingredients we could resolve. Everything after name resolution is vectorized.
+        """
+        count = len(recipes)
+        owners, rows, grams, unknown = self._flatten(recipes)
+        kcal = np.zeros(count)
+        protein = np.zeros(count)
+        resolved = np.zeros(count)
+        total = np.zeros(count)
+
+        if rows.size:
+            known = rows >= 0
+            factor = grams[known] / 100.0
+            np.add.at(kcal, owners[known], factor * self.kcal_per_100g[rows[known]])
+            np.add.at(protein, owners[known], factor * self.protein_per_100g[rows[known]])
+            np.add.at(resolved, owners[known], 1)
+            np.add.at(total, owners, 1)
+
+        coverage = np.divide(resolved, total, out=np.ones(count), where=total > 0)
+        return kcal, protein, coverage, unknown
+
+# --- 2. REPORTS ---
+def _reported(recipe, key, macro=None):
+    try:
+        value = recipe.get('macros', {}).get(macro) if macro else recipe.get(key)
+        return float(value)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+def nutrition_report(table, recipes, target_cals, target_protein, days=None):
+    """
+    Scores recipes against the master DB and the get_caloric_needs targets.
+    `days` (optional) is a list of (day number, recipe indexes) pairs for daily totals.
+    """
+    kcal, protein, coverage, unknown = table.score(recipes)
+    per_meal_cals = target_cals / 3.0
+    unknown_by_recipe = {}
+    for number, name in unknown:
+        unknown_by_recipe.setdefault(number, []).append(name)
+
+    rows = []
+    for i, recipe in enumerate(recipes):
+        reported_cals = _reported(recipe, 'calories')
+        rows.append({
+            "id": recipe.get('id'),
+            "title": recipe.get('title'),
+            "calories": round(float(kcal[i])),
+            "protein": round(float(protein[i]), 1),
+            "reportedCalories": reported_cals,
+            "reportedProtein": _reported(recipe, 'macros', 'p'),
+            "calorieDeviationPct": round(100 * (reported_cals - kcal[i]) / kcal[i], 1) if reported_cals is not None and kcal[i] > 0 else None,
+            "pctOfMealTarget": round(100 * float(kcal[i]) / per_meal_cals, 1) if per_meal_cals else None,
+            "coverage": round(float(coverage[i]), 2),
+            "unknownIngredients": unknown_by_recipe.get(i, []),
+        })
+
+    report = {
+        "targets": {"dailyCalories": target_cals, "dailyProtein": target_protein, "perMealCalories": round(per_meal_cals)},
+        "recipes": rows,
+        "totals": {"calories": round(float(kcal.sum())), "protein": round(float(protein.sum()), 1)},
+    }
+
+    if days:
+        daily = []
+        for number, members in days:
+            members = np.array(members, dtype=np.intp)
+            day_cals = float(kcal[members].sum()) if members.size else 0.0
+            day_protein = float(protein[members].sum()) if members.size else 0.0
+            daily.append({
+                "day": number,
+                "calories": round(day_cals),
+                "protein": round(day_protein, 1),
+                "pctOfCalorieTarget": round(100 * day_cals / target_cals, 1) if target_cals else None,
+                "pctOfProteinTarget": round(100 * day_protein / target_protein, 1) if target_protein else None,
+            })
+        report["days"] = daily
+    return report
+
+def plan_recipes(plan):
+    """Flattens a /api/plan result into (recipes, per-day recipe indexes)."""
+    recipes, days = [], []
+    for number, day in enumerate(plan.get('days', []), start=1):
+        members = []
+        for meal in (day.get('meals') or {}).values():
+            if isinstance(meal, dict):
+                members.append(len(recipes))
+                recipes.append(meal)
+        days.append((day.get('day', number), members))
+    return recipes, days
@@ -0,0 +1,499 @@
+import re
+import json
+import math
+import threading
+
+from ingredient_index import normalize_name, is_diet_compatible
+from inventory_matcher import InventoryMatcher
+from ration_planner import ration_constraints
+from recipe_reuse import FREE_STAPLES
+from response_cache import canonical_key
+from shop_optimizer import (retail_amount, nutrition_label, emoji_for, carbs_per_100,
+                            STAPLE_CAP_PER_WEEK, STARCH_CATEGORIES)
+from units import normalize_unit, convert, bare_unit, GRAMS_PER_UNIT, COUNT_UNITS, BARE_GRAMS_FROM
+
+# --- 1. COERCION & ROUNDING ---
+_NUMBER = re.compile(r"\d+(?:\.\d+)?(?:\s*/\s*\d+(?:\.\d+)?)?")
+_VULGAR = {"½": ".5", "¼": ".25", "¾": ".75"}
+# Units written straight after the number ('150g'); everything else gets a space ('2 pcs')
+_TIGHT_UNITS = {"g", "kg", "mg", "ml", "l"}
+
+def coerce_number(value):
+    """150, '150', '150g', '1,5', '1/2' or '1½' -> float; None when there is no number."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if math.isfinite(value) else None
+    if not isinstance(value, str):
+        return None
+    number, _ = split_amount(value)
+    return number
+
+def split_amount(text):
+    """'150g' -> (150.0, 'g'), '1/2 cup' -> (0.5, 'cup'); (None, '') without a number."""
+    text = str(text or "").replace(",", ".")
+    for symbol, decimal in _VULGAR.items():
+        text = re.sub(rf"(\d*)\s*{symbol}", lambda m: (m.group(1) or "0") + decimal, text)
+    match = _NUMBER.search(text)
+    if match is None:
+        return None, ""
+    whole, _, divisor = match.group(0).partition("/")
+    number = float(whole) / float(divisor) if divisor and float(divisor) else float(whole)
+    return number, text[match.end():].strip()
+
+# Pictographic blocks only: curly quotes, dashes and other punctuation above U+2000 are not emojis
+_EMOJI_RANGES = ((0x1F000, 0x1FAFF), (0x2600, 0x27BF), (0x2B00, 0x2BFF), (0x2300, 0x23FF))
+# Zero-width joiner and emoji presentation selector, kept only inside an emoji sequence
+_EMOJI_JOINERS = "\u200d\ufe0f"
+
+def emojis_in(text):
+    """The emoji characters of `text` ('Spinach 🥬' -> '🥬', 'Chef’s – mix' -> '')."""
+    kept = "".join(ch for ch in str(text or "")
+                   if ch in _EMOJI_JOINERS or any(lo <= ord(ch) <= hi for lo, hi in _EMOJI_RANGES))
+    return kept.strip(_EMOJI_JOINERS)
+
+def format_amount(value, unit):
+    unit = unit or ""
+    return f"{value:g}{unit}" if normalize_unit(unit) in _TIGHT_UNITS else f"{value:g} {unit}".rstrip()
+
+def culinary_round(amount, unit, limit=None):
+    """
+    The prompt's CULINARY ROUNDING in code: grams/ml to the nearest 50 (5 below 50g),
+    pieces and spoons to halves, everything else to one decimal. Never above `limit`.
+    """
+    unit = normalize_unit(unit)
+    if unit in ("g", "ml"):
+        step = 50.0 if amount >= 50 else 5.0
+    elif unit in ("pcs", "bag", "tub", "tbsp", "tsp", "cup"):
+        step = 0.5
+    else:
+        step = 0.1
+    rounded = round(amount / step) * step
+    if rounded <= 0:
+        rounded = round(amount, 1)
+    if limit is not None and rounded > limit + 1e-9:
+        rounded = math.floor(limit / step) * step
+        if rounded <= 0:
+            rounded = math.floor(limit * 10) / 10
+    return round(rounded, 1)
+
+# --- 2. RESULTS & STATS ---
+class Check:
+    """
+    Outcome of validating one model answer. `value` is the best locally repaired
+    version; `repairs` and `problems` are (kind, message) pairs. Problems are the
+    things only the model can fix, and are what a targeted re-call asks about.
+    """
+
+    def __init__(self, kind, value, repairs, problems, rejected=()):
+        self.kind = kind
+        self.value = value
+        self.repairs = repairs
+        self.problems = problems
+        self.rejected = list(rejected)
+        self.recalled = False
+
+    @property
+    def ok(self):
+        return not self.problems
+
+class ValidationStats:
+    """Per-kind counts of clean, locally repaired, re-called and still-failing answers."""
+
+    def __init__(self):
+        self.counters = {}
+        self.issues = {}
+        self._lock = threading.Lock()
+
+    def record(self, check):
+        with self._lock:
+            counts = self.counters.setdefault(
+                check.kind, {"checked": 0, "clean": 0, "repaired": 0, "recalled": 0, "failed": 0})
+            counts["checked"] += 1
+            if check.recalled:
+                counts["recalled"] += 1
+            if check.repairs:
+                counts["repaired"] += 1
+            if check.problems:
+                counts["failed"] += 1
+            if not (check.recalled or check.repairs or check.problems):
+                counts["clean"] += 1
+            issues = self.issues.setdefault(check.kind, {})
+            for kind, _ in check.repairs + check.problems:
+                issues[kind] = issues.get(kind, 0) + 1
+        return check.value
+
+    def stats(self):
+        with self._lock:
+            out = {}
+            for kind, counts in self.counters.items():
+                checked = counts["checked"] or 1
+                out[kind] = {
+                    **counts,
+                    "repairRate": round(counts["repaired"] / checked, 3),
+                    "recallRate": round(counts["recalled"] / checked, 3),
+                    "failureRate": round(counts["failed"] / checked, 3),
+                    "issues": dict(self.issues.get(kind, {})),
+                }
+            return out
+
+def _better(first, second):
+    """After a re-call, keep the answer with fewer open problems (the re-call can make things worse)."""
+    second.recalled = True
+    if len(second.problems) > len(first.problems):
+        first.recalled = True
+        return first
+    second.repairs = first.repairs + second.repairs
+    return second
+
+# --- 3. RECIPES ---
+class RecipeValidator:
+    """
+    Checks a recipe against the request's inventory and ration plan: every ingredient
+    must resolve to a pantry item, amounts must be numbers within the per-recipe budget
+    in the pantry's unit, and a must-use item has to appear. Names, units, numeric
+    strings, over-budget amounts and rounding are fixed locally.
+    """
+
+    def __init__(self, inventory, plan, master_index, nutrition_table=None):
+        self.inventory = [item for item in inventory or [] if isinstance(item, dict)]
+        self.plan = plan
+        self.master_index = master_index
+        self.nutrition_table = nutrition_table
+        self.matcher = InventoryMatcher(self.inventory, master_index)
+        self.budgets = {normalize_name(item['name']): item['budgetPerRecipe'] for item in plan['items']}
+        self.must_use = {self.matcher.match(name) for name in plan['mustUse']} - {None}
+
+    def check(self, recipe):
+        repairs, problems = [], []
+        if isinstance(recipe, list) and recipe and isinstance(recipe[0], dict):
+            recipe = recipe[0]
+        if not isinstance(recipe, dict):
+            return Check('recipe', {}, repairs, [('structure', "the answer is not a JSON recipe object")])
+
+        recipe = dict(recipe)
+        if not str(recipe.get('title') or '').strip():
+            problems.append(('missing', "it has no 'title'"))
+
+        instructions = recipe.get('instructions')
+        if isinstance(instructions, str) and instructions.strip():
+            recipe['instructions'] = [line.strip() for line in instructions.splitlines() if line.strip()]
+            repairs.append(('coerce', "'instructions' was a string"))
+        elif not isinstance(instructions, list) or not instructions:
+            problems.append(('missing', "it has no 'instructions'"))
+
+        ingredients, rejected, used = self._ingredients(recipe.get('ingredients'), repairs, problems)
+        recipe['ingredients'] = ingredients
+        if not ingredients and not rejected:
+            problems.append(('missing', "it has no 'ingredients'"))
+        if self.must_use and not (used & self.must_use):
+            names = ", ".join(self.inventory[pos]['name'] for pos in sorted(self.must_use))
+            problems.append(('must_use', f"it must use at least one expiring item: {names}"))
+
+        self._numbers(recipe, repairs, problems)
+        if not recipe.get('id') and recipe.get('title'):
+            recipe['id'] = canonical_key('recipe-id', recipe['title'])[:16]
+            repairs.append(('fill', "'id' was missing"))
+        return Check('recipe', recipe, repairs, problems, rejected)
+
+    def _ingredients(self, items, repairs, problems):
+        """Resolved, merged, clamped and rounded ingredients; plus the ones only the model can fix."""
+        if not isinstance(items, list):
+            return [], [], set()
+        order, totals, extras, rejected = [], {}, [], []
+        oil_used = False
+        for item in items:
+            if not isinstance(item, dict) or not str(item.get('name') or '').strip():
+                repairs.append(('drop', "an ingredient without a name"))
+                continue
+            name = str(item['name']).strip()
+            pos = self.matcher.match(name)
+            if pos is None:
+                # The prompt allows salt, pepper, water and one cooking oil on top of the pantry
+                is_oil = 'oil' in normalize_name(name).split()
+                if normalize_name(name) in FREE_STAPLES or (is_oil and not oil_used):
+                    oil_used = oil_used or is_oil
+                    extras.append(item)
+                    continue
+                rejected.append(item)
+                problems.append(('unknown_ingredient', f"'{name}' is not in the inventory"))
+                continue
+
+            amount, unit = coerce_number(item.get('amountValue')), item.get('unit')
+            if amount is None:
+                amount, written_unit = split_amount(item.get('amount'))
+                unit = unit or written_unit
+                if amount is not None:
+                    repairs.append(('coerce', f"'{name}' amountValue read from '{item.get('amount')}'"))
+            elif not isinstance(item.get('amountValue'), (int, float)):
+                repairs.append(('coerce', f"'{name}' amountValue was a string"))
+            if amount is None or amount <= 0:
+                rejected.append(item)
+                problems.append(('amount', f"'{name}' has no usable amountValue"))
+                continue
+
+            pantry_item = self.inventory[pos]
+            needed = self.matcher.amount_in_item_units(pos, amount, unit)
+            if needed is None:
+                rejected.append(item)
+                problems.append(('unit', f"'{name}' is in '{unit}', which can't be converted to "
+                                         f"'{pantry_item.get('unit')}'"))
+                continue
+            if name != pantry_item['name']:
+                repairs.append(('name', f"'{name}' -> '{pantry_item['name']}'"))
+            if (unit or '') != (pantry_item.get('unit') or unit or ''):
+                repairs.append(('unit', f"'{name}' {unit} -> {pantry_item.get('unit')}"))
+            if pos in totals:
+                repairs.append(('merge', f"'{name}' was listed twice"))
+                totals[pos] += needed
+            else:
+                order.append((pos, item))
+                totals[pos] = needed
+
+        ingredients, used = [], set()
+        for pos, item in order:
+            pantry_item = self.inventory[pos]
+            unit = pantry_item.get('unit') or item.get('unit') or ''
+            value = self._fit(pos, totals[pos], unit, repairs)
+            if value <= 0:
+                repairs.append(('drop', f"no '{pantry_item['name']}' left to use"))
+                continue
+            fixed = dict(item, name=pantry_item['name'], unit=unit, amountValue=value)
+            if fixed != item or not item.get('amount'):
+                fixed['amount'] = format_amount(value, unit)
+            ingredients.append(fixed)
+            used.add(pos)
+        for item in extras:
+            amount = coerce_number(item.get('amountValue'))
+            ingredients.append(dict(item, amountValue=amount) if amount is not None else item)
+        return ingredients, rejected, used
+
+    def _fit(self, pos, amount, unit, repairs):
+        """Clamps to the ration budget (or the whole pantry amount if the budget floored to 0), then rounds."""
+        pantry_item = self.inventory[pos]
+        have = coerce_number(pantry_item.get('quantity')) or 0.0
+        budget = self.budgets.get(normalize_name(pantry_item['name']))
+        limit = min(budget, have) if budget else have
+        value = culinary_round(amount, unit, limit)
+        if amount > limit + 1e-9:
+            repairs.append(('clamp', f"'{pantry_item['name']}' {amount:g} -> {value:g} {unit} (budget {limit:g})"))
+        elif abs(value - amount) > 1e-9:
+            repairs.append(('round', f"'{pantry_item['name']}' {amount:g} -> {value:g} {unit}"))
+        return value
+
+    def _numbers(self, recipe, repairs, problems):
+        """calories and macros as numbers; calories/protein are filled from the master DB when missing."""
+        computed = None
+        if self.nutrition_table is not None and recipe['ingredients']:
+            kcal, protein, coverage, _ = self.nutrition_table.score([recipe])
+            if coverage[0] > 0:
+                computed = {'calories': round(float(kcal[0])), 'p': round(float(protein[0]))}
+
+        def number(container, key, label):
+            raw = container.get(key)
+            value = coerce_number(raw)
+            if value is not None:
+                if not isinstance(raw, (int, float)) or isinstance(raw, bool):
+                    repairs.append(('coerce', f"'{label}' was a string"))
+                container[key] = value
+            elif computed is not None and key in computed:
+                container[key] = computed[key]
+                repairs.append(('fill', f"'{label}' computed from the master DB"))
+            else:
+                problems.append(('missing', f"it has no numeric '{label}'"))
+
+        number(recipe, 'calories', 'calories')
+        macros = recipe.get('macros')
+        recipe['macros'] = dict(macros) if isinstance(macros, dict) else {}
+        for key in ('p', 'c', 'f'):
+            number(recipe['macros'], key, f"macros.{key}")
+
+    def fix_prompt(self, check):
+        """
+        Small follow-up prompt listing only what is wrong, or None when there is no
+        recipe to fix (then the original prompt is sent again).
+        """
+        recipe = check.value
+        if not recipe or not recipe.get('title'):
+            return None
+        budgets, must_use = ration_constraints(self.plan)
+        shown = dict(recipe, ingredients=list(recipe.get('ingredients', [])) + check.rejected)
+        problems = "\n".join(f"        - {message}" for _, message in check.problems)
+        return f"""
+        Role: Manna AI Recipe Checker.
+        This recipe breaks these rules:
+{problems}
+
+        Fix ONLY those problems and keep everything else the same.
+        INVENTORY BUDGETS (exact name and unit, max amountValue per recipe): {budgets}
+        EXPIRING, at least one MUST be used: {must_use}
+        Salt, Pepper, Water and 1 Oil are allowed without being in the inventory.
+        RECIPE: {json.dumps(shown, ensure_ascii=False)}
+
+        Return ONLY the corrected JSON recipe object.
+        """
+
+    def recheck(self, check, recipe):
+        return _better(check, self.check(recipe))
+
+# --- 4. SHOPPING LISTS ---
+SHOP_TEXT_FIELDS = ("nutrition", "substitute", "why")
+
+class ShopValidator:
+    """
+    Checks an LLM shopping list against the master DB: every item must be a master
+    entry the user's diet allows, with an amount we can size. Names are snapped to
+    the master name (keeping the emoji), duplicates are merged, staples are held to
+    the solver's cap and amounts are rounded to retail sizes.
+    """
+
+    def __init__(self, master_index, profile, days):
+        self.master_index = master_index
+        self.profile = profile or {}
+        self.days = max(1, int(days))
+        self.diet = self.profile.get('diet')
+        self.staple_cap = max(250, STAPLE_CAP_PER_WEEK * self.days / 7.0)
+
+    def check(self, items):
+        repairs, problems = [], []
+        if isinstance(items, dict):
+            nested = next((v for v in items.values() if isinstance(v, list)), None)
+            if nested is not None:
+                items = nested
+                repairs.append(('structure', "the list was wrapped in an object"))
+        if not isinstance(items, list):
+            return Check('shop', [], repairs, [('structure', "the answer is not a JSON array")])
+
+        picked, rejected = {}, []
+        for item in items:
+            if not isinstance(item, dict) or not str(item.get('name') or '').strip():
+                repairs.append(('drop', "an item without a name"))
+                continue
+            name = str(item['name']).strip()
+            pos = self.master_index.find(name)
+            if pos is None:
+                rejected.append(item)
+                problems.append(('unknown_item', f"'{name}' is not in the master database"))
+                continue
+            entry = self.master_index.entries[pos]
+            if not is_diet_compatible(entry, self.diet):
+                rejected.append(item)
+                problems.append(('diet', f"'{name}' is not {self.diet}"))
+                continue
+
+            grams = self._grams(item, entry)
+            if grams is None:
+                rejected.append(item)
+                problems.append(('amount', f"'{name}' has no usable amount"))
+                continue
+            if pos in picked:
+                repairs.append(('merge', f"'{name}' was listed twice"))
+                picked[pos][1] += grams
+                picked[pos][2] = True
+            else:
+                picked[pos] = [item, grams, False]
+
+        fixed = [self._fix(self.master_index.entries[pos], item, grams, merged, repairs)
+                 for pos, (item, grams, merged) in picked.items()]
+        if not fixed and not rejected:
+            problems.append(('missing', "the list is empty"))
+        return Check('shop', fixed, repairs, problems, rejected)
+
+    @staticmethod
+    def _grams(item, entry):
+        amount = item.get('amount')
+        if isinstance(amount, (int, float)) and not isinstance(amount, bool):
+            value, unit = float(amount), ''
+        else:
+            value, unit = split_amount(amount)
+        if value is None or value <= 0:
+            return None
+        # '6 Large Eggs' has no real unit: small bare numbers are counts in the catalogue's unit, big ones grams
+        unit = unit if normalize_unit(unit) in ('g', 'kg', 'mg', 'ml', 'l', 'pcs', 'bag', 'tub') else ''
+        if not unit:
+            unit = bare_unit(value, entry)
+        return convert(value, unit, 'g', entry)
+
+    @staticmethod
+    def _written_amount(item, entry):
+        """
+        The model's amount, tidied, when it is already one the list allows: metric
+        ('200g', '1.5 L') or a whole count ('6 Large Eggs', '3'). None otherwise.
+        """
+        amount = item.get('amount')
+        if isinstance(amount, (int, float)) and not isinstance(amount, bool):
+            value, unit, text = float(amount), '', ''
+        else:
+            value, unit = split_amount(amount)
+            text = str(amount).strip()
+        if value is None or value <= 0:
+            return None
+        unit_key = normalize_unit(unit)
+        if unit_key in _TIGHT_UNITS:
+            return format_amount(value, unit)
+        # 'Large Eggs' is no measure: a small number of it counts pieces of a 'pcs' item
+        measured = unit_key in GRAMS_PER_UNIT or unit_key in COUNT_UNITS
+        counted = unit_key == 'pcs' or (not measured and entry.get('typical_unit') == 'pcs' and value < BARE_GRAMS_FROM)
+        if counted and value.is_integer():
+            return text if unit else f"{value:g} pcs"
+        if not unit and value >= BARE_GRAMS_FROM:
+            # A bare '200' is grams, as _grams reads it
+            return format_amount(value, 'g')
+        return None
+
+    def _fix(self, entry, item, grams, merged, repairs):
+        name = str(item['name']).strip()
+        fixed = dict(item)
+        emoji = emojis_in(name) or emoji_for(entry)
+        fixed['name'] = f"{entry['name']} {emoji}"
+        if fixed['name'] != name:
+            repairs.append(('name', f"'{name}' -> '{fixed['name']}'"))
+
+        clamped = entry['category'] in STARCH_CATEGORIES and carbs_per_100(entry) > 40 and grams > self.staple_cap
+        if clamped:
+            repairs.append(('clamp', f"'{entry['name']}' capped at {self.staple_cap:g}g"))
+            grams = self.staple_cap
+        # Only amounts that changed or aren't metric/counts get a retail size; '200g' spinach stays 200g
+        amount = None if clamped or merged else self._written_amount(item, entry)
+        if amount is None:
+            _, amount = retail_amount(entry, grams)
+        if amount != item.get('amount'):
+            repairs.append(('round', f"'{entry['name']}' {item.get('amount')} -> {amount}"))
+            fixed['amount'] = amount
+
+        defaults = {
+            'nutrition': nutrition_label(entry, None),
+            'substitute': entry.get('substitute', ''),
+            'why': f"A versatile pick for {self.profile.get('goal') or 'your goal'}.",
+        }
+        for field in SHOP_TEXT_FIELDS:
+            if not str(fixed.get(field) or '').strip():
+                fixed[field] = defaults[field]
+                repairs.append(('fill', f"'{entry['name']}' had no '{field}'"))
+        return fixed
+
+    def fix_prompt(self, check):
+        """Asks only for replacements of the rejected items, drawn from what the diet allows."""
+        if not check.rejected:
+            return None
+        have = {self.master_index.find(item['name']) for item in check.value}
+        allowed = [e['name'] for pos, e in enumerate(self.master_index.entries)
+                   if pos not in have and is_diet_compatible(e, self.diet)]
+        problems = "\n".join(f"        - {message}" for _, message in check.problems)
+        return f"""
+        Role: Manna AI Shopping List Checker.
+        These shopping list items were rejected:
+{problems}
+
+        Suggest exactly {len(check.rejected)} replacement item(s) for a {self.days}-day list.
+        Goal: {self.profile.get('goal')}
+        Diet: {self.diet}
+        Pick ONLY from: {", ".join(allowed)}
+        Round amounts to supermarket sizes (250g, 500g, 1kg, 1L, 6 pcs).
+
+        Return ONLY a JSON array: [{{"name": "String (include an emoji)", "amount": "500g", "nutrition": "String", "substitute": "String", "why": "String"}}]
+        """
+
+    def recheck(self, check, replacements):
+        extra = replacements if isinstance(replacements, list) else []
+        return _better(check, self.check(check.value + extra))
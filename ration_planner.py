@@ -0,0 +1,83 @@
+import numpy as np
+
+# Same threshold as the prompt's ROTTENING LOGIC
+MUST_USE_DAYS = 2
+# Used when an item has no daysLeft and no master DB entry
+DEFAULT_SHELF_LIFE = 7
+# daysRemaining comes from the client; the schedule is items x days, so it is capped here
+MAX_HORIZON_DAYS = 30
+
+def _float(value, default):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+def horizon_days(days_remaining, cap=MAX_HORIZON_DAYS):
+    """A client's daysRemaining as whole days in 1..cap; 7 when it isn't a number."""
+    days = _float(days_remaining, 7)
+    if days != days:  # NaN
+        days = 7
+    return int(min(max(days, 1), cap))
+
+# --- 1. THE PLANNER ---
+def plan_rations(inventory, days_remaining, master_index):
+    """
+    Per-item consumption schedule for the whole horizon, computed once with array math
+    instead of asking the model to divide quantities in its head.
+
+    Each item is spread evenly over the days it is still good for (its daysLeft, or the
+    master DB's default_shelf_life, capped at the horizon), so expiring food is front-loaded.
+    Items are ranked by expiry risk: soonest to spoil first, then the largest daily share.
+    """
+    items = [item for item in inventory or [] if isinstance(item, dict) and item.get('name')]
+    horizon = horizon_days(days_remaining)
+    if not items:
+        return {"days": horizon, "items": [], "mustUse": []}
+
+    quantity = np.array([max(0.0, _float(item.get('quantity'), 0.0)) for item in items])
+    shelf = np.array([_shelf_life(item, master_index) for item in items])
+
+    usable = np.clip(np.minimum(shelf, horizon), 1, None)
+    daily = quantity / usable
+    # items x days: the daily share until the item spoils, nothing after
+    schedule = np.where(np.arange(horizon)[None, :] < usable[:, None], daily[:, None], 0.0)
+    # Round budgets down so following them never overdraws the pantry
+    budget = np.floor(daily * 10) / 10
+    must_use = (shelf <= MUST_USE_DAYS) & (quantity > 0)
+    order = np.lexsort((-daily, shelf))
+
+    ranked = []
+    for pos in order:
+        item = items[pos]
+        ranked.append({
+            "name": item['name'],
+            "unit": item.get('unit', ''),
+            "budgetPerRecipe": float(budget[pos]),
+            "daysLeft": float(shelf[pos]),
+            "usableDays": int(usable[pos]),
+            "mustUse": bool(must_use[pos]),
+            "schedule": [round(float(v), 2) for v in schedule[pos]],
+        })
+    return {
+        "days": horizon,
+        "items": ranked,
+        "mustUse": [items[pos]['name'] for pos in order if must_use[pos]],
+    }
+
+def _shelf_life(item, master_index):
+    days_left = _float(item.get('daysLeft'), None)
+    if days_left is not None:
+        return max(0.0, days_left)
+    entry = master_index.lookup(item.get('name', '')) if master_index else None
+    return _float((entry or {}).get('default_shelf_life'), DEFAULT_SHELF_LIFE)
+
+# --- 2. PROMPT CONSTRAINTS ---
+def ration_constraints(plan):
+    """Compact prompt lines: one 'name <= budget unit' per item, in expiry-risk order."""
+    budgets = "; ".join(
+        f"{item['name']} <= {item['budgetPerRecipe']:g} {item['unit']}".rstrip()
+        for item in plan['items']
+    )
+    must_use = ", ".join(plan['mustUse']) or "none"
+    return budgets or "no inventory", must_use
@@ -0,0 +1,151 @@
+import threading
+from collections import OrderedDict
+
+from ingredient_index import normalize_name
+from inventory_matcher import InventoryMatcher
+
+# The recipe prompt allows these without them being in the inventory
+FREE_STAPLES = {"salt", "pepper", "black pepper", "sea salt", "water"}
+# Mirrors the prompt's ROTTENING LOGIC: a reused recipe must use one of these when the pantry has them
+EXPIRING_DAYS = 2
+REUSE_MAX_RECIPES = 2048
+
+def recipe_context(profile, meal_type):
+    """Only recipes for the same diet, cooking vibe and meal are interchangeable."""
+    return (
+        normalize_name(profile.get('diet', '')),
+        normalize_name(profile.get('vibe', 'Speed')),
+        normalize_name(meal_type),
+    )
+
+class RecipeReuseIndex:
+    """
+    Past recipes indexed by the ingredients they consume, so a pantry that drifted by an
+    item or two still gets a recipe it can cook instead of a fresh generation.
+
+    Ingredients are keyed by master DB entry (falling back to the normalized name), and an
+    inverted index from ingredient key to recipes finds every stored recipe whose
+    ingredients are all present by counting postings over the current inventory, with no
+    scan of the whole store. Candidates are then re-validated with the InventoryMatcher:
+    every amount must fit the item's quantity and its per-day rationing budget.
+    """
+
+    def __init__(self, master_index, max_recipes=REUSE_MAX_RECIPES):
+        self.master_index = master_index
+        self.max_recipes = max_recipes
+        self.recipes = OrderedDict()    # id -> (context, ingredient keys, recipe)
+        self.postings = {}              # (context, ingredient key) -> set of ids
+        self.sizes = {}                 # id -> number of distinct ingredient keys
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "rejected": 0, "stored": 0, "evictions": 0}
+
+    def _key(self, name):
+        pos = self.master_index.find(name)
+        return ('m', pos) if pos is not None else ('n', normalize_name(name))
+
+    def _needed(self, recipe):
+        names = [item.get('name', '') for item in recipe.get('ingredients', []) or [] if isinstance(item, dict)]
+        return {self._key(name) for name in names if normalize_name(name) not in FREE_STAPLES}
+
+    def add(self, recipe, context):
+        needed = self._needed(recipe)
+        if not needed:
+            return
+        with self._lock:
+            self._next_id += 1
+            rid = self._next_id
+            self.recipes[rid] = (context, needed, recipe)
+            self.sizes[rid] = len(needed)
+            for key in needed:
+                self.postings.setdefault((context, key), set()).add(rid)
+            self.counters["stored"] += 1
+            while len(self.recipes) > self.max_recipes:
+                self._evict(next(iter(self.recipes)))
+                self.counters["evictions"] += 1
+
+    def _evict(self, rid):
+        context, needed, _ = self.recipes.pop(rid)
+        self.sizes.pop(rid, None)
+        for key in needed:
+            members = self.postings.get((context, key))
+            if members is not None:
+                members.discard(rid)
+                if not members:
+                    del self.postings[(context, key)]
+
+    def find(self, inventory, context, days_left=7):
+        """A stored recipe this inventory can cook right now (names/units rewritten to the pantry's), or None."""
+        available = {self._key(item.get('name', '')) for item in inventory if isinstance(item, dict)}
+        with self._lock:
+            hits = {}
+            for key in available:
+                for rid in self.postings.get((context, key), ()):
+                    hits[rid] = hits.get(rid, 0) + 1
+            # Only recipes whose every ingredient is in the pantry, newest first
+            complete = sorted((rid for rid, count in hits.items() if count == self.sizes[rid]), reverse=True)
+            candidates = [(rid, self.recipes[rid][2]) for rid in complete]
+
+        if candidates:
+            matcher = InventoryMatcher(inventory, self.master_index)
+            expiring = {pos for pos, item in enumerate(inventory) if _days(item) <= EXPIRING_DAYS}
+            for rid, recipe in candidates:
+                served = self._validate(recipe, inventory, matcher, expiring, max(1, int(days_left or 1)))
+                if served is not None:
+                    with self._lock:
+                        if rid in self.recipes:
+                            self.recipes.move_to_end(rid)
+                        self.counters["hits"] += 1
+                    return served
+            with self._lock:
+                self.counters["rejected"] += len(candidates)
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def _validate(self, recipe, inventory, matcher, expiring, days_left):
+        """Re-checks every amount against today's pantry; returns a copy in the pantry's names and units."""
+        used = set()
+        ingredients = []
+        for item in recipe.get('ingredients', []) or []:
+            name = item.get('name', '')
+            if normalize_name(name) in FREE_STAPLES:
+                ingredients.append(item)
+                continue
+            pos = matcher.match(name)
+            if pos is None:
+                return None
+            try:
+                amount = float(item.get('amountValue', 0) or 0)
+            except (TypeError, ValueError):
+                return None
+            needed = matcher.amount_in_item_units(pos, amount, item.get('unit'))
+            if needed is None:
+                return None
+            have = float(inventory[pos].get('quantity', 0) or 0)
+            # Same rule the prompt enforces: no recipe may use more than quantity / days left
+            if needed > have or needed > have / days_left + 1e-9:
+                return None
+            used.add(pos)
+            pantry_item = inventory[pos]
+            unit = pantry_item.get('unit') or item.get('unit')
+            rewritten = dict(item, name=pantry_item.get('name', name), unit=unit)
+            if unit != item.get('unit'):
+                rewritten['amountValue'] = round(needed, 3)
+                rewritten['amount'] = f"{round(needed, 3):g}{unit}"
+            ingredients.append(rewritten)
+
+        if expiring and not (used & expiring):
+            return None
+        return dict(recipe, ingredients=ingredients)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "size": len(self.recipes)}
+
+def _days(item):
+    try:
+        return float(item.get('daysLeft', 99))
+    except (TypeError, ValueError):
+        return 99.0
@@ -0,0 +1,170 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# --- 1. CANONICAL KEYS ---
+def canonicalize(value):
+    """
+    Normalizes a request fragment so equivalent payloads hash the same:
+    dict keys sorted, strings trimmed, and 150 / 150.0 / "150" all become 150.0.
+    """
+    if isinstance(value, dict):
+        return {str(k): canonicalize(v) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(v) for v in value]
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return round(float(value), 4)
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            return round(float(text), 4)
+        except ValueError:
+            return text
+    return str(value)
+
+def canonical_inventory(inventory):
+    """Inventory order doesn't change the meal, so sort items by their normalized name."""
+    items = [canonicalize(item) for item in inventory or [] if isinstance(item, dict)]
+    return sorted(items, key=lambda item: (str(item.get("name", "")).lower(), json.dumps(item, sort_keys=True)))
+
+def canonical_key(route, parts):
+    """Stable SHA-256 over the route name and its canonicalized prompt inputs."""
+    blob = json.dumps([route, canonicalize(parts)], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+# --- 2. THE CACHE ---
+class ResponseCache:
+    """
+    Two-tier cache for generated responses.
+    Tier 1 is a bounded in-process LRU with per-entry TTL. Tier 2 (optional) is a
+    SQLite file shared by every gunicorn worker, so hits survive restarts.
+    """
+
+    def __init__(self, max_entries=512, default_ttl=900, db_path=None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expired": 0}
+        if db_path:
+            self._init_db()
+
+    # --- SQLite tier ---
+    def _connect(self):
+        # A fresh connection per call keeps us safe across threads and forked workers.
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_db(self):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS response_cache ("
+                    " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+        except sqlite3.Error as e:
+            print(f"Cache DB Error (disabling disk tier): {e}")
+            self.db_path = None
+
+    def _disk_get(self, key):
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Cache DB Error: {e}")
+            return None
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _disk_set(self, key, value, expires_at):
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at),
+                )
+        except sqlite3.Error as e:
+            print(f"Cache DB Error: {e}")
+
+    # --- Public API ---
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return value
+                del self._entries[key]
+                self.counters["expired"] += 1
+
+        if self.db_path:
+            found = self._disk_get(key)
+            if found is not None:
+                value, expires_at = found
+                with self._lock:
+                    self._remember(key, value, expires_at)
+                    self.counters["hits"] += 1
+                    self.counters["disk_hits"] += 1
+                return value
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self.counters["sets"] += 1
+        if self.db_path:
+            self._disk_set(key, value, expires_at)
+
+    def _remember(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM response_cache")
+            except sqlite3.Error as e:
+                print(f"Cache DB Error: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["disk_tier"] = bool(self.db_path)
+        return stats
+
+def cache_from_env():
+    """Builds the shared cache from MANNA_CACHE_SIZE / MANNA_CACHE_TTL / MANNA_CACHE_DB."""
+    return ResponseCache(
+        max_entries=int(os.environ.get("MANNA_CACHE_SIZE", 512)),
+        default_ttl=int(os.environ.get("MANNA_CACHE_TTL", 900)),
+        db_path=os.environ.get("MANNA_CACHE_DB") or None,
+    )
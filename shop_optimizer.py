@@ -0,0 +1,429 @@
+import math
+import json
+
+from ingredient_index import is_diet_compatible, taste_tags, normalize_name, name_tokens
+from units import grams_per
+
+# --- 1. SIZING RULES ---
+STAPLE_CAP_PER_WEEK = 500      # g of any single staple per 7 days
+PROTEIN_CAP_PER_WEEK = 1000    # g of any single protein source per 7 days
+FAT_CAP_PER_WEEK = 400         # g (or ml) of any single fat per 7 days
+AROMATIC_PER_WEEK = 250        # g of onion, garlic or ginger per 7 days
+STARCH_SHARE_CAP = 0.40        # no single starch above 40% of the carb quota
+MIN_VEGETABLES = 4             # the rainbow rule
+MAX_PROTEIN_SOURCES = 6
+MAX_FATS = 3
+# Calories and protein land within this share of the period target, or the summary reports the gap
+TARGET_TOLERANCE = 0.10
+RETAIL_GRAMS = (50, 100, 150, 200, 250, 300, 400, 500, 750, 1000, 1500, 2000, 2500, 3000)
+RETAIL_ML = (250, 500, 750, 1000, 1500, 2000)
+# Trimming never leaves a pick smaller than this
+MIN_PICK_GRAMS = 100
+# Past the end of the size tables, amounts go up in these steps
+BULK_STEP = 500
+
+# Keyed by item (full name, trailing pair of words, then head noun), never by category:
+# an avocado is not broccoli. Categories only name the generic shelves.
+ITEM_EMOJI = {
+    "spinach": "🥬", "kale": "🥬", "lettuce": "🥬", "cabbage": "🥬", "tomato": "🍅", "cucumber": "🥒",
+    "carrot": "🥕", "bell pepper": "🫑", "broccoli": "🥦", "cauliflower": "🥦", "zucchini": "🥒",
+    "eggplant": "🍆", "onion": "🧅", "garlic": "🧄", "ginger": "🫚", "ginger root": "🫚", "sweet potato": "🍠",
+    "potato": "🥔", "mushroom": "🍄", "green bean": "🫛", "avocado": "🥑", "coriander": "🌿",
+    "chicken breast": "🍗", "turkey breast": "🦃", "salmon fillet": "🐟", "tuna": "🐟", "egg": "🥚",
+    "tofu": "🫘", "tempeh": "🫘", "beef": "🥩", "chickpea": "🫘", "lentil": "🫘",
+    "rice": "🍚", "pasta": "🍝", "bread": "🍞", "oat": "🥣", "quinoa": "🌾", "couscous": "🌾",
+    "tortilla": "🫓", "noodle": "🍜",
+    "banana": "🍌", "apple": "🍎", "orange": "🍊", "strawberry": "🍓", "blueberry": "🫐", "grape": "🍇",
+    "mango": "🥭", "pineapple": "🍍", "kiwi": "🥝", "lemon": "🍋", "peach": "🍑", "watermelon": "🍉",
+    "pear": "🍐", "raspberry": "🍓", "date": "🌴",
+    "yogurt": "🥛", "milk": "🥛", "cheese": "🧀", "mozzarella": "🧀", "butter": "🧈", "cream": "🥛",
+    "oil": "🫒", "honey": "🍯", "syrup": "🍁", "peanut butter": "🥜", "almond butter": "🥜", "seed": "🌻",
+    "walnut": "🌰", "almond": "🌰", "cashew": "🌰", "pecan": "🌰", "raisin": "🍇", "chocolate": "🍫",
+    "coffee": "☕", "tea": "🍵", "salt": "🧂", "sugar": "🍬", "soy sauce": "🥢", "tamari": "🥢",
+}
+CATEGORY_EMOJI = {
+    "Herb/Spice": "🌿", "Condiment": "🧂", "Pantry": "🫙", "Grain": "🌾", "Grains/Baking": "🥖",
+}
+
+TAG_NUTRITION = {
+    "iron-rich": "Iron", "iron": "Iron", "vitamin-c": "Vitamin C", "fiber": "Fiber", "omega-3": "Omega-3",
+    "calcium": "Calcium", "healthy-fat": "Healthy Fats", "probiotic": "Probiotics", "potassium": "Potassium",
+    "antioxidant": "Antioxidants", "whole-grain": "Whole Grain",
+}
+FAT_TAGS = {"healthy-fat", "fat", "nutty", "oil", "seed", "spread"}
+AROMATIC_TAGS = {"aromatic", "pungent", "herb"}
+STARCH_CATEGORIES = {"Grain"}
+
+def carbs_per_100(entry):
+    """
+    The master DB has no carb column, so estimate it from the energy not explained
+    by protein, weighted by how starchy the category usually is.
+    """
+    kcal = float(entry.get("calories_per_100", 0) or 0)
+    protein = float(entry.get("protein_per_100", 0) or 0)
+    non_protein_carb_g = max(0.0, kcal - 4 * protein) / 4
+    tags = set(entry.get("tags", []))
+    if tags & FAT_TAGS or entry["category"] == "Dairy":
+        return 0.15 * non_protein_carb_g
+    if entry["category"] in ("Grain", "Grains/Baking", "Fruit", "Vegetable") or "carb" in tags:
+        return 0.9 * non_protein_carb_g
+    return 0.5 * non_protein_carb_g
+
+def is_egg(entry):
+    """Eggs are sold and cooked by the count; 'Eggplant' is not an egg."""
+    return entry.get("typical_unit") == "pcs" and "egg" in name_tokens(entry["name"])
+
+def retail_size(sizes, amount):
+    """Nearest supermarket size; past the table, the next BULK_STEP up."""
+    if amount > sizes[-1]:
+        return BULK_STEP * math.ceil(amount / BULK_STEP)
+    return min(sizes, key=lambda size: abs(size - amount))
+
+def smaller_size(entry, grams):
+    """The next retail size down from `grams`, or None at the smallest one (eggs go down a half dozen)."""
+    if is_egg(entry):
+        per_egg = grams_per("pcs", entry)
+        return grams - 6 * per_egg if grams > 6 * per_egg else None
+    sizes = RETAIL_ML if entry.get("typical_unit") == "ml" else RETAIL_GRAMS
+    if grams > sizes[-1]:
+        return max(sizes[-1], grams - BULK_STEP)
+    below = [size for size in sizes if size < grams]
+    return below[-1] if below else None
+
+def metric_label(amount, small, large):
+    if amount >= 1000:
+        return f"{amount / 1000:g}{large}"
+    return f"{amount:g}{small}"
+
+def retail_amount(entry, grams):
+    """
+    Rounds a gram quantity to a supermarket size, always metric ('500g', '1.5kg', '750ml',
+    '1L'); eggs are the one count, by the half dozen ('12 eggs').
+    """
+    if is_egg(entry):
+        per_egg = grams_per("pcs", entry)
+        count = 6 * max(1, math.ceil(grams / per_egg / 6))
+        return count * per_egg, f"{count} eggs"
+    if entry.get("typical_unit") == "ml":
+        ml = retail_size(RETAIL_ML, grams)
+        return ml, metric_label(ml, "ml", "L")
+    size = retail_size(RETAIL_GRAMS, grams)
+    return size, metric_label(size, "g", "kg")
+
+# --- 2. THE SOLVER ---
+class ShoppingListSolver:
+    """
+    Greedy knapsack over the master DB: mandatory variety picks first (rainbow,
+    flavour, texture), then 2-3 starches capped by the staple and 40% rules, then
+    protein sources by protein density until the protein quota is met, then produce,
+    healthy fats and bigger staples until the calorie target is reached. A last pass
+    trims whatever overshoots, so calories and protein end within TARGET_TOLERANCE;
+    when the pool can't get there, summary() reports the gap.
+    Picking an item rules out its substitute (no Soy Sauce and Tamari on one list).
+    """
+
+    def __init__(self, master_index, profile, days, target_cals, target_protein, target_carbs):
+        self.index = master_index
+        self.profile = profile or {}
+        self.days = max(1, int(days))
+        self.scale = self.days / 7.0
+        self.target_cals = target_cals * self.days
+        self.target_protein = target_protein * self.days
+        self.target_carbs = target_carbs
+        self.wanted_tags = taste_tags(self.profile.get("tastes", {}))
+        diet = self.profile.get("diet")
+        self.pool = [e for e in master_index.entries if is_diet_compatible(e, diet)]
+        self.order = {e["name"]: i for i, e in enumerate(master_index.entries)}
+        # A substitute the DB doesn't stock resolves to its nearest entry, which can be the item itself
+        self.substitute = {e["name"]: sub for e in self.pool
+                           if (sub := self._master_name(e.get("substitute"))) not in (None, e["name"])}
+        self.picks = {}   # name -> [entry, grams, role]
+
+    def _master_name(self, name):
+        pos = self.index.find(name) if name else None
+        return self.index.entries[pos]["name"] if pos is not None else None
+
+    # --- helpers ---
+    def _taste_score(self, entry):
+        return len(self.wanted_tags & set(entry.get("tags", [])))
+
+    def _ranked(self, entries, key=None):
+        key = key or (lambda e: -self._taste_score(e))
+        return sorted(entries, key=lambda e: (key(e), self.order[e["name"]]))
+
+    def _available(self, entry):
+        """Not picked yet, and neither its substitute nor anything it substitutes for is."""
+        name = entry["name"]
+        if name in self.picks or self.substitute.get(name) in self.picks:
+            return False
+        return not any(self.substitute.get(picked) == name for picked in self.picks)
+
+    def _category(self, *categories):
+        return [e for e in self.pool if e["category"] in categories and self._available(e)]
+
+    def _add(self, entry, grams, role):
+        if entry["name"] in self.picks:
+            grams += self.picks[entry["name"]][1]
+        grams, _ = retail_amount(entry, grams)
+        if entry["name"] in self.picks:
+            self.picks[entry["name"]][1] = grams
+        else:
+            self.picks[entry["name"]] = [entry, grams, role]
+
+    def _total(self, field):
+        if field == "carbs":
+            return sum(carbs_per_100(e) * g / 100 for e, g, _ in self.picks.values())
+        return sum(float(e.get(field, 0) or 0) * g / 100 for e, g, _ in self.picks.values())
+
+    def _ratio(self, field):
+        target = self.target_cals if field == "calories_per_100" else self.target_protein
+        return self._total(field) / target if target else 1.0
+
+    # --- steps ---
+    def _is_aromatic(self, entry):
+        return bool(AROMATIC_TAGS & set(entry.get("tags", [])))
+
+    def _variety(self):
+        # Garlic, ginger and herbs live under 'Vegetable' but belong in the flavour picks
+        vegetables = self._ranked([e for e in self._category("Vegetable") if not self._is_aromatic(e)])
+        seen_tags = set()
+        for entry in vegetables:
+            if sum(1 for _, _, r in self.picks.values() if r == "vegetable") >= MIN_VEGETABLES:
+                break
+            first_tag = (entry.get("tags") or [""])[0]
+            if not self._available(entry) or (first_tag in seen_tags and len(vegetables) > MIN_VEGETABLES * 2):
+                continue
+            seen_tags.add(first_tag)
+            self._add(entry, 300 * self.scale, "vegetable")
+
+        for entry in self._ranked(self._category("Fruit"))[:2]:
+            self._add(entry, 500 * self.scale, "fruit")
+
+        bold = "bold" in json.dumps(self.profile.get("tastes", {})).lower()
+        aromatics = [e for e in self._category("Vegetable") if self._is_aromatic(e)]
+        spices = self._ranked(self._category("Herb/Spice") + aromatics)[: (2 if bold else 1)]
+        for entry in spices:
+            # Onion and garlic get cooked by the handful, dried spices by the pinch
+            self._add(entry, AROMATIC_PER_WEEK * self.scale if entry["category"] == "Vegetable" else 50, "flavor")
+        for entry in self._ranked(self._category("Condiment")):
+            if sum(1 for _, _, r in self.picks.values() if r == "flavor") >= 3:
+                break
+            if self._available(entry):
+                self._add(entry, 50, "flavor")
+
+        tags_of = lambda e: set(e.get("tags", []))
+        if not any(tags_of(e) & {"creamy", "rich"} for e, _, _ in self.picks.values()):
+            creamy = [e for e in self.pool if tags_of(e) & {"creamy", "rich"} and self._available(e)]
+            if creamy:
+                self._add(self._ranked(creamy)[0], 500 * self.scale, "creamy")
+        if not any(tags_of(e) & {"crunchy", "nutty", "crisp"} for e, _, _ in self.picks.values()):
+            crunchy = [e for e in self.pool if tags_of(e) & {"crunchy", "nutty", "crisp"} and self._available(e)]
+            if crunchy:
+                self._add(self._ranked(crunchy)[0], 200 * self.scale, "crunchy")
+
+    def _carbs(self):
+        staple_cap = max(250, STAPLE_CAP_PER_WEEK * self.scale)
+        starches = [e for e in self._category(*STARCH_CATEGORIES) if carbs_per_100(e) > 40]
+        seen = set()
+        for entry in self._ranked(starches):
+            missing = self.target_carbs - self._total("carbs")
+            if missing <= 0 or len(seen) >= 3:
+                break
+            # 'Basmati Rice' and 'Brown Rice' are the same starch as far as variety goes
+            family = normalize_name(entry["name"]).split()[-1]
+            if family in seen or not self._available(entry):
+                continue
+            seen.add(family)
+            per_starch_cap = STARCH_SHARE_CAP * self.target_carbs * 100 / carbs_per_100(entry)
+            grams = min(staple_cap, per_starch_cap, missing * 100 / carbs_per_100(entry))
+            self._add(entry, grams, "carb")
+
+    def _protein(self):
+        # Runs after the starches, so the protein they already bring counts towards the quota
+        savory = "savory" in json.dumps(self.profile.get("tastes", {})).lower()
+        sources = [e for e in self._category("Protein", "Dairy") if float(e.get("protein_per_100", 0)) >= 8]
+
+        def density(e):
+            kcal = float(e.get("calories_per_100", 0)) or 1
+            bonus = 1 if savory and "breakfast" in e.get("tags", []) else 0
+            return -(float(e.get("protein_per_100", 0)) / kcal + bonus + 0.05 * self._taste_score(e))
+
+        cap = PROTEIN_CAP_PER_WEEK * self.scale
+        picked = []
+        for entry in self._ranked(sources, key=density):
+            missing = self.target_protein - self._total("protein_per_100")
+            if missing <= 0 or len(picked) >= MAX_PROTEIN_SOURCES:
+                break
+            if not self._available(entry):
+                continue
+            picked.append(entry)
+            self._add(entry, min(cap, missing * 100 / float(entry["protein_per_100"])), "protein")
+        # Still short (big targets, small vegan pool): let the chosen sources go up to twice the cap
+        for entry in picked:
+            missing = self.target_protein - self._total("protein_per_100")
+            if missing <= self.target_protein * TARGET_TOLERANCE / 2:
+                break
+            room = 2 * cap - self.picks[entry["name"]][1]
+            if room > 0:
+                self._add(entry, min(room, missing * 100 / float(entry["protein_per_100"])), "protein")
+
+    def _calories(self):
+        def missing():
+            return self.target_cals - self._total("calories_per_100")
+
+        # Top up with produce first, then healthy fats; staples only grow past their cap if that's not enough
+        for role, step, ceiling in (("fruit", 250, 1500), ("vegetable", 200, 800)):
+            for name, (entry, grams, r) in list(self.picks.items()):
+                while r == role and missing() > 0 and self.picks[name][1] < ceiling * self.scale:
+                    before = self.picks[name][1]
+                    self._add(entry, step, role)
+                    if self.picks[name][1] <= before:
+                        # The step rounded back to the same pack
+                        self._add(entry, 2 * step, role)
+                        if self.picks[name][1] <= before:
+                            break
+        fats = [e for e in self.pool if set(e.get("tags", [])) & {"healthy-fat", "nutty"} and self._available(e)]
+        for entry in self._ranked(fats):
+            if missing() <= 0 or sum(1 for _, _, r in self.picks.values() if r == "fat") >= MAX_FATS:
+                break
+            if self._available(entry):
+                self._add(entry, min(FAT_CAP_PER_WEEK * self.scale, missing() * 100 / float(entry["calories_per_100"])), "fat")
+        staple_cap = 2 * max(250, STAPLE_CAP_PER_WEEK * self.scale)
+        for name, (entry, grams, role) in list(self.picks.items()):
+            if role == "carb" and missing() > self.target_cals * TARGET_TOLERANCE / 2:
+                room = staple_cap - grams
+                if room > 0:
+                    self._add(entry, min(room, missing() * 100 / float(entry["calories_per_100"])), role)
+
+    def _shrink(self, field, roles, guard):
+        """Steps picks of these roles down a retail size while `field` overshoots, as long as `guard()` holds."""
+        per_100 = lambda name: float(self.picks[name][0].get(field, 0) or 0)
+        for role in roles:
+            names = sorted((n for n, (_, _, r) in self.picks.items() if r == role),
+                           key=lambda n: -per_100(n) * self.picks[n][1])
+            for name in names:
+                while self._ratio(field) > 1 + TARGET_TOLERANCE:
+                    entry, grams, _ = self.picks[name]
+                    smaller = smaller_size(entry, grams)
+                    if smaller is None or smaller < MIN_PICK_GRAMS:
+                        break
+                    self.picks[name][1] = smaller
+                    if not guard():
+                        self.picks[name][1] = grams
+                        break
+
+    def _trim(self):
+        # Small periods overshoot on minimum pack sizes; give back the least essential grams first
+        protein_ok = lambda: self._ratio("protein_per_100") >= 1 - TARGET_TOLERANCE
+        calories_ok = lambda: self._ratio("calories_per_100") >= 1 - TARGET_TOLERANCE
+        # Produce stays put: it's the cheap, filling part of the list
+        self._shrink("calories_per_100", ("fat", "crunchy", "creamy", "carb", "protein"), protein_ok)
+        self._shrink("protein_per_100", ("protein", "creamy", "crunchy", "carb"), calories_ok)
+
+    def solve(self):
+        self._variety()
+        self._carbs()
+        self._protein()
+        self._calories()
+        self._trim()
+        return self.picks
+
+    def summary(self):
+        calories, protein = self._total("calories_per_100"), self._total("protein_per_100")
+        within = all(abs(ratio - 1) <= TARGET_TOLERANCE for ratio in (self._ratio("calories_per_100"), self._ratio("protein_per_100")))
+        return {
+            "calories": round(calories),
+            "targetCalories": self.target_cals,
+            "protein": round(protein),
+            "targetProtein": self.target_protein,
+            "carbs": round(self._total("carbs")),
+            "targetCarbs": self.target_carbs,
+            "items": len(self.picks),
+            "tolerance": TARGET_TOLERANCE,
+            "withinTolerance": within,
+            # Positive: still short of the target; negative: over it
+            "gap": {"calories": round(self.target_cals - calories), "protein": round(self.target_protein - protein)},
+        }
+
+# --- 3. OUTPUT ---
+ROLE_WHY = {
+    "vegetable": "One of your rainbow vegetables: colour, fibre and micronutrients for {goal}.",
+    "fruit": "Fills part of your carb quota with fresh, versatile fruit for breakfasts and snacks.",
+    "flavor": "Flavour foundation for sauces and dressings that match your tastes.",
+    "creamy": "Adds creaminess for sauces, bowls and breakfasts.",
+    "crunchy": "Adds crunch to salads, bowls and snacks.",
+    "protein": "Covers part of your {protein}g protein target for {goal}.",
+    "carb": "A capped staple that splits your {carbs}g carb quota with other sources.",
+    "fat": "Healthy fats to reach your {calories} kcal target without more staples.",
+}
+
+def emoji_for(entry):
+    """The item's own emoji (full name, then its last two words, then the head noun), else the shelf's."""
+    tokens = name_tokens(entry["name"])
+    for key in (" ".join(tokens), " ".join(tokens[-2:]), tokens[-1] if tokens else ""):
+        if key in ITEM_EMOJI:
+            return ITEM_EMOJI[key]
+    return CATEGORY_EMOJI.get(entry["category"], "🛒")
+
+def nutrition_label(entry, role):
+    labels = []
+    if float(entry.get("protein_per_100", 0) or 0) >= 15:
+        labels.append("High Protein")
+    if role == "carb":
+        labels.append("Complex Carbs")
+    labels += [TAG_NUTRITION[t] for t in entry.get("tags", []) if t in TAG_NUTRITION]
+    return ", ".join(dict.fromkeys(labels)) or entry["category"]
+
+def format_items(picks, profile, summary):
+    """Same item shape as the LLM list: name (with emoji), amount, nutrition, substitute, why."""
+    goal = (profile or {}).get("goal") or "your goal"
+    items = []
+    for entry, grams, role in picks.values():
+        _, amount = retail_amount(entry, grams)
+        items.append({
+            "name": f"{entry['name']} {emoji_for(entry)}",
+            "amount": amount,
+            "nutrition": nutrition_label(entry, role),
+            "substitute": entry.get("substitute", ""),
+            "why": ROLE_WHY[role].format(goal=goal, protein=summary["targetProtein"],
+                                         carbs=summary["targetCarbs"], calories=summary["targetCalories"]),
+        })
+    return items
+
+def solve_shopping_list(master_index, profile, days, target_cals, target_protein, target_carbs):
+    """Returns (items, summary) in milliseconds, no model involved."""
+    solver = ShoppingListSolver(master_index, profile, days, target_cals, target_protein, target_carbs)
+    picks = solver.solve()
+    summary = solver.summary()
+    return format_items(picks, profile, summary), summary
+
+# --- 4. OPTIONAL LLM FLAVOUR TEXT ---
+def build_flavor_prompt(items, profile):
+    """Small prompt that only asks the model for emojis and 'why' lines for an already-solved list."""
+    names = [{"name": item["name"], "amount": item["amount"]} for item in items]
+    return f"""
+        You are Manna AI. The shopping list below is FINAL: do not add, remove, rename or resize items.
+        User goal: {profile.get('goal')}
+        Diet: {profile.get('diet')}
+        Taste Profile: {json.dumps(profile.get('tastes', {}))}
+        List: {json.dumps(names, ensure_ascii=False)}
+
+        For each item, in the same order, write one fitting emoji and a short, motivating 'why' that connects it to the user's goal and tastes.
+        Return ONLY a JSON array: [{{ "emoji": "🍎", "why": "String" }}]
+        """
+
+def apply_flavor(items, flavor):
+    """Merges the model's emoji/why lines onto the solved list; anything malformed keeps the template text."""
+    if not isinstance(flavor, list):
+        return items
+    out = []
+    for item, extra in zip(items, flavor + [None] * (len(items) - len(flavor))):
+        item = dict(item)
+        if isinstance(extra, dict):
+            base_name = item["name"].rsplit(" ", 1)[0]
+            if extra.get("emoji"):
+                item["name"] = f"{base_name} {extra['emoji']}"
+            if extra.get("why"):
+                item["why"] = str(extra["why"])
+        out.append(item)
+    return out
@@ -0,0 +1,256 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# --- 1. PROMETHEUS-STYLE METRICS ---
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    pairs = ",".join('%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"')) for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help_text, tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}   # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            row = self.series.get(label_values)
+            if row is None:
+                row = self.series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        for key, row in sorted(self.series.items()):
+            running = 0
+            for bound, hits in zip(self.buckets, row):
+                running += hits
+                lines.append(f"{self.name}_bucket{_label_text(names, key + (bound,))} {running}")
+            lines.append(f"{self.name}_bucket{_label_text(names, key + ('+Inf',))} {row[-1]}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {round(row[-2], 6)}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {row[-1]}")
+        return lines
+
+class Gauge:
+    """
+    Read at scrape time from a callable returning {label values tuple: value}, so stats
+    other modules already keep (cache, scheduler) are exported without double counting.
+    """
+
+    def __init__(self, name, help_text, labels, read, kind="gauge"):
+        self.name, self.help, self.labels, self.read = name, help_text, tuple(labels), read
+        self.kind = kind
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            values = self.read()
+        except Exception:
+            values = {}
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+METRICS = Registry()
+REQUESTS = METRICS.add(Counter("manna_requests_total", "HTTP requests served.", ("route", "method", "status")))
+REQUEST_SECONDS = METRICS.add(Histogram("manna_request_seconds", "End-to-end request latency.", ("route",)))
+PHASE_SECONDS = METRICS.add(Histogram("manna_phase_seconds", "Time spent per request phase.", ("route", "phase")))
+PROMPT_BYTES = METRICS.add(Histogram("manna_prompt_bytes", "Size of prompts sent to the model.", ("route",), BYTE_BUCKETS))
+RESPONSE_BYTES = METRICS.add(Histogram("manna_response_bytes", "Size of HTTP response bodies.", ("route",), BYTE_BUCKETS))
+MODEL_TOKENS = METRICS.add(Counter("manna_model_tokens_total", "Model-reported token usage.", ("route", "kind")))
+CLEANER_FAILURES = METRICS.add(Counter("manna_cleaner_failures_total", "Model answers clean_gemini_json could not parse.", ("route",)))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- 2. PER-REQUEST TRACES ---
+REQUEST_LOG = logging.getLogger("manna.requests")
+if not REQUEST_LOG.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    REQUEST_LOG.addHandler(_handler)
+    REQUEST_LOG.propagate = False
+REQUEST_LOG.setLevel(logging.INFO if os.environ.get("MANNA_REQUEST_LOG", "1") != "0" else logging.WARNING)
+
+_current = contextvars.ContextVar("manna_trace", default=None)
+
+class Trace:
+    """Everything we learn about one request; flushed to metrics and one JSON log line at the end."""
+
+    def __init__(self, method, path, request_id=None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.route = path
+        self.start = time.perf_counter()
+        self.spans = {}
+        self.prompt_bytes = 0
+        self.tokens = {}
+        self.cleaner_failures = 0
+        self.finished = False
+
+    @contextmanager
+    def span(self, phase):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[phase] = self.spans.get(phase, 0.0) + (time.perf_counter() - started)
+
+    def finish(self, status, response_bytes=None):
+        if self.finished:
+            return
+        self.finished = True
+        elapsed = time.perf_counter() - self.start
+        route = self.route
+        REQUESTS.inc(route, self.method, str(status))
+        REQUEST_SECONDS.observe(elapsed, route)
+        for phase, seconds in self.spans.items():
+            PHASE_SECONDS.observe(seconds, route, phase)
+        if self.prompt_bytes:
+            PROMPT_BYTES.observe(self.prompt_bytes, route)
+        if response_bytes is not None:
+            RESPONSE_BYTES.observe(response_bytes, route)
+        for kind, count in self.tokens.items():
+            MODEL_TOKENS.inc(route, kind, amount=count)
+        if self.cleaner_failures:
+            CLEANER_FAILURES.inc(route, amount=self.cleaner_failures)
+
+        if REQUEST_LOG.isEnabledFor(logging.INFO):
+            REQUEST_LOG.info(json.dumps({
+                "requestId": self.request_id,
+                "method": self.method,
+                "route": route,
+                "status": status,
+                "durationMs": round(elapsed * 1000, 1),
+                "spansMs": {k: round(v * 1000, 1) for k, v in self.spans.items()},
+                "promptBytes": self.prompt_bytes or None,
+                "tokens": self.tokens or None,
+                "cleanerFailures": self.cleaner_failures or None,
+                "responseBytes": response_bytes,
+            }, separators=(",", ":")))
+
+def start_trace(method, path, request_id=None):
+    trace = Trace(method, path, request_id)
+    _current.set(trace)
+    return trace
+
+def current_trace():
+    return _current.get()
+
+# --- 3. RECORDING HELPERS (no-ops outside a request) ---
+@contextmanager
+def span(phase):
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(phase):
+        yield
+
+def record_prompt(prompt, trace=None):
+    trace = trace or _current.get()
+    if trace is None:
+        return
+    for part in prompt if isinstance(prompt, (list, tuple)) else [prompt]:
+        data = part.get("data", b"") if isinstance(part, dict) else part
+        trace.prompt_bytes += len(data) if isinstance(data, bytes) else len(str(data).encode("utf-8"))
+
+def record_usage(response, trace=None):
+    """Adds Gemini's usage_metadata (prompt/output/total token counts) to the trace."""
+    trace = trace or _current.get()
+    usage = getattr(response, "usage_metadata", None)
+    if trace is None or usage is None:
+        return
+    for kind, attr in (("prompt", "prompt_token_count"), ("output", "candidates_token_count"), ("total", "total_token_count")):
+        count = getattr(usage, attr, None)
+        if isinstance(count, int):
+            trace.tokens[kind] = trace.tokens.get(kind, 0) + count
+
+def record_cleaner_failure(trace=None):
+    trace = trace or _current.get()
+    if trace is not None:
+        trace.cleaner_failures += 1
+    else:
+        CLEANER_FAILURES.inc("none")
+
+# --- 4. ASGI MIDDLEWARE ---
+class TraceMiddleware:
+    """Pure ASGI wrapper (no body buffering, so SSE streams pass straight through)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope.get("headers") or [])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1") or None
+        trace = start_trace(scope.get("method", "GET"), scope.get("path", ""), request_id)
+        state = {"status": 500, "bytes": 0}
+
+        async def traced_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", trace.request_id.encode("latin-1"))]
+            elif message["type"] == "http.response.body":
+                state["bytes"] += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    trace.route = getattr(scope.get("route"), "path", "unmatched")
+                    trace.finish(state["status"], state["bytes"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            trace.route = getattr(scope.get("route"), "path", "unmatched")
+            trace.finish(state["status"], state["bytes"])
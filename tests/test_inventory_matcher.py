@@ -0,0 +1,57 @@
+import json
+import os
+
+import pytest
+
+from ingredient_index import IngredientIndex
+from inventory_matcher import InventoryMatcher, apply_recipes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+with open(os.path.join(ROOT, 'ingredients_master.json'), 'r') as f:
+    MASTER_INDEX = IngredientIndex(tuple(json.load(f)))
+
+PANTRY = [
+    {"name": "Peanut Butter", "quantity": 300, "unit": "g"},
+    {"name": "Red Bell Pepper", "quantity": 3, "unit": "pcs"},
+    {"name": "Olive Oil", "quantity": 500, "unit": "ml"},
+    {"name": "Chicken Breast", "quantity": 500, "unit": "g"},
+    {"name": "Basmati Rice", "quantity": 2, "unit": "bag"},
+    {"name": "Rice Noodles", "quantity": 200, "unit": "g"},
+    {"name": "Eggs", "quantity": 12, "unit": "pcs"},
+]
+
+
+@pytest.mark.parametrize("ingredient, expected", [
+    ("Butter", None),
+    ("Pepper", None),
+    ("Oil", "Olive Oil"),
+    ("Boneless Chicken Breast", "Chicken Breast"),
+    ("Rice", "Basmati Rice"),
+    ("Noodles", "Rice Noodles"),
+    ("Bell Pepper", "Red Bell Pepper"),
+    ("Egg", "Eggs"),
+])
+def test_token_match_needs_the_same_food(ingredient, expected):
+    matcher = InventoryMatcher([dict(item) for item in PANTRY], MASTER_INDEX)
+    pos = matcher.match(ingredient)
+    assert (PANTRY[pos]["name"] if pos is not None else None) == expected
+
+
+def test_fewest_extra_words_wins():
+    pantry = [{"name": "Extra Virgin Olive Oil", "quantity": 1, "unit": "l"}, {"name": "Olive Oil", "quantity": 1, "unit": "l"}]
+    assert InventoryMatcher(pantry, MASTER_INDEX).match("Oil") == 1
+
+
+def test_count_units_use_the_master_weights():
+    inventory = [dict(item) for item in PANTRY]
+    result = apply_recipes(inventory, [{"ingredients": [
+        {"name": "Basmati Rice", "amountValue": 500, "unit": "g"},
+        {"name": "Eggs", "amountValue": 100, "unit": "g"},
+        {"name": "Red Bell Pepper", "amountValue": 2},
+    ]}], MASTER_INDEX)
+    left = {item["name"]: item["quantity"] for item in result["updatedInventory"]}
+    # 1kg bags, 50g eggs, and a bare '2' counts peppers (their typical unit)
+    assert left["Basmati Rice"] == 1.5
+    assert left["Eggs"] == 10
+    assert left["Red Bell Pepper"] == 1
@@ -0,0 +1,33 @@
+import pytest
+
+from inventory_store import InvalidVersion, InventoryConflict, InventoryStore, parse_version, store_from_env
+
+
+@pytest.mark.parametrize("value, expected", [
+    ('3', 3), ('"3"', 3), ('W/"3"', 3), (' 7 ', 7), (4, 4), (None, None), ('', None), ('*', None),
+])
+def test_parse_version(value, expected):
+    assert parse_version(value) == expected
+
+
+@pytest.mark.parametrize("value", ['"abc123"', 'W/"v2"', '-1', '1.5', True, [3]])
+def test_parse_version_rejects_non_versions(value):
+    with pytest.raises(InvalidVersion, match="must be an inventory version number"):
+        parse_version(value)
+    # Routes that only catch ValueError still answer 400
+    assert issubclass(InvalidVersion, ValueError)
+
+
+def test_store_defaults_outside_the_source_tree(tmp_path, monkeypatch):
+    monkeypatch.delenv("MANNA_INVENTORY_DB", raising=False)
+    monkeypatch.setenv("XDG_DATA_HOME", str(tmp_path))
+    store = store_from_env()
+    assert store.db_path == str(tmp_path / "manna" / "manna_inventory.db")
+    assert (tmp_path / "manna" / "manna_inventory.db").exists()
+
+
+def test_stale_version_conflicts(tmp_path):
+    store = InventoryStore(str(tmp_path / "inventory.db"))
+    version, _ = store.replace("u1", [{"name": "Eggs", "quantity": 6, "unit": "pcs"}])
+    with pytest.raises(InventoryConflict):
+        store.apply("u1", [{"op": "remove", "name": "Eggs"}], expected_version=version - 1)
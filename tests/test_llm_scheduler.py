@@ -0,0 +1,55 @@
+import asyncio
+
+from llm_scheduler import LLMScheduler
+
+
+class SlowModel:
+    """Answers every prompt after `delay` seconds and counts the calls it served."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return f"answer to {prompt}"
+
+
+def test_follower_survives_cancelled_leader():
+    model = SlowModel(0.2)
+    scheduler = LLMScheduler(lambda: model, max_retries=0)
+
+    async def scenario():
+        leader = asyncio.create_task(scheduler.generate_async("same prompt"))
+        await asyncio.sleep(0.05)
+        follower = asyncio.create_task(scheduler.generate_async("same prompt"))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        answer = await asyncio.wait_for(follower, timeout=3)
+        assert leader.cancelled()
+        return answer
+
+    assert asyncio.run(scenario()) == "answer to same prompt"
+    assert scheduler.counters["coalesced"] == 1
+    # The follower re-ran the call itself once the leader was gone
+    assert model.calls == 2
+    assert scheduler.stats()["inFlight"] == 0
+
+
+def test_cancelled_follower_leaves_leader_running():
+    model = SlowModel(0.1)
+    scheduler = LLMScheduler(lambda: model, max_retries=0)
+
+    async def scenario():
+        leader = asyncio.create_task(scheduler.generate_async("same prompt"))
+        await asyncio.sleep(0.02)
+        follower = asyncio.create_task(scheduler.generate_async("same prompt"))
+        await asyncio.sleep(0.02)
+        follower.cancel()
+        answer = await asyncio.wait_for(leader, timeout=3)
+        assert follower.cancelled()
+        return answer
+
+    assert asyncio.run(scenario()) == "answer to same prompt"
+    assert model.calls == 1
@@ -0,0 +1,41 @@
+import os
+import tempfile
+
+import pytest
+
+# The backend picks its model and inventory store at import time
+os.environ.setdefault("MANNA_FAKE_MODEL_LATENCY", "0")
+os.environ.setdefault("MANNA_REQUEST_LOG", "0")
+os.environ.setdefault("MANNA_INVENTORY_DB", os.path.join(tempfile.mkdtemp(), "inventory.db"))
+
+import backend_real_api as api  # noqa: E402
+import meal_plan  # noqa: E402
+from fake_model import FakeModel  # noqa: E402
+
+BODY = {
+    "inventory": [{"name": "Eggs", "quantity": 12, "unit": "pcs", "daysLeft": 20},
+                  {"name": "Spinach", "quantity": 200, "unit": "g", "daysLeft": 2}],
+    "userProfile": {"daysRemaining": 7},
+}
+
+
+def test_fake_model_plans_every_window():
+    jobs = api.build_plan_prompts(BODY)
+    assert [job[:2] for job in jobs] == [(1, 3), (4, 6), (7, 7)]
+    model = FakeModel()
+    texts = [model.generate_content(prompt).text for _, _, prompt in jobs]
+    windows = api.parse_plan_windows(jobs, texts)
+    plan = api.assemble_plan("plan-1", BODY, jobs, windows)
+    assert [day["day"] for day in plan["days"]] == list(range(1, 8))
+    assert all(set(day["meals"]) == set(meal_plan.MEALS) for day in plan["days"])
+    assert meal_plan.page(plan, 5)["day"]["day"] == 5
+
+
+def test_missing_window_is_never_served():
+    jobs = api.build_plan_prompts(BODY)
+    texts = [FakeModel().generate_content(prompt).text for _, _, prompt in jobs]
+    texts[1] = "Sorry, I can't help with that."
+    windows = api.parse_plan_windows(jobs, texts)
+    assert api.windows_to_retry(jobs, windows) == [1]
+    with pytest.raises(meal_plan.IncompletePlan, match="days 4-6"):
+        api.assemble_plan("plan-1", BODY, jobs, windows)
@@ -0,0 +1,26 @@
+import json
+import os
+
+import pytest
+
+from ingredient_index import IngredientIndex
+from nutrition import NutritionTable
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+with open(os.path.join(ROOT, 'ingredients_master.json'), 'r') as f:
+    MASTER_INDEX = IngredientIndex(tuple(json.load(f)))
+
+TABLE = NutritionTable(MASTER_INDEX)
+
+
+def kcal(ingredient):
+    calories, _, coverage, _ = TABLE.score([{"ingredients": [ingredient]}])
+    assert coverage[0] == 1
+    return calories[0]
+
+
+def test_missing_unit_is_the_entrys_typical_unit():
+    assert kcal({"name": "Eggs", "amountValue": 2}) == pytest.approx(kcal({"name": "Eggs", "amountValue": 2, "unit": "pcs"}))
+    assert kcal({"name": "Eggs", "amountValue": 2}) > 10 * kcal({"name": "Eggs", "amountValue": 2, "unit": "g"})
+    assert kcal({"name": "Basmati Rice", "amountValue": 100}) == pytest.approx(kcal({"name": "Basmati Rice", "amountValue": 100, "unit": "g"}))
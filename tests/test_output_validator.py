@@ -0,0 +1,42 @@
+import json
+import os
+
+from ingredient_index import IngredientIndex
+from output_validator import ShopValidator, emojis_in
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+with open(os.path.join(ROOT, 'ingredients_master.json'), 'r') as f:
+    MASTER_INDEX = IngredientIndex(tuple(json.load(f)))
+
+
+def amounts(items, profile=None, days=7):
+    check = ShopValidator(MASTER_INDEX, profile or {}, days).check(items)
+    return {item["name"].rsplit(" ", 1)[0]: item["amount"] for item in check.value}
+
+
+def test_valid_metric_and_count_amounts_are_kept():
+    got = amounts([
+        {"name": "Spinach 🥬", "amount": "200g"},
+        {"name": "Basmati Rice", "amount": "500 g"},
+        {"name": "Milk", "amount": "1.5 L"},
+        {"name": "Eggs", "amount": "6 Large Eggs"},
+        {"name": "Avocado", "amount": "3"},
+    ])
+    assert got == {"Spinach": "200g", "Basmati Rice": "500g", "Milk": "1.5L",
+                   "Eggs": "6 Large Eggs", "Avocado": "3 pcs"}
+
+
+def test_invalid_amounts_are_rounded_to_metric_sizes():
+    got = amounts([
+        {"name": "Spinach", "amount": "2 bags"},
+        {"name": "Apples", "amount": "1.5 pcs"},
+        {"name": "Basmati Rice", "amount": "3kg"},
+    ])
+    assert got == {"Spinach": "400g", "Apples": "250g", "Basmati Rice": "500g"}
+
+
+def test_emoji_extraction_skips_punctuation():
+    assert emojis_in("Chef’s “best” – Spinach") == ""
+    assert emojis_in("Spinach 🥬") == "🥬"
+    assert emojis_in("Tofu 👨‍🍳") == "👨‍🍳"
@@ -0,0 +1,23 @@
+import pytest
+
+from ration_planner import MAX_HORIZON_DAYS, horizon_days, plan_rations
+
+INVENTORY = [
+    {"name": "Spinach", "quantity": 200, "unit": "g", "daysLeft": 2},
+    {"name": "Rice", "quantity": 1000, "unit": "g", "daysLeft": 365},
+]
+
+
+@pytest.mark.parametrize("value, expected", [
+    (5, 5), ("3", 3), (0, 1), (-4, 1), (None, 7), ("soon", 7), (float("nan"), 7),
+    (200000, MAX_HORIZON_DAYS), (float("inf"), MAX_HORIZON_DAYS),
+])
+def test_horizon_days(value, expected):
+    assert horizon_days(value) == expected
+
+
+def test_huge_days_remaining_is_capped():
+    plan = plan_rations(INVENTORY, 2000000, None)
+    assert plan["days"] == MAX_HORIZON_DAYS
+    assert all(len(item["schedule"]) == MAX_HORIZON_DAYS for item in plan["items"])
+    assert plan["mustUse"] == ["Spinach"]
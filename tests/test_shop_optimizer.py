@@ -0,0 +1,71 @@
+import json
+import os
+import re
+
+import pytest
+
+from ingredient_index import IngredientIndex, contains_gluten, diet_known
+from shop_optimizer import TARGET_TOLERANCE, ShoppingListSolver, emoji_for, solve_shopping_list
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+with open(os.path.join(ROOT, 'ingredients_master.json'), 'r') as f:
+    MASTER_INDEX = IngredientIndex(tuple(json.load(f)))
+
+# (profile, days, daily kcal, daily protein g, period carbs g), as shop_targets computes them
+CASES = {
+    "default week": ({}, 7, 2327, 112, 1833),
+    "vegan athlete": ({"diet": "Vegan", "goal": "Build Muscle", "activityLevel": "athlete"}, 7, 3858, 176, 3038),
+    "vegetarian cut": ({"diet": "Vegetarian", "goal": "Weight Loss"}, 3, 1827, 140, 617),
+    "two weeks": ({}, 14, 2327, 112, 3665),
+    "gluten free": ({"diet": "Gluten Free"}, 7, 2327, 112, 1833),
+}
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_targets_met_within_tolerance(case):
+    profile, days, kcal, protein, carbs = CASES[case]
+    _, summary = solve_shopping_list(MASTER_INDEX, profile, days, kcal, protein, carbs)
+    assert summary["withinTolerance"]
+    assert abs(summary["gap"]["calories"]) <= TARGET_TOLERANCE * kcal * days
+    assert abs(summary["gap"]["protein"]) <= TARGET_TOLERANCE * protein * days
+
+
+def test_unreachable_target_reports_gap():
+    _, summary = solve_shopping_list(MASTER_INDEX, {"diet": "Vegan"}, 7, 2000, 900, 1800)
+    assert not summary["withinTolerance"]
+    assert summary["gap"]["protein"] > 0
+
+
+def test_substitutes_are_never_both_picked():
+    solver = ShoppingListSolver(MASTER_INDEX, {}, 14, 2327, 112, 3665)
+    picks = solver.solve()
+    for name in picks:
+        assert solver.substitute.get(name) not in picks
+
+
+def test_amounts_are_metric():
+    items, _ = solve_shopping_list(MASTER_INDEX, {}, 14, 2327, 112, 3665)
+    for item in items:
+        assert re.fullmatch(r"\d+(\.\d+)?(g|kg|ml|L)|\d+ eggs", item["amount"]), item
+
+
+def test_emoji_is_keyed_by_item():
+    find = lambda name: MASTER_INDEX.entries[MASTER_INDEX.find(name)]
+    assert emoji_for(find("Avocado")) == "🥑"
+    assert emoji_for(find("Cucumber")) == "🥒"
+    assert emoji_for(find("Cherry Tomatoes")) == "🍅"
+
+
+def test_gluten_free_list_has_no_gluten():
+    solver = ShoppingListSolver(MASTER_INDEX, {"diet": "Gluten Free"}, 7, 2327, 112, 1833)
+    picks = solver.solve()
+    assert picks
+    entries = [MASTER_INDEX.entries[MASTER_INDEX.find(name)] for name in picks]
+    assert not [entry["name"] for entry in entries if contains_gluten(entry)]
+    assert all(not contains_gluten(entry) for entry in solver.pool)
+
+
+def test_unknown_diets_are_not_solved_locally():
+    assert diet_known("Gluten Free") and diet_known("Vegan, gluten-free") and diet_known(None)
+    assert not diet_known("Keto")
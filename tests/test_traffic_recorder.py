@@ -0,0 +1,28 @@
+import json
+
+from traffic_recorder import anonymize, pseudonym
+
+
+def test_single_request_is_anonymized():
+    body, secrets = anonymize({"userId": "alice@x.com", "userProfile": {"name": "Alice Smith", "weight": 63}}, "s")
+    assert body == {"userId": pseudonym("alice@x.com", "s"), "userProfile": {"weight": 65}}
+    assert secrets == ["Alice Smith"]
+
+
+def test_batch_members_and_profiles_are_anonymized():
+    request = {
+        "kind": "recipes",
+        "userId": "household-1",
+        "members": [{"userId": "alice@x.com",
+                     "userProfile": {"name": "Alice Smith", "email": "alice@x.com", "age": 21, "diet": "Vegan"}}],
+        "userProfiles": [{"name": "Bob Jones", "email": "bob@y.org", "height": 181}],
+    }
+    body, secrets = anonymize(request, "s")
+    text = json.dumps(body)
+    for person in ("alice@x.com", "Alice Smith", "Bob Jones", "bob@y.org", "household-1"):
+        assert person not in text
+    assert body["members"][0] == {"userId": pseudonym("alice@x.com", "s"), "userProfile": {"age": 20, "diet": "Vegan"}}
+    assert body["userProfiles"] == [{"height": 180}]
+    assert sorted(secrets) == sorted(["Alice Smith", "alice@x.com", "Bob Jones", "bob@y.org"])
+    # The caller's body is left alone
+    assert request["members"][0]["userProfile"]["name"] == "Alice Smith"
@@ -0,0 +1,454 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import contextvars
+
+from llm_scheduler import prompt_parts
+from telemetry import current_trace
+
+# --- 1. ANONYMIZATION ---
+# Profile fields that identify a person; the body metrics are kept but rounded
+PROFILE_DROP = {"name", "email", "phone", "address", "firstName", "lastName", "username"}
+PROFILE_ROUND = {"age": 5, "weight": 5, "height": 5}
+# Headers worth replaying; everything else (cookies, auth, client IPs) is never written
+REPLAY_HEADERS = ("content-type", "if-match")
+
+def pseudonym(value, salt):
+    """Stable per-cassette stand-in for a user id, so a user's store traffic still lines up on replay."""
+    return "u-" + hashlib.sha256(f"{salt}:{value}".encode("utf-8")).hexdigest()[:12]
+
+def anonymize(body, salt):
+    """
+    A copy of a JSON request body that is safe to keep: user ids pseudonymized, profile
+    names and contact fields dropped, age/weight/height rounded. Returns (body, secrets)
+    where secrets are the strings to scrub from the model's answers for this request.
+    /api/batch bodies get the same treatment for every 'members' and 'userProfiles' entry.
+    """
+    if not isinstance(body, dict):
+        return body, []
+    secrets = []
+    body = _anonymize_member(body, salt, secrets)
+    if isinstance(body.get('members'), list):
+        body['members'] = [_anonymize_member(member, salt, secrets) if isinstance(member, dict) else member
+                           for member in body['members']]
+    if isinstance(body.get('userProfiles'), list):
+        body['userProfiles'] = [_anonymize_profile(profile, secrets) if isinstance(profile, dict) else profile
+                                for profile in body['userProfiles']]
+    return body, secrets
+
+def _anonymize_member(body, salt, secrets):
+    """A copy of one person's request fields: userId and userProfile."""
+    body = dict(body)
+    if body.get('userId') is not None:
+        body['userId'] = pseudonym(body['userId'], salt)
+    if isinstance(body.get('userProfile'), dict):
+        body['userProfile'] = _anonymize_profile(body['userProfile'], secrets)
+    return body
+
+def _anonymize_profile(profile, secrets):
+    profile = dict(profile)
+    for key in PROFILE_DROP & profile.keys():
+        value = profile.pop(key)
+        if isinstance(value, str) and len(value.strip()) > 1:
+            secrets.append(value.strip())
+    for key, step in PROFILE_ROUND.items():
+        try:
+            profile[key] = int(round(float(profile[key]) / step) * step)
+        except (KeyError, TypeError, ValueError):
+            pass
+    return profile
+
+def scrub(text, secrets):
+    for secret in secrets:
+        text = text.replace(secret, "User")
+    return text
+
+# --- 2. PROMPT IDENTITY ---
+def prompt_key(prompt):
+    """Same prompt (text and images) -> same key; how a replayed call finds its recorded answer."""
+    digest = hashlib.sha256()
+    for part in prompt_parts(prompt):
+        data = part.get("data", b"") if isinstance(part, dict) else part
+        digest.update(data if isinstance(data, bytes) else str(data).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def prompt_kind(prompt):
+    """
+    The prompt's 'Role:' line (or first line), e.g. 'Manna AI Strategic Procurement Agent.'.
+    Replay falls back to an answer of the same kind when a code change altered the prompt text.
+    """
+    text = next((part for part in prompt_parts(prompt) if isinstance(part, str)), "")
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    role = next((line for line in lines if line.startswith("Role:")), lines[0] if lines else "")
+    return role.removeprefix("Role:").strip()[:80]
+
+def prompt_bytes(prompt):
+    return sum(len(part.encode("utf-8")) if isinstance(part, str) else len(part.get("data", b""))
+               for part in prompt_parts(prompt))
+
+def _usage(response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None
+    counts = {kind: getattr(usage, attr, None) for kind, attr in (
+        ("prompt", "prompt_token_count"), ("output", "candidates_token_count"), ("total", "total_token_count"))}
+    return {kind: count for kind, count in counts.items() if isinstance(count, int)} or None
+
+# --- 3. THE RECORDER ---
+_current = contextvars.ContextVar("manna_recording", default=None)
+
+class RequestRecord:
+    def __init__(self, recorder, request_id, method, path, headers, body, secrets, skipped):
+        self.recorder = recorder
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+        self.secrets = secrets
+        self.skipped = skipped
+        self.started = time.perf_counter()
+        self.at = time.monotonic() - recorder.started
+        self.model_calls = 0
+
+    def finish(self, route, status, path_params=None):
+        path = self.path
+        for name, value in (path_params or {}).items():
+            if 'user' in name.lower():
+                path = path.replace(str(value), pseudonym(value, self.recorder.salt))
+        self.recorder.write({
+            "type": "request",
+            "id": self.request_id,
+            "t": round(self.at, 3),
+            "method": self.method,
+            "path": path,
+            "route": route,
+            "headers": self.headers,
+            "body": self.body,
+            "skipped": self.skipped,
+            "status": status,
+            "ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "modelCalls": self.model_calls,
+        })
+
+class Recorder:
+    """
+    Opt-in traffic recorder (MANNA_RECORD_CASSETTE=path.jsonl). Every sampled request is
+    appended as one anonymized 'request' line and every model call as one 'model' line
+    (prompt key and kind, answer text, latency, stream timing, token usage), so a load
+    test can replay real traffic against a stub model without spending quota.
+    Prompts themselves are never written, only their hash and size.
+    """
+
+    def __init__(self, path, sample=1.0, salt=None):
+        self.path = path
+        self.sample = sample
+        self.salt = salt or os.urandom(8).hex()
+        self.started = time.monotonic()
+        self._fd = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def write(self, entry):
+        line = (json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            # One O_APPEND write per line keeps lines whole across gunicorn workers; reopen after a fork
+            if self._fd is None or self._pid != os.getpid():
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+                self._pid = os.getpid()
+            os.write(self._fd, line)
+
+    def begin(self, request_id, method, path, headers, body_bytes):
+        """
+        Starts a request record (or None when not sampled) and makes it current for model
+        calls. `body_bytes` is the raw JSON body; other bodies are never read, only noted.
+        """
+        if self.sample < 1.0 and random.random() >= self.sample:
+            _current.set(None)
+            return None
+        body, secrets, skipped = None, [], None
+        if body_bytes:
+            try:
+                parsed = json.loads(body_bytes)
+            except ValueError:
+                skipped = "invalid json"
+            else:
+                if isinstance(parsed, dict) and parsed.get('images'):
+                    skipped = "photos"
+                else:
+                    body, secrets = anonymize(parsed, self.salt)
+        elif headers.get("content-length", "0") not in ("", "0") or "chunked" in headers.get("transfer-encoding", ""):
+            skipped = "non-json body"
+        headers = {name: value for name, value in headers.items() if name in REPLAY_HEADERS}
+        record = RequestRecord(self, request_id, method, path, headers, body, secrets, skipped)
+        _current.set(record)
+        return record
+
+    def model_call(self, record, prompt, started, text=None, response=None, first_chunk=None, chunks=None, error=None):
+        if record is None and self.sample < 1.0:
+            return
+        if record is not None:
+            record.model_calls += 1
+        now = time.perf_counter()
+        self.write({
+            "type": "model",
+            "id": record.request_id if record is not None else None,
+            "key": prompt_key(prompt),
+            "kind": prompt_kind(prompt),
+            "promptBytes": prompt_bytes(prompt),
+            "stream": chunks is not None,
+            "text": scrub(text, record.secrets) if text is not None and record is not None else text,
+            "ms": round((now - started) * 1000, 1),
+            "firstChunkMs": round((first_chunk - started) * 1000, 1) if first_chunk is not None else None,
+            "chunks": chunks,
+            "usage": _usage(response),
+            "error": [type(error).__name__, str(error)[:200]] if error is not None else None,
+        })
+
+    def wrap(self, model):
+        return RecordingModel(model, self)
+
+class RecordingModel:
+    """Wraps the model client: passes every call through and records its answer and timing."""
+
+    def __init__(self, inner, recorder):
+        self.inner = inner
+        self.recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        record, started = _current.get(), time.perf_counter()
+        try:
+            response = self.inner.generate_content(prompt, stream=stream, **kwargs)
+            if stream:
+                return self._stream(response, record, prompt, started)
+            text = response.text
+        except Exception as e:
+            self.recorder.model_call(record, prompt, started, error=e)
+            raise
+        self.recorder.model_call(record, prompt, started, text=text, response=response)
+        return response
+
+    def _stream(self, chunks, record, prompt, started):
+        texts, first, last = [], None, None
+        try:
+            for chunk in chunks:
+                first = first or time.perf_counter()
+                texts.append(chunk.text)
+                last = chunk
+                yield chunk
+        except Exception as e:
+            self.recorder.model_call(record, prompt, started, error=e)
+            raise
+        self.recorder.model_call(record, prompt, started, text="".join(texts), response=last,
+                                 first_chunk=first, chunks=len(texts))
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        record, started = _current.get(), time.perf_counter()
+        try:
+            response = await self.inner.generate_content_async(prompt, stream=stream, **kwargs)
+            if stream:
+                return self._stream_async(response, record, prompt, started)
+            text = response.text
+        except Exception as e:
+            self.recorder.model_call(record, prompt, started, error=e)
+            raise
+        self.recorder.model_call(record, prompt, started, text=text, response=response)
+        return response
+
+    async def _stream_async(self, chunks, record, prompt, started):
+        texts, first, last = [], None, None
+        try:
+            async for chunk in chunks:
+                first = first or time.perf_counter()
+                texts.append(chunk.text)
+                last = chunk
+                yield chunk
+        except Exception as e:
+            self.recorder.model_call(record, prompt, started, error=e)
+            raise
+        self.recorder.model_call(record, prompt, started, text="".join(texts), response=last,
+                                 first_chunk=first, chunks=len(texts))
+
+class RecorderMiddleware:
+    """
+    ASGI side of the recorder. JSON bodies are read up front (they are small) and handed
+    to the app unchanged; multipart uploads stream straight through and are not kept.
+    """
+
+    def __init__(self, app, recorder):
+        self.app = app
+        self.recorder = recorder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers") or []}
+        content_type = headers.get("content-type", "")
+        body = b""
+        if content_type.startswith("application/json"):
+            chunks, more = [], True
+            while more:
+                message = await receive()
+                chunks.append(message.get("body", b""))
+                more = message.get("more_body", False)
+            body = b"".join(chunks)
+            upstream, delivered = receive, False
+
+            async def receive():
+                nonlocal delivered
+                if not delivered:
+                    delivered = True
+                    return {"type": "http.request", "body": body, "more_body": False}
+                return await upstream()
+
+        trace = current_trace()
+        record = self.recorder.begin(trace.request_id if trace else None, scope.get("method", "GET"),
+                                     scope.get("path", ""), headers, body)
+        state = {"status": 500}
+
+        async def recorded_send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, recorded_send)
+        finally:
+            if record is not None:
+                record.finish(getattr(scope.get("route"), "path", "unmatched"), state["status"], scope.get("path_params"))
+
+def recorder_from_env():
+    """
+    MANNA_RECORD_CASSETTE turns recording on; MANNA_RECORD_SAMPLE (0-1) keeps a share of requests.
+    Set MANNA_RECORD_SALT when workers import the app themselves (MANNA_PRELOAD=0), otherwise
+    each worker pseudonymizes the same user differently.
+    """
+    path = os.environ.get("MANNA_RECORD_CASSETTE")
+    if not path:
+        return None
+    return Recorder(path, sample=float(os.environ.get("MANNA_RECORD_SAMPLE", 1.0)),
+                    salt=os.environ.get("MANNA_RECORD_SALT"))
+
+# --- 4. REPLAY ---
+def read_cassette(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class ReplayedError(Exception):
+    """Base for errors re-raised from a cassette under their recorded class name."""
+
+class ReplayResponse:
+    def __init__(self, text, usage=None):
+        self.text = text
+        usage = usage or {}
+        self.usage_metadata = type("Usage", (), {
+            "prompt_token_count": usage.get("prompt"),
+            "candidates_token_count": usage.get("output"),
+            "total_token_count": usage.get("total"),
+        })()
+
+class ReplayModel:
+    """
+    Stand-in for genai.GenerativeModel that serves recorded answers with their recorded
+    latency (divided by `speed`). Calls are matched by prompt key; when the prompt differs
+    (anonymized profiles round the body metrics, code changes alter the wording), an answer
+    recorded for the same prompt kind, preferably with the same streaming mode, is used
+    instead. Answers are handed out in recorded order, so a replay is deterministic.
+    """
+
+    def __init__(self, entries, speed=1.0):
+        self.speed = speed or 1.0
+        self.by_key, self.by_kind = {}, {}
+        for entry in entries:
+            if entry.get("type") != "model":
+                continue
+            self.by_key.setdefault(entry["key"], []).append(entry)
+            self.by_kind.setdefault((entry["kind"], entry.get("stream", False)), []).append(entry)
+            self.by_kind.setdefault(entry["kind"], []).append(entry)
+        self.turns = {}
+        self.counters = {"calls": 0, "exact": 0, "byKind": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path, speed=1.0):
+        return cls(read_cassette(path), speed)
+
+    def _entry(self, prompt, stream):
+        key = prompt_key(prompt)
+        with self._lock:
+            self.counters["calls"] += 1
+            pool, slot = self.by_key.get(key), key
+            if pool:
+                self.counters["exact"] += 1
+            else:
+                kind = prompt_kind(prompt)
+                slot = (kind, stream) if (kind, stream) in self.by_kind else kind
+                pool = self.by_kind.get(slot)
+                if not pool:
+                    self.counters["misses"] += 1
+                    raise LookupError(f"No recorded answer for a '{kind}' prompt")
+                self.counters["byKind"] += 1
+            turn = self.turns.get(slot, 0)
+            self.turns[slot] = turn + 1
+            return pool[turn % len(pool)]
+
+    def _delay(self, entry, key="ms"):
+        return (entry.get(key) or 0) / 1000.0 / self.speed
+
+    @staticmethod
+    def _error(entry):
+        name, message = entry["error"]
+        return type(name, (ReplayedError,), {})(message)
+
+    def _pieces(self, entry):
+        text = entry.get("text") or ""
+        count = max(1, entry.get("chunks") or 1)
+        size = max(1, -(-len(text) // count))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        # An answer recorded whole arrives whole, after its full latency
+        first = self._delay(entry, "firstChunkMs" if entry.get("firstChunkMs") is not None else "ms")
+        rest = max(0.0, self._delay(entry) - first) / max(1, len(pieces) - 1)
+        return [(piece, first if i == 0 else rest) for i, piece in enumerate(pieces)]
+
+    def _stream(self, entry):
+        for piece, delay in self._pieces(entry):
+            time.sleep(delay)
+            yield ReplayResponse(piece, entry.get("usage"))
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        entry = self._entry(prompt, stream)
+        if entry.get("error"):
+            time.sleep(self._delay(entry))
+            raise self._error(entry)
+        if stream:
+            return self._stream(entry)
+        time.sleep(self._delay(entry))
+        return ReplayResponse(entry.get("text") or "", entry.get("usage"))
+
+    async def _stream_async(self, entry):
+        for piece, delay in self._pieces(entry):
+            await asyncio.sleep(delay)
+            yield ReplayResponse(piece, entry.get("usage"))
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        entry = self._entry(prompt, stream)
+        if entry.get("error"):
+            await asyncio.sleep(self._delay(entry))
+            raise self._error(entry)
+        if stream:
+            return self._stream_async(entry)
+        await asyncio.sleep(self._delay(entry))
+        return ReplayResponse(entry.get("text") or "", entry.get("usage"))
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters)
@@ -0,0 +1,63 @@
+from ingredient_index import normalize_name
+
+# --- 1. UNIT ALIASES ---
+UNIT_ALIASES = {
+    "g": "g", "gram": "g", "grams": "g", "gr": "g",
+    "kg": "kg", "kilo": "kg", "kilogram": "kg", "kilograms": "kg",
+    "mg": "mg",
+    "ml": "ml", "milliliter": "ml", "millilitre": "ml", "milliliters": "ml",
+    "l": "l", "liter": "l", "litre": "l", "liters": "l", "litres": "l",
+    "tbsp": "tbsp", "tablespoon": "tbsp", "tablespoons": "tbsp",
+    "tsp": "tsp", "teaspoon": "tsp", "teaspoons": "tsp",
+    "cup": "cup", "cups": "cup",
+    "pcs": "pcs", "pc": "pcs", "piece": "pcs", "pieces": "pcs", "x": "pcs", "unit": "pcs", "units": "pcs",
+    "clove": "pcs", "cloves": "pcs", "can": "pcs", "cans": "pcs", "slice": "pcs", "slices": "pcs",
+    "bag": "bag", "bags": "bag",
+    "tub": "tub", "tubs": "tub",
+}
+
+# Everything measurable is converted through grams (water density for volumes).
+GRAMS_PER_UNIT = {
+    "g": 1.0, "kg": 1000.0, "mg": 0.001,
+    "ml": 1.0, "l": 1000.0, "tbsp": 15.0, "tsp": 5.0, "cup": 240.0,
+}
+
+# Count-style units: how much one weighs comes from the master entry sold in that unit ('unit_grams')
+COUNT_UNITS = ("pcs", "bag", "tub")
+# An amount with no unit below this is counted in the entry's typical_unit ('2' eggs); from it on, grams ('200' rice)
+BARE_GRAMS_FROM = 50
+
+def bare_unit(value, entry=None):
+    """The unit a number written without one is read in."""
+    return "g" if value >= BARE_GRAMS_FROM or entry is None else entry.get("typical_unit", "g")
+
+def normalize_unit(unit):
+    key = normalize_name(unit).replace(" ", "")
+    return UNIT_ALIASES.get(key, UNIT_ALIASES.get(key.rstrip("s"), key))
+
+def grams_per(unit, entry=None):
+    """
+    How many grams one `unit` is. Count units are only known for a master entry sold
+    in that very unit (its 'typical_unit' and 'unit_grams'); otherwise None.
+    """
+    unit = normalize_unit(unit)
+    if unit in GRAMS_PER_UNIT:
+        return GRAMS_PER_UNIT[unit]
+    if unit in COUNT_UNITS and entry is not None and normalize_unit(entry.get("typical_unit")) == unit:
+        unit_grams = entry.get("unit_grams")
+        return float(unit_grams) if unit_grams else None
+    return None
+
+def convert(amount, from_unit, to_unit, entry=None):
+    """
+    Converts `amount` between units ('150 g' -> '0.15 kg', '2 pcs' eggs -> '100 g').
+    Returns None when the units can't be related (unknown unit, or a count unit
+    the master entry isn't sold in).
+    """
+    src, dst = normalize_unit(from_unit), normalize_unit(to_unit)
+    if not src or not dst or src == dst:
+        return float(amount)
+    src_grams, dst_grams = grams_per(src, entry), grams_per(dst, entry)
+    if src_grams is None or dst_grams is None:
+        return None
+    return float(amount) * src_grams / dst_grams